@@ -0,0 +1,77 @@
+"""
+Compare the SQLite and DuckDB/Parquet query backends on the reference questions.
+
+    python -m benchmarks.backend_benchmark --db olist.sqlite [--repeat 5] [--backends sqlite,duckdb]
+
+Each (backend, question) pair runs in a fresh process, so the memory column
+is the peak resident-set growth caused by that query alone (measured with
+getrusage after the backend is set up). Latency is the median of --repeat
+runs. Answers from the two backends are compared on the first cell.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(args):
+    backend_name, db_path, sql, repeat = args
+    from src.utils.query_backends import get_backend
+
+    backend = get_backend(backend_name, db_path)
+    baseline = _peak_rss_mb()
+    timings, first = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = backend.execute(sql)
+        timings.append(time.perf_counter() - started)
+        first = result.iloc[0, 0] if not result.empty else None
+    return statistics.median(timings) * 1000, _peak_rss_mb() - baseline, first
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backends", default="sqlite,duckdb")
+    args = parser.parse_args()
+
+    from src.utils.query_backends import export_to_parquet
+    from src.utils.reference_queries import load_reference_cases
+
+    backends = args.backends.split(",")
+    if "duckdb" in backends:
+        started = time.perf_counter()
+        export_to_parquet(args.db)
+        print(f"Parquet export ready in {time.perf_counter() - started:.2f}s (reused when already present)\n")
+
+    cases = load_reference_cases()
+    jobs = [(name, args.db, case.sql, args.repeat) for case in cases for name in backends]
+    # One process per job so peak RSS is not polluted by earlier queries
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        results = dict(zip([(job[2], job[0]) for job in jobs], pool.map(run_case, jobs)))
+
+    header = "".join(f" {name + ' ms':>11} {name + ' MB':>11}" for name in backends)
+    print(f"{'#':>2}{header}  same  question")
+    totals = {name: 0.0 for name in backends}
+    for i, case in enumerate(cases, 1):
+        row = [results[(case.sql, name)] for name in backends]
+        for name, (ms, _, _) in zip(backends, row):
+            totals[name] += ms
+        same = len({str(first) for _, _, first in row}) == 1
+        cells = "".join(f" {ms:>11.2f} {mb:>11.1f}" for ms, mb, _ in row)
+        print(f"{i:>2}{cells}  {'yes' if same else 'NO':>4}  {case.plain_question}")
+    print("\nTotal latency: " + ", ".join(f"{name} {totals[name]:.1f} ms" for name in backends))
+
+
+if __name__ == "__main__":
+    main()
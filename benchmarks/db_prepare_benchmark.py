@@ -0,0 +1,65 @@
+"""
+Time the reference questions before and after database preparation.
+
+    python -m benchmarks.db_prepare_benchmark --db olist.sqlite [--repeat 5]
+
+Works on a temporary copy of the database: the copy is stripped of prepared
+objects, each validated query in correct_queries.txt is timed (median of
+--repeat runs on a fresh read-only connection), then the copy is prepared
+with src.utils.db_prepare and timed again. Results are compared so an index
+can never change an answer.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from src.utils.db_pool import DEFAULT_PRAGMAS
+
+
+def time_query(db_path: str, sql: str, repeat: int):
+    timings, rows = [], None
+    for _ in range(repeat):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        for name, value in DEFAULT_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        started = time.perf_counter()
+        rows = conn.execute(sql).fetchall()
+        timings.append(time.perf_counter() - started)
+        conn.close()
+    return statistics.median(timings) * 1000, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from src.utils.db_prepare import drop_prepared, prepare_database
+    from src.utils.reference_queries import load_reference_cases
+
+    cases = load_reference_cases()
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "olist.sqlite")
+        shutil.copyfile(args.db, copy)
+        drop_prepared(copy)
+        before = [time_query(copy, case.sql, args.repeat) for case in cases]
+        report = prepare_database(copy)
+        after = [time_query(copy, case.sql, args.repeat) for case in cases]
+
+    print(f"Prepared in {report.seconds}s ({len(report.built)} objects)\n")
+    print(f"{'#':>2} {'before ms':>10} {'after ms':>9} {'speedup':>8}  same  question")
+    for i, (case, (t0, rows0), (t1, rows1)) in enumerate(zip(cases, before, after), 1):
+        speedup = t0 / t1 if t1 else float("inf")
+        print(f"{i:>2} {t0:>10.2f} {t1:>9.2f} {speedup:>7.1f}x  {'yes' if rows0 == rows1 else 'NO':>4}  "
+              f"{case.plain_question}")
+    total0, total1 = sum(t for t, _ in before), sum(t for t, _ in after)
+    print(f"\nTotal: {total0:.1f} ms -> {total1:.1f} ms ({total0 / total1:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare the fixed few-shot examples with examples retrieved per question.
+
+    python -m benchmarks.few_shot_benchmark --db olist.sqlite [--k 3] [--embedding hashing] [--live]
+
+Every reference question is answered leave-one-out: its own validated SQL is
+never among the retrieved examples. Offline, the report shows the examples
+each question gets with their cosine scores, and the prompt size of both
+modes. --live also sends every question to the AZURE_OPENAI_* deployment in
+both modes and checks the generated SQL against the reference result.
+"""
+import argparse
+import os
+import statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--embedding", default=os.getenv("OLIST_EMBEDDING", "hashing"))
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+    os.environ["OLIST_EMBEDDING"] = args.embedding
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://offline.invalid")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.schema_prompt import count_tokens
+    from structuredOutput.fewShotLearning import get_example_store
+    from structuredOutput.SQLQueryGeneratorWithJsonSchema import SQLQueryGeneratorWithJsonSchema
+
+    cases = load_reference_cases()
+    store = get_example_store(args.embedding)
+    for case in cases:
+        print(f"{case.plain_question[:70]}")
+        for example, score in store.search(case.question, args.k):
+            print(f"    {score:.2f}  {example.question[:70]}")
+
+    generators = {mode: SQLQueryGeneratorWithJsonSchema(few_shot=mode, few_shot_k=args.k)
+                  for mode in ("static", "retrieved")}
+    print(f"\n{'examples':<10} {'prefix tok':>11} {'mean prompt tok':>16} {'mean examples':>14}")
+    for mode, generator in generators.items():
+        prompts = [generator.build_messages(case.question) for case in cases]
+        tokens = [sum(count_tokens(m["content"]) for m in messages) for messages in prompts]
+        shown = [sum(m["content"].count("```sql") for m in messages) for messages in prompts]
+        print(f"{mode:<10} {generator.prompt.prefix_tokens:>11} {statistics.mean(tokens):>16.0f} "
+              f"{statistics.mean(shown):>14.1f}")
+
+    if not args.live:
+        return
+
+    from src.utils.sql_equivalence import check_equivalence
+
+    print(f"\n{'examples':<10} {'correct':>8}")
+    for mode, generator in generators.items():
+        correct = 0
+        for case in cases:
+            _, sql = generator.generate_sql_query(case.question)
+            correct += check_equivalence(sql, case.sql).equivalent
+        print(f"{mode:<10} {correct:>4}/{len(cases):<3}")
+
+
+if __name__ == "__main__":
+    main()
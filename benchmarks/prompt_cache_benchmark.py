@@ -0,0 +1,73 @@
+"""
+Compare prompt layouts of llm_sql_pipeline for server-side prompt caching.
+
+    python -m benchmarks.prompt_cache_benchmark --db olist.sqlite [--live] [--rounds 2]
+
+"cached" sends instructions + full schema as a byte-stable prefix with only
+the linked table names and the question after it; "pruned" sends just the
+linked tables' schema with the question. Offline, every reference question
+is built in both layouts and the report shows how many prompt tokens a
+cache warmed by the earlier requests of the batch shares ("shared") and could
+serve under Azure's 1024-token / 128-token-block rule ("cacheable"), and what
+that means for billed input tokens (cached tokens at --cached-price of full
+price). With --live the batch is sent to the deployment --rounds times and
+usage.prompt_tokens_details.cached_tokens and latency are reported instead.
+"""
+import argparse
+import os
+import statistics
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--cached-price", type=float, default=0.5, help="price of a cached token vs a fresh one")
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--rounds", type=int, default=2)
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from entryAssignment import llm_sql_pipeline as pipeline
+    from src.utils.prompt_builder import cacheable_prefix_tokens, messages_hash, prompt_cache_stats
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.schema_prompt import count_tokens
+
+    questions = [case.plain_question for case in load_reference_cases()]
+    layouts = ("pruned", "cached")
+
+    print(f"{'layout':<8} {'prefixes':>9} {'prompt tok':>11} {'shared':>7} {'cacheable':>10} {'share':>7} "
+          f"{'billed tok':>11}")
+    for layout in layouts:
+        pipeline.prompt_layout = layout
+        batch = [pipeline.build_messages(q, pipeline.get_schema_hint(q)) for q in questions]
+        prefixes = {messages_hash(messages[:-1]) for messages in batch}
+        prompt_tokens = shared = cacheable = 0
+        for i, messages in enumerate(batch):
+            prompt_tokens += sum(count_tokens(m["content"]) for m in messages)
+            shared += max((cacheable_prefix_tokens(earlier, messages, 0) for earlier in batch[:i]), default=0)
+            cacheable += max((cacheable_prefix_tokens(earlier, messages) for earlier in batch[:i]), default=0)
+        billed = prompt_tokens - cacheable * (1 - args.cached_price)
+        print(f"{layout:<8} {len(prefixes):>9} {prompt_tokens:>11} {shared:>7} {cacheable:>10} "
+              f"{cacheable / prompt_tokens:>7.1%} {billed:>11.0f}")
+
+    if not args.live:
+        return
+
+    print(f"\n{'layout':<8} {'round':>5} {'p50 s':>7} {'mean s':>7} {'prompt tok':>11} {'cached tok':>11}")
+    for layout in layouts:
+        pipeline.prompt_layout = layout
+        for round_ in range(1, args.rounds + 1):
+            prompt_cache_stats.prefixes.clear()
+            latencies = []
+            for question in questions:
+                started = time.perf_counter()
+                pipeline.generate_sql_from_prompt(question, pipeline.get_schema_hint(question), stream=False)
+                latencies.append(time.perf_counter() - started)
+            totals = prompt_cache_stats.as_dict().values()
+            print(f"{layout:<8} {round_:>5} {statistics.median(latencies):>7.2f} {statistics.mean(latencies):>7.2f} "
+                  f"{sum(t['prompt_tokens'] for t in totals):>11} {sum(t['cached_tokens'] for t in totals):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure how often query expansion fires, what it costs and what it changes.
+
+    python -m benchmarks.query_expansion_benchmark --db olist.sqlite [--live]
+
+The question set is the reference questions plus paraphrases of them that
+name categories in English, misspell them or use state names instead of
+codes, each checked against the reference SQL of the question it rephrases.
+Offline, the report shows the index build time, the literals found per
+question, the fire rate and the expansion time. --live sends every question
+to the pipeline's deployment with and without expansion and compares how
+many generated queries return the reference result.
+"""
+import argparse
+import os
+import statistics
+import time
+
+# (question, index of the reference case whose SQL answers it)
+PARAPHRASES = [
+    ("What's the average review score for products in the health and beauty category? [float: score]", 1),
+    ("What's the average review score for helth & beauty products? [float: score]", 1),
+    ("Which seller has delivered the most orders to customers living in the city of Rio de Janeiro? "
+     "[string: seller_id]", 0),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--repeat", type=int, default=1000, help="expansions per question for the timing")
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from src.utils.reference_queries import load_reference_cases
+    from structuredOutput import queryExpansion
+
+    cases = load_reference_cases()
+    questions = [(case.question, case.sql) for case in cases]
+    questions += [(question, cases[i].sql) for question, i in PARAPHRASES if i < len(cases)]
+
+    started = time.perf_counter()
+    index = queryExpansion.get_expansion_index(args.db)
+    print(f"index built in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    timings, fired = [], 0
+    for question, _ in questions:
+        expansion = index.expand(question)
+        fired += expansion.fired
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            index.expand(question)
+        timings.append((time.perf_counter() - started) / args.repeat * 1e6)
+        print(f"{question[:72]:<72} {expansion.hint()[len('Database values: '):] or '-'}")
+    print(f"\nfired on {fired}/{len(questions)} questions ({fired / len(questions):.0%}), "
+          f"{statistics.median(timings):.1f} us median / {max(timings):.1f} us max per expansion")
+
+    if not args.live:
+        return
+
+    from entryAssignment import llm_sql_pipeline as pipeline
+    from src.utils.sql_equivalence import check_equivalence
+
+    print(f"\n{'expansion':<10} {'correct':>8} {'on fired':>9}")
+    for enabled in (False, True):
+        pipeline.query_expansion = enabled
+        correct = correct_fired = 0
+        for question, expected_sql in questions:
+            sql = pipeline.generate_sql_from_prompt(question, pipeline.get_schema_hint(question), stream=False)
+            ok = check_equivalence(sql, expected_sql).equivalent
+            correct += ok
+            correct_fired += ok and index.expand(question).fired
+        print(f"{'on' if enabled else 'off':<10} {correct:>4}/{len(questions):<3} {correct_fired:>5}/{fired:<3}")
+
+
+if __name__ == "__main__":
+    main()
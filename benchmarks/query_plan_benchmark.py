@@ -0,0 +1,108 @@
+"""
+What the index advisor buys on the reference questions, and what planning costs.
+
+    python -m benchmarks.query_plan_benchmark --db olist.sqlite [--raw] [--repeat 5] [--large-rows 100000]
+
+Works on a copy of --db, never the file itself (--raw also drops the
+db_prepare objects from the copy first). Every reference query is planned,
+its findings printed and its execution timed (median of --repeat runs). The
+advisor's recommendations for the whole workload are then applied to the
+copy, and the queries are planned and timed again. The report shows:
+- per query, the estimated rows visited and the median time, before and after,
+- whether every query still returns the same rows,
+- the cost of explain_query(), cold (new fingerprint) and cached.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def median_ms(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--raw", action="store_true", help="drop the db_prepare indexes and tables from the copy")
+    parser.add_argument("--repeat", type=int, default=5, help="executions per query and phase")
+    parser.add_argument("--large-rows", type=int, default=None, help="rows visited before a step is flagged")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="query_plan_benchmark_"))
+    db_path = str(workdir / Path(args.db).name)
+    shutil.copyfile(args.db, db_path)
+    os.environ["OLIST_DB_PATH"] = db_path
+
+    from src.utils.db_pool import close_all_pools
+    from src.utils.db_prepare import drop_prepared
+    from src.utils.query_backends import SQLiteBackend
+    from src.utils.query_plan import (LARGE_TABLE_ROWS, IndexAdvisor, _explain, apply_indexes, explain_query,
+                                      print_recommendations)
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.sql_equivalence import result_signature
+
+    try:
+        if args.raw:
+            print(f"dropped from the copy: {', '.join(drop_prepared(db_path)) or 'nothing'}")
+        large_rows = args.large_rows or LARGE_TABLE_ROWS
+        cases = load_reference_cases()
+        backend = SQLiteBackend(db_path)
+
+        def measure(label: str) -> list:
+            print(f"\n=== {label} ===")
+            rows = []
+            for n, case in enumerate(cases, 1):
+                plan = explain_query(case.sql, db_path, large_rows)
+                result = result_signature(backend.execute(plan.sql))
+                ms = median_ms(lambda: backend.execute(plan.sql), args.repeat)
+                rows.append((plan, result, ms))
+                flags = "; ".join(f.message for f in plan.findings) or "-"
+                print(f"{n:>2} ~{plan.estimated_rows:>12,.0f} rows {ms:>9.1f} ms  {flags}")
+            return rows
+
+        before = measure("before")
+        advisor = IndexAdvisor()
+        for case, (plan, _, _) in zip(cases, before):
+            advisor.add(plan, case.question)
+        recommendations = advisor.recommendations()
+        print()
+        print_recommendations(recommendations)
+        if recommendations:
+            close_all_pools()
+            report = apply_indexes(recommendations, db_path)
+            print(f"built {len(report.built)} indexes in {report.seconds}s")
+        after = measure("after")
+
+        print(f"\n{'#':>2} {'rows before':>13} {'rows after':>12} {'ms before':>10} {'ms after':>9} {'speedup':>8} same rows")
+        for n, ((old, old_result, old_ms), (new, new_result, new_ms)) in enumerate(zip(before, after), 1):
+            print(f"{n:>2} {old.estimated_rows:>13,.0f} {new.estimated_rows:>12,.0f} {old_ms:>10.1f} {new_ms:>9.1f} "
+                  f"{old_ms / max(new_ms, 1e-6):>7.1f}x {'yes' if old_result == new_result else 'NO'}")
+        total_before, total_after = sum(r[2] for r in before), sum(r[2] for r in after)
+        print(f"\nworkload: {total_before:.1f} ms -> {total_after:.1f} ms "
+              f"({total_before / max(total_after, 1e-6):.1f}x)")
+
+        def cold(sql):
+            _explain.cache_clear()
+            explain_query(sql, db_path, large_rows)
+
+        cold_ms = statistics.median(median_ms(lambda: cold(case.sql), 20) for case in cases)
+        warm_ms = statistics.median(median_ms(lambda: explain_query(case.sql, db_path, large_rows), 200)
+                                    for case in cases)
+        print(f"explain_query per statement: {cold_ms:.3f} ms planned, {warm_ms * 1000:.1f} µs cached")
+    finally:
+        close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
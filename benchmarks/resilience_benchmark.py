@@ -0,0 +1,110 @@
+"""
+Measure LLM call resilience against a local server that injects faults.
+
+    python -m benchmarks.resilience_benchmark [--requests 200] [--concurrency 8]
+
+For each fault scenario (throttling, 503s, latency spikes) the same requests
+are sent through:
+
+- "no retries": a plain AzureOpenAI client that raises on the first error
+- "sdk retries": the SDK's built-in retries (max_retries=2)
+- "resilient": ResilientTransport (backoff honouring retry-after, breaker, deadline)
+- "hedged": ResilientTransport with --hedge-after
+
+and success rate, latency percentiles and requests seen by the server are
+reported. A final outage run shows the circuit breaker failing fast and
+recovering once the server is back.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openai import AzureOpenAI
+
+from src.utils.fake_llm import FakeLLMServer
+from src.utils.llm_resilience import ResiliencePolicy, ResilientTransport
+
+API_VERSION = "2024-12-01-preview"
+SCENARIOS = {
+    "throttling": dict(throttle_rate=0.3, retry_after=0.2),
+    "server errors": dict(error_rate=0.15),
+    "latency spikes": dict(spike_rate=0.05, spike_latency=2.0),
+}
+
+
+def make_client(url: str, kind: str, hedge_after: float) -> AzureOpenAI:
+    if kind == "no retries":
+        return AzureOpenAI(azure_endpoint=url, api_key="test", api_version=API_VERSION, max_retries=0)
+    if kind == "sdk retries":
+        return AzureOpenAI(azure_endpoint=url, api_key="test", api_version=API_VERSION, max_retries=2)
+    policy = ResiliencePolicy(backoff_base=0.1, deadline=10.0,
+                              hedge_after=hedge_after if kind == "hedged" else None)
+    http_client = httpx.Client(transport=ResilientTransport(httpx.HTTPTransport(), policy))
+    return AzureOpenAI(azure_endpoint=url, api_key="test", api_version=API_VERSION, max_retries=0,
+                       http_client=http_client)
+
+
+def call(client: AzureOpenAI):
+    started = time.perf_counter()
+    try:
+        client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "SELECT 1"}])
+        return True, time.perf_counter() - started
+    except Exception:
+        return False, time.perf_counter() - started
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+def run_scenario(name: str, faults: dict, args):
+    print(f"\n{name}: {faults}")
+    print(f"  {'client':<12} {'ok %':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'server reqs':>12}")
+    for kind in ("no retries", "sdk retries", "resilient", "hedged"):
+        with FakeLLMServer(seed=args.seed, **faults) as server:
+            client = make_client(server.url, kind, args.hedge_after)
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                outcomes = list(pool.map(lambda _: call(client), range(args.requests)))
+            latencies = sorted(latency for ok, latency in outcomes if ok)
+            ok_share = 100.0 * len(latencies) / len(outcomes)
+            print(f"  {kind:<12} {ok_share:>6.1f} {percentile(latencies, 0.5):>7.3f} "
+                  f"{percentile(latencies, 0.95):>7.3f} {percentile(latencies, 0.99):>7.3f} "
+                  f"{(latencies[-1] if latencies else 0.0):>7.3f} {server.counts['requests']:>12}")
+            client.close()
+
+
+def run_outage(args):
+    print("\noutage: server down for 12 calls, then back")
+    with FakeLLMServer(seed=args.seed) as server:
+        policy = ResiliencePolicy(backoff_base=0.05, deadline=5.0, failure_threshold=5, reset_timeout=1.0)
+        client = AzureOpenAI(azure_endpoint=server.url, api_key="test", api_version=API_VERSION, max_retries=0,
+                             http_client=httpx.Client(transport=ResilientTransport(httpx.HTTPTransport(), policy)))
+        server.down = True
+        for i in range(12):
+            before = server.counts["requests"]
+            ok, latency = call(client)
+            print(f"  call {i + 1:>2}: {'ok' if ok else 'failed':<6} {latency * 1000:>8.1f} ms, "
+                  f"{server.counts['requests'] - before} request(s) reached the server")
+        server.down = False
+        time.sleep(policy.reset_timeout)
+        ok, latency = call(client)
+        print(f"  after recovery: {'ok' if ok else 'failed'} in {latency * 1000:.1f} ms")
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hedge-after", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, faults in SCENARIOS.items():
+        run_scenario(name, faults, args)
+    run_outage(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measure question-aware schema pruning on the reference questions.
+
+    python -m benchmarks.schema_linking_benchmark --db entryAssignment/olist.sqlite [--live]
+
+Offline it reports, per question, the tables kept, whether every table used
+by the validated SQL in correct_queries.txt survived pruning (table recall)
+and the schema tokens saved. With --live it also generates SQL with the full
+and the pruned schema and compares execution accuracy against the reference
+answers.
+"""
+import argparse
+import os
+import statistics
+
+
+def matches_reference(result, case) -> bool:
+    if case.expected_value is None or result is None or result.empty:
+        return False
+    from src.utils.sql_equivalence import values_match
+
+    return values_match(result.iloc[0, 0], case.expected_value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--live", action="store_true", help="also compare execution accuracy using the LLM")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.schema_linker import link_schema
+    from src.utils.sql_parser import parse_sql
+
+    cases = load_reference_cases()
+    linked = [link_schema(case.question, args.db) for case in cases]
+
+    recall_hits = 0
+    print(f"{'#':>2} {'recall':>6} {'saved':>6} {'kept/full':>9}  tables")
+    for i, (case, link) in enumerate(zip(cases, linked), 1):
+        covered = parse_sql(case.sql).tables <= set(link.tables)
+        recall_hits += covered
+        print(f"{i:>2} {'yes' if covered else 'NO':>6} {link.tokens_saved:>6} "
+              f"{link.pruned_tokens:>4}/{link.full_tokens:<4}  {', '.join(link.tables)}")
+    saved = [link.tokens_saved for link in linked]
+    ratio = [link.pruned_tokens / link.full_tokens for link in linked]
+    print(f"\nTable recall: {recall_hits}/{len(cases)}   mean tokens saved: {statistics.mean(saved):.0f} "
+          f"({100 * (1 - statistics.mean(ratio)):.0f}% of the schema prompt)")
+
+    if not args.live:
+        return
+
+    from entryAssignment import llm_sql_pipeline as pipeline
+    from entryAssignment.olist_dataset import OlistDatasetInfo
+
+    full_schema = OlistDatasetInfo.get_compact_dataset_info()
+    correct = {"full": 0, "pruned": 0}
+    for case, link in zip(cases, linked):
+        for variant, schema in (("full", full_schema), ("pruned", link.prompt)):
+            try:
+                sql = pipeline.validate_generated_sql(pipeline.generate_sql_from_prompt(case.question, schema))
+                correct[variant] += matches_reference(pipeline.query_db(sql), case)
+            except Exception as e:
+                print(f"[{variant}] {case.plain_question}: {e}")
+    print(f"Execution accuracy: full {correct['full']}/{len(cases)}, pruned {correct['pruned']}/{len(cases)}")
+
+
+if __name__ == "__main__":
+    main()
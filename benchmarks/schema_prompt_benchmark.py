@@ -0,0 +1,79 @@
+"""
+Compare the static OlistDatasetInfo prompts with the generated compact schema.
+
+    python -m benchmarks.schema_prompt_benchmark --db entryAssignment/olist.sqlite [--live]
+
+Reports prompt size (chars / tokens) and build time for every variant. With
+--live it also sends each reference question with each variant to the
+deployment configured for llm_sql_pipeline and reports end-to-end latency.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+
+def timed(fn, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        value = fn()
+    return value, (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--budgets", default="1200,800,500", help="comma-separated token budgets")
+    parser.add_argument("--live", action="store_true", help="also measure end-to-end latency against the LLM")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from entryAssignment.olist_dataset import OlistDatasetInfo
+    from src.utils import schema_prompt
+
+    # Private cache dir so "cold" really includes introspection
+    schema_prompt.SCHEMA_CACHE_DIR = Path(tempfile.mkdtemp(prefix="schema_prompts-"))
+
+    variants = {
+        "static get_dataset_info": OlistDatasetInfo.get_dataset_info,
+        "static get_dataset_info2": OlistDatasetInfo.get_dataset_info2,
+    }
+    for budget in (int(b) for b in args.budgets.split(",")):
+        variants[f"compact budget={budget}"] = lambda b=budget: schema_prompt.get_compact_schema(args.db, b)
+
+    print(f"{'variant':<28} {'chars':>7} {'tokens':>7} {'cold ms':>9} {'warm us':>9}")
+    prompts = {}
+    for name, build in variants.items():
+        schema_prompt._cache.clear()
+        shutil.rmtree(schema_prompt.SCHEMA_CACHE_DIR, ignore_errors=True)
+        text, cold = timed(build)
+        _, warm = timed(build, repeat=200)
+        prompts[name] = text
+        print(f"{name:<28} {len(text):>7} {schema_prompt.count_tokens(text):>7} "
+              f"{cold * 1e3:>9.2f} {warm * 1e6:>9.1f}")
+
+    if not args.live:
+        return
+
+    from entryAssignment import llm_sql_pipeline as pipeline
+    # Each variant is the whole schema text sent with the question
+    pipeline.prompt_layout = "pruned"
+
+    print(f"\n{'variant':<28} {'p50 s':>7} {'mean s':>7} {'prompt tok':>11}")
+    for name, text in prompts.items():
+        latencies, prompt_tokens = [], []
+        for question, _ in pipeline.QUESTIONS:
+            started = time.perf_counter()
+            response = pipeline.get_client(pipeline.LLM_PROFILE).chat.completions.create(
+                model=pipeline.deployment, messages=pipeline.build_messages(question, text), temperature=0.0)
+            latencies.append(time.perf_counter() - started)
+            prompt_tokens.append(response.usage.prompt_tokens)
+        print(f"{name:<28} {statistics.median(latencies):>7.2f} {statistics.mean(latencies):>7.2f} "
+              f"{statistics.mean(prompt_tokens):>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
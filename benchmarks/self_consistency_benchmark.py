@@ -0,0 +1,141 @@
+"""
+Compare the serial feedback loop with self-consistency voting on the reference questions.
+
+    python -m benchmarks.self_consistency_benchmark --db olist.sqlite [--n 5] [--accuracy 0.6] [--live]
+
+"serial" is refine_sql_with_feedback (generate, evaluate, sleep, retry);
+"self-consistency" is generate_sql_self_consistent (n candidates at once,
+executed in parallel, voted on by result; feedback loop only on disagreement).
+
+Offline runs use FakeAzureOpenAI: each generation returns the reference SQL
+with probability --accuracy and a wrong variant otherwise, with a latency
+model scaled down by --time-scale (reported LLM time is scaled back up;
+query execution time is reported as measured).
+--live sends everything to the AZURE_OPENAI_* deployment instead.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import time
+
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+    pct = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+    return {"p50": pct(0.5), "p90": pct(0.9), "mean": statistics.mean(values), "max": values[-1]}
+
+
+def wrong_variant(sql: str, rng: random.Random) -> str:
+    """
+    A plausible-looking SQL that answers differently. Wrong generations
+    rarely agree with each other, so variants pick one of several answers.
+    """
+    sql = sql.strip().rstrip(";")
+    offset = rng.randint(1, 4)
+    limited = re.search(r"\bLIMIT\s+(\d+)\s*$", sql, re.IGNORECASE)
+    if limited:
+        # The runner-up row(s) instead of the top one
+        return f"{sql[:limited.start()]}LIMIT {limited.group(1)} OFFSET {offset}"
+    return f"SELECT * FROM ({sql}) LIMIT {offset}"
+
+
+def make_fake_client(cases, accuracy: float, time_scale: float, seed: int):
+    from src.utils.fake_llm import FakeAzureOpenAI
+
+    reference = {case.question: case.sql for case in cases}
+    rng = random.Random(seed)
+
+    def responder(messages):
+        if messages[0]["content"] == "You are a SQL expert evaluator.":
+            # Only asked to explain a mismatch; correctness is decided locally
+            correct = messages[-1]["content"].split("Correct SQL:")[1].split("Result difference:")[0].strip()
+            return json.dumps({"errors": ["different result"], "correction": correct,
+                               "explanation": "The query does not answer the question."})
+        sql = reference[messages[-1]["content"]]
+        if rng.random() >= accuracy:
+            sql = wrong_variant(sql, rng)
+        return json.dumps({"reasoning": ["Join the relevant tables"], "sql_query": sql})
+
+    # Roughly what gpt-4o takes for a structured SQL answer / a short JSON evaluation
+    return FakeAzureOpenAI(responder, latency=(1.5 * time_scale, 4.0 * time_scale),
+                           per_choice_latency=0.3 * time_scale, seed=seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--n", type=int, default=5, help="candidates per question")
+    parser.add_argument("--parallel-requests", action="store_true", help="n single requests instead of n=")
+    parser.add_argument("--accuracy", type=float, default=0.6, help="offline: chance a generation is correct")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="offline: latency multiplier")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the reference questions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.sql_equivalence import check_equivalence
+    from structuredOutput import SQLQueryGeneratorWithChatHistory as generator
+    from structuredOutput.olist_dataset import OlistDatasetInfo
+
+    cases = load_reference_cases()
+    system_prompt = OlistDatasetInfo.get_dataset_info2()
+    scale = 1.0 if args.live else args.time_scale
+    client = None if args.live else make_fake_client(cases, args.accuracy, scale, args.seed)
+
+    # Only LLM latency is scaled offline; time spent executing candidates is real
+    # and is added back unscaled
+    execute_candidates, executing = generator.execute_candidates, [0.0]
+
+    def timed_execute(sqls, **kwargs):
+        started = time.perf_counter()
+        try:
+            return execute_candidates(sqls, **kwargs)
+        finally:
+            executing[0] += time.perf_counter() - started
+
+    generator.execute_candidates = timed_execute
+
+    def answer_ok(case, sql):
+        return sql is not None and check_equivalence(sql, case.sql).equivalent
+
+    def serial(case):
+        sql, _ = generator.refine_sql_with_feedback(case.question, case.sql, system_prompt,
+                                                    retry_delay=1.0 * scale, client=client)
+        return sql, False
+
+    def self_consistent(case):
+        result = generator.generate_sql_self_consistent(case.question, system_prompt, correct_sql=case.sql,
+                                                        n=args.n, parallel_requests=args.parallel_requests,
+                                                        retry_delay=1.0 * scale, client=client)
+        return result.sql, result.fell_back
+
+    strategies = {"serial": serial, "self-consistency": self_consistent}
+    print(f"{len(cases)} questions x {args.rounds} rounds, n={args.n}, "
+          f"{'live' if args.live else f'offline (accuracy {args.accuracy}, time scale {scale})'}\n")
+    print(f"{'strategy':<18} {'p50 s':>7} {'p90 s':>7} {'mean s':>7} {'max s':>7} {'correct':>8} {'fallback':>9}")
+    for name, run in strategies.items():
+        latencies, correct, fallbacks = [], 0, 0
+        for _ in range(args.rounds):
+            for case in cases:
+                started, executing[0] = time.perf_counter(), 0.0
+                with contextlib.redirect_stdout(io.StringIO()):
+                    sql, fell_back = run(case)
+                elapsed = time.perf_counter() - started
+                latencies.append((elapsed - executing[0]) / scale + executing[0])
+                correct += answer_ok(case, sql)
+                fallbacks += fell_back
+        stats = percentiles(latencies)
+        total = len(latencies)
+        print(f"{name:<18} {stats['p50']:>7.2f} {stats['p90']:>7.2f} {stats['mean']:>7.2f} {stats['max']:>7.2f} "
+              f"{correct:>4}/{total:<3} {fallbacks:>5}/{total:<3}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Measure how well and how fast canonicalize() folds rewritten queries together.
+
+    python -m benchmarks.sql_canonical_benchmark [--variants 300] [--seed 0] [--db olist.sqlite]
+
+Every reference query is rewritten --variants times with random
+combinations of: keyword / identifier case, whitespace, trailing semicolons,
+renamed or dropped table aliases, AS added or removed, shuffled WHERE
+conditions, swapped sides of column = column comparisons, inner joins
+reordered with their ON conditions moved to WHERE, reals written as 100.00
+and renamed output columns. The report shows the share of variants that
+keep the fingerprint of their original under the plain normalised text of
+parse_sql and under canonicalize() (with and without output column names).
+
+Two checks must stay at zero: distinct reference queries sharing a
+fingerprint, and "near misses" (a changed literal, comparison or sort
+direction) that canonicalize() folds into the original. With --db the
+canonical SQL of every reference query is also executed and must return
+the original's rows. Timings are per query, cold (caches cleared) and cached.
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import time
+
+ALIASES = ["a", "b", "t1", "t2", "x", "src", "tbl", "q"]
+
+
+def case_and_space(tokens, rng: random.Random) -> str:
+    out = []
+    for token in tokens:
+        text = token.value
+        if token.type == "word":
+            text = rng.choice([text.upper(), text.lower(), text.capitalize()])
+        out.append(text)
+        out.append(rng.choice([" ", " ", "  ", "\n    "]))
+    text = "".join(out).strip()
+    return text + rng.choice(["", ";", " ;"])
+
+
+def rename_aliases(tokens, rng: random.Random, drop: bool) -> list:
+    """Rename every table alias, or drop it (``alias.col`` becomes ``table.col``) where the table is used once."""
+    from src.utils.sql_parser import Token, parse_sql, render_tokens, walk_selects
+
+    items = [item for select in walk_selects(parse_sql(render_tokens(tokens)).ast) for core in select.cores
+             for item in core.from_items if item.table]
+    tables = [item.table for item in items]
+    aliases = {item.alias: item.table for item in items if item.alias}
+    names = {}
+    for alias, table in aliases.items():
+        if drop and tables.count(table) == 1:
+            names[alias] = None
+        else:
+            names[alias] = rng.choice([a for a in ALIASES if a not in names.values()] or [f"{alias}_{table}"])
+
+    out = []
+    for i, token in enumerate(tokens):
+        before = tokens[i - 1] if i else None
+        after = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token.type != "word" or token.name not in names:
+            out.append(token)
+        elif after is not None and after.value == ".":
+            out.append(Token("word", names[token.name] or aliases[token.name]))
+        elif before is not None and (before.name == aliases[token.name] or before.is_word("AS")
+                                     and tokens[i - 2].name == aliases[token.name]):
+            if before.is_word("AS") and (names[token.name] is None or rng.random() < 0.5):
+                out.pop()
+            elif names[token.name] is not None and not before.is_word("AS") and rng.random() < 0.5:
+                out.append(Token("word", "AS"))
+            if names[token.name] is not None:
+                out.append(Token("word", names[token.name]))
+        else:
+            out.append(token)
+    return out
+
+
+def top_level_span(tokens, start_words: set, end_words: set):
+    depth, start = 0, None
+    for i, token in enumerate(tokens):
+        depth += (token.value == "(") - (token.value == ")")
+        if depth:
+            continue
+        if start is None and token.is_word(*start_words):
+            start = i
+        elif start is not None and token.is_word(*end_words):
+            return start, i
+    return (start, len(tokens)) if start is not None else None
+
+
+def shuffle_where(tokens, rng: random.Random) -> list:
+    from src.utils.sql_parser import Token, _split_top
+
+    span = top_level_span(tokens, {"WHERE"}, {"GROUP", "ORDER", "LIMIT", "HAVING"})
+    if span is None:
+        return tokens
+    start, end = span
+    conjuncts = _split_top(tokens[start + 1:end], "AND")
+    if len(_split_top(tokens[start + 1:end], "OR")) > 1:
+        return tokens
+    rng.shuffle(conjuncts)
+    body = []
+    for conjunct in conjuncts:
+        if len(conjunct) == 7 and conjunct[3].value == "=" and rng.random() < 0.5:
+            conjunct = conjunct[4:] + [conjunct[3]] + conjunct[:3]
+        body += ([Token("word", "AND")] if body else []) + conjunct
+    return tokens[:start + 1] + body + tokens[end:]
+
+
+def reorder_joins(sql: str, rng: random.Random):
+    """``FROM a JOIN b ON p JOIN c ON q WHERE w`` as ``FROM c, a, b WHERE q AND w AND p`` (shuffled)."""
+    from src.utils.sql_parser import parse_sql, render_tokens
+
+    parsed = parse_sql(sql)
+    core = parsed.ast.cores[0]
+    items = core.from_items
+    if len(parsed.ast.cores) != 1 or len(items) < 2 or any(i.table is None or i.using for i in items) \
+            or any(i.join not in ("JOIN", "INNER JOIN") for i in items[1:]):
+        return None
+    tokens = parsed.tokens
+    span = top_level_span(tokens, {"FROM"}, {"WHERE", "GROUP", "ORDER", "LIMIT", "HAVING"})
+    conditions = [render_tokens(i.on) for i in items if i.on]
+    rest = tokens[span[1]:]
+    if rest and rest[0].is_word("WHERE"):
+        where = top_level_span(tokens, {"WHERE"}, {"GROUP", "ORDER", "LIMIT", "HAVING"})
+        conditions.append(f"({render_tokens(tokens[where[0] + 1:where[1]])})")
+        rest = tokens[where[1]:]
+    rng.shuffle(items := list(items))
+    rng.shuffle(conditions)
+    tables = ", ".join(f"{i.table} {i.alias}" if i.alias else i.table for i in items)
+    return (f"{render_tokens(tokens[:span[0]])} FROM {tables} WHERE {' AND '.join(conditions)} "
+            f"{render_tokens(rest)}")
+
+
+def variant(sql: str, rng: random.Random) -> str:
+    from src.utils.sql_parser import Token, tokenize
+
+    if rng.random() < 0.3:
+        sql = reorder_joins(sql, rng) or sql
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+    if rng.random() < 0.7:
+        tokens = rename_aliases(tokens, rng, drop=rng.random() < 0.3)
+    if rng.random() < 0.6:
+        tokens = shuffle_where(tokens, rng)
+    tokens = [Token("number", t.value + "0") if t.type == "number" and "." in t.value and rng.random() < 0.5
+              else t for t in tokens]
+    return case_and_space(tokens, rng)
+
+
+def renamed_columns(sql: str, rng: random.Random) -> str:
+    """Output columns renamed, together with references to them (ORDER BY / GROUP BY / HAVING)."""
+    select_list = re.split(r"\bFROM\b", sql, maxsplit=1, flags=re.IGNORECASE)[0]
+    for name in re.findall(r"\bAS\s+(\w+)\s*(?:,|$)", select_list, flags=re.IGNORECASE):
+        sql = re.sub(rf"(?<![.\w]){name}\b", f"{name}_{rng.randint(1, 9)}", sql, flags=re.IGNORECASE)
+    return sql
+
+
+# (pattern, replacement) edits that change what a query returns
+NEAR_MISSES = [
+    (r"\bDESC\b", "ASC"),
+    (r"(?<![<>!])>(?!=)", ">="),
+    (r"\b(\d+)\b(?!\.)", lambda m: str(int(m.group(1)) + 1)),
+    (r"'([a-z_ ]+)'", lambda m: f"'{m.group(1).upper()}'"),
+]
+
+
+def timed(fn, queries, repeat: int, before=None) -> list:
+    timings = []
+    for sql in queries:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            if before:
+                before()
+            fn(sql)
+        timings.append((time.perf_counter() - started) / repeat * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--variants", type=int, default=300, help="rewrites per reference query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=500, help="calls per query for the timings")
+    parser.add_argument("--db", help="also execute the canonical SQL (default: no execution)")
+    args = parser.parse_args()
+    if args.db:
+        os.environ["OLIST_DB_PATH"] = args.db
+
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.sql_parser import canonicalize, parse_sql
+
+    rng = random.Random(args.seed)
+    queries = [case.sql for case in load_reference_cases()]
+    fingerprints = {canonicalize(sql).fingerprint for sql in queries}
+    print(f"{len(queries)} reference queries, {len(fingerprints)} distinct fingerprints\n")
+
+    print(f"{'#':>2} {'variants':>9} {'normalized':>11} {'canonical':>10} {'no names':>9} {'near misses':>12}")
+    totals = [0, 0, 0, 0]
+    for n, sql in enumerate(queries, 1):
+        original = parse_sql(sql).normalized, canonicalize(sql), canonicalize(sql, column_aliases=False)
+        variants = [variant(sql, rng) for _ in range(args.variants)]
+        named = [renamed_columns(v, rng) if rng.random() < 0.3 else v for v in variants]
+        normalized = sum(parse_sql(v).normalized == original[0] for v in variants)
+        canonical = sum(canonicalize(v) == original[1] for v in variants)
+        unnamed = sum(canonicalize(v, column_aliases=False) == original[2] for v in named)
+        merged = 0
+        for pattern, replacement in NEAR_MISSES:
+            changed = re.sub(pattern, replacement, sql, count=1)
+            merged += changed != sql and canonicalize(changed) == original[1]
+        for i, value in enumerate((normalized, canonical, unnamed, merged)):
+            totals[i] += value
+        print(f"{n:>2} {len(variants):>9} {normalized / len(variants):>11.0%} {canonical / len(variants):>10.0%} "
+              f"{unnamed / len(variants):>9.0%} {merged:>12}")
+    count = args.variants * len(queries)
+    print(f"\nall {count} variants: normalized {totals[0] / count:.1%}, canonical {totals[1] / count:.1%}, "
+          f"canonical without column names {totals[2] / count:.1%}; near misses folded: {totals[3]}")
+
+    def cold(sql):
+        canonicalize.cache_clear()
+        parse_sql.cache_clear()
+        canonicalize(sql)
+
+    sample = [variant(sql, rng) for sql in queries]
+    cold_us = timed(cold, sample, args.repeat)
+    warm_us = timed(canonicalize, sample, args.repeat)
+    print(f"canonicalize per query: cold median {statistics.median(cold_us):.0f} µs (max {max(cold_us):.0f} µs), "
+          f"cached {statistics.median(warm_us):.2f} µs")
+
+    if args.db:
+        from src.utils.query_backends import get_backend
+        from src.utils.sql_equivalence import result_signature
+
+        backend = get_backend(db_path=args.db)
+        same = sum(result_signature(backend.execute(parse_sql(sql).statement)) ==
+                   result_signature(backend.execute(canonicalize(sql).sql)) for sql in queries)
+        print(f"canonical SQL returns the original rows for {same}/{len(queries)} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Time the SQL safety validator on the reference queries.
+
+    python -m benchmarks.sql_validator_benchmark [--repeat 2000]
+
+Reports the per-query cost of a cold parse (tokenize + AST + tables +
+fingerprint, parse cache cleared) and of a cached lookup, next to the old
+substring check. Validation should stay well under a millisecond per query.
+"""
+import argparse
+import statistics
+import time
+
+
+def substring_check(sql: str) -> bool:
+    forbidden = ['DROP', 'DELETE', 'UPDATE', 'ALTER', 'INSERT']
+    return not any(cmd in sql.upper() for cmd in forbidden)
+
+
+def time_per_call(fn, queries, repeat: int, before=None) -> list:
+    timings = []
+    for sql in queries:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            if before:
+                before()
+            fn(sql)
+        timings.append((time.perf_counter() - started) / repeat * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    from src.utils.reference_queries import load_reference_cases
+    from src.utils.sql_parser import parse_sql
+
+    queries = [case.sql for case in load_reference_cases()]
+    cold = time_per_call(parse_sql, queries, args.repeat, before=parse_sql.cache_clear)
+    warm = time_per_call(parse_sql, queries, args.repeat)
+    substring = time_per_call(substring_check, queries, args.repeat)
+
+    print(f"{'#':>2} {'chars':>6} {'cold µs':>8} {'cached µs':>10} {'substring µs':>13}")
+    for i, sql in enumerate(queries):
+        print(f"{i + 1:>2} {len(sql):>6} {cold[i]:>8.1f} {warm[i]:>10.2f} {substring[i]:>13.2f}")
+    print(f"\nMedian per query: cold {statistics.median(cold):.1f} µs, cached {statistics.median(warm):.2f} µs, "
+          f"substring {statistics.median(substring):.2f} µs; worst cold {max(cold):.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Execution accuracy against latency for every combination of SQL strategy,
+schema prompt, few-shot examples and model.
+
+    python -m benchmarks.strategy_benchmark --db olist.sqlite [--strategies json_schema,pipeline,pydantic,refine]
+                                            [--schemas info2,info,compact] [--few-shot none,retrieved]
+                                            [--models gpt-4o] [--mode auto] [--min-accuracy 0.8] [--output FILE]
+
+Each cell of the matrix runs the reference questions (or --cases) through
+evals.eval_runner. All LLM traffic goes through one cassette, by default
+evals/cassettes/strategy_benchmark.jsonl. Requests are keyed on model and
+prompt, so the first run (--mode auto or record) calls the deployments and
+later runs replay offline (--mode replay) with the latencies seen while
+recording. ``--mode stub`` needs neither a cassette nor credentials: every
+client talks to a local FakeLLMServer (src.utils.fake_llm) that answers each
+question with its reference SQL, so a fresh checkout can run the whole
+matrix. Its accuracy and latency only check the plumbing, they measure no
+model.
+
+Per cell the table shows execution accuracy, p50/p95 LLM latency, and prompt
+tokens, completion tokens and LLM calls per answer. The pick is the cell with
+the lowest p50 that reaches --min-accuracy. "static" few-shot examples only
+exist in the info2 schema prompt, so other schemas skip that value.
+"""
+import argparse
+import itertools
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+CASSETTE = Path(__file__).resolve().parent.parent / "evals" / "cassettes" / "strategy_benchmark.jsonl"
+
+
+def split(value: str) -> list:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def stub_responder(cases):
+    """Reference SQL in the format each strategy asks for."""
+    from src.utils.fake_llm import reference_responder
+
+    reference = reference_responder([SimpleNamespace(plain_question=case.question, sql=case.sql) for case in cases])
+
+    def responder(messages) -> str:
+        answer = json.loads(reference(messages))
+        if "Return only valid SQL" in messages[0]["content"]:   # llm_sql_pipeline's system prompt
+            return answer["sql_query"]
+        # "steps" for the JSON-schema generator, "reasoning" for SQLGeneration
+        return json.dumps({"reasoning": answer["steps"], **answer})
+
+    return responder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("OLIST_DB_PATH", "olist.sqlite"))
+    parser.add_argument("--cases", help="JSONL or YAML case file (default: correct_queries.txt)")
+    parser.add_argument("--strategies", default="json_schema,pipeline,pydantic,refine")
+    parser.add_argument("--schemas", default="info2,compact", help="info2, info and/or compact")
+    parser.add_argument("--few-shot", default="none,retrieved", help="none, static and/or retrieved")
+    parser.add_argument("--models", default="gpt-4o", help="deployments to compare")
+    parser.add_argument("--cassette", default=str(CASSETTE))
+    parser.add_argument("--mode", choices=("replay", "record", "auto", "live", "stub"), default="auto",
+                        help="stub: answer from a local fake server, no cassette or credentials")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--min-accuracy", type=float, default=0.8, help="accuracy bar for the pick")
+    parser.add_argument("--output", help="write every cell's summary as JSON")
+    args = parser.parse_args()
+    os.environ["OLIST_DB_PATH"] = args.db
+
+    from evals.eval_runner import GENERATORS, SCHEMAS, load_cases, run_eval, summarize
+
+    for name, values, known in (("strategy", args.strategies, GENERATORS), ("schema", args.schemas, SCHEMAS),
+                                ("few-shot", args.few_shot, ("none", "static", "retrieved"))):
+        unknown = [v for v in split(values) if v not in known]
+        if unknown:
+            parser.error(f"unknown {name} {', '.join(unknown)}; choose from {', '.join(known)}")
+
+    cases = load_cases(args.cases)
+    mode, server = args.mode, None
+    if mode == "stub":
+        from src.utils.fake_llm import FakeLLMServer
+
+        server = FakeLLMServer(stub_responder(cases)).start()
+        # Set before the worker processes start, so their clients are built against the fake server
+        for name, value in (("AZURE_OPENAI_ENDPOINT", server.url), ("OPENAI_API_KEY", "stub"),
+                            ("DH_ENDPOINT", server.url), ("DH_API_KEY", "stub")):
+            os.environ[name] = value
+        mode = "live"
+    rows = []
+    for strategy, schema, few_shot, model in itertools.product(split(args.strategies), split(args.schemas),
+                                                               split(args.few_shot), split(args.models)):
+        if few_shot == "static" and schema != "info2":
+            continue
+        options = {"schema": schema, "few_shot": few_shot, "model": model}
+        summary = summarize(run_eval(cases, strategy, options, args.cassette, mode, args.workers, args.db))
+        answers = summary["cases"] or 1
+        rows.append({"strategy": strategy, **options, **summary,
+                     "calls_per_answer": round(summary["llm_calls"] / answers, 2),
+                     "prompt_tokens_per_answer": round(summary["prompt_tokens"] / answers),
+                     "completion_tokens_per_answer": round(summary["completion_tokens"] / answers)})
+    if server is not None:
+        server.stop()
+
+    print(f"\n{'strategy':<12} {'schema':<8} {'few-shot':<10} {'model':<14} {'accuracy':>9} {'p50 s':>6} "
+          f"{'p95 s':>6} {'prompt/ans':>11} {'compl/ans':>10} {'calls/ans':>10} {'errors':>7}")
+    for row in rows:
+        print(f"{row['strategy']:<12} {row['schema']:<8} {row['few_shot']:<10} {row['model']:<14} "
+              f"{row['execution_accuracy']:>9.0%} {row['llm_seconds_p50']:>6.2f} {row['llm_seconds_p95']:>6.2f} "
+              f"{row['prompt_tokens_per_answer']:>11} {row['completion_tokens_per_answer']:>10} "
+              f"{row['calls_per_answer']:>10.2f} {row['errors']:>7}")
+
+    eligible = [row for row in rows if row["execution_accuracy"] >= args.min_accuracy]
+    if eligible:
+        pick = min(eligible, key=lambda row: (row["llm_seconds_p50"], row["prompt_tokens_per_answer"]))
+        print(f"\nfastest with accuracy >= {args.min_accuracy:.0%}: {pick['strategy']} / {pick['schema']} schema / "
+              f"{pick['few_shot']} examples / {pick['model']} ({pick['execution_accuracy']:.0%}, "
+              f"p50 {pick['llm_seconds_p50']:.2f}s)")
+    else:
+        print(f"\nno combination reaches {args.min_accuracy:.0%} execution accuracy")
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
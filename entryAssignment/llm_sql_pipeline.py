@@ -1,81 +1,224 @@
+import asyncio
 import logging
 import os
+import time
 
-from openai import AzureOpenAI
 import pandas as pd
-import sqlite3
 import re
 from typing import Union
 import unittest
 
 from entryAssignment.olist_dataset import OlistDatasetInfo
+from structuredOutput.queryExpansion import expand_question, expansion_stats
+from src.utils.azure_client import client_metrics, deployment_for, get_async_client, get_client
+from src.utils.db_pool import get_pool
+from src.utils.query_cache import QueryResultCache
+from src.utils.query_plan import inspect_query, record_execution
+from src.utils.batch_runner import run_batch
+from src.utils import llmstats
+from src.utils.llm_resilience import resilience_stats
+from src.utils.prompt_builder import get_prompt_builder, messages_hash, prompt_cache_stats
+from src.utils.rate_limit import DeploymentRateLimiter, estimate_tokens
+from src.utils.schema_linker import link_schema
+from src.utils.query_backends import get_backend
+from src.utils.sql_sandbox import QueryGuardrailError
+from src.utils.sql_parser import SQLValidationError, parse_sql
+from src.utils.sql_stream import SQLStatementDetector, aread_sql_stream, read_sql_stream, stream_stats
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # === Azure OpenAI Setup ===
-endpoint = os.getenv("DH_ENDPOINT")
-api_key=os.getenv("DH_API_KEY")
-deployment = "gpt-4o"
-api_version = "2024-12-01-preview"
-
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=api_key
-)
+# Clients come from the shared registry (DH_ENDPOINT / DH_API_KEY) and are
+# only created on the first LLM call
+LLM_PROFILE = "dh"
+deployment = deployment_for(LLM_PROFILE)
+
+# Send only the tables a question needs (set OLIST_SCHEMA_PRUNING=0 to send the full schema)
+schema_pruning = os.getenv("OLIST_SCHEMA_PRUNING", "1") == "1"
+
+# Stream completions and stop reading as soon as the SQL statement ends.
+# A stream closed early never reaches its usage chunk, so streamed calls are
+# not recorded in prompt_cache_stats; measure prompt caching with this off.
+stream_sql = os.getenv("OLIST_STREAM_SQL", "0") == "1"
+
+# "cached": instructions + full schema as a byte-stable prefix the provider can
+# cache, with only the linked table names and the question after it.
+# "pruned": only the linked tables' schema, sent with the question.
+# "auto": "cached" only when that prefix reaches Azure's caching minimum.
+prompt_layout = os.getenv("OLIST_PROMPT_LAYOUT", "auto")
+
+# Map category / city / state terms in questions to exact DB literals (set OLIST_QUERY_EXPANSION=0 to skip)
+query_expansion = os.getenv("OLIST_QUERY_EXPANSION", "1") == "1"
+
+# EXPLAIN QUERY PLAN before running generated SQL; plans and timings also go to OLIST_PLAN_LOG when set
+inspect_plans = os.getenv("OLIST_QUERY_PLAN", "1") == "1"
+
+# Answers keyed on (normalized question, expected type, schema prompt, deployment)
+result_cache = QueryResultCache()
 
 # === DB Access ===
-def query_db(sql: str) -> pd.DataFrame:
+def query_db(sql: str, scalar: bool = False, question: str = None) -> pd.DataFrame:
+    # Full scans and automatic indexes are flagged before the statement runs
+    plan = inspect_query(sql, question) if inspect_plans else None
+    started = time.perf_counter()
     try:
-        with sqlite3.connect("olist.sqlite") as conn:
-            df = pd.read_sql_query(sql, conn)
+        # Streamed with row/byte caps from the backend chosen by OLIST_BACKEND
+        # (sandboxed SQLite or DuckDB over Parquet); a scalar question with a
+        # one-row answer stops reading after the second fetch
+        df = get_backend().execute(sql, scalar=scalar)
         logging.info("Query executed successfully.")
+        record_execution(question, plan, time.perf_counter() - started, rows=len(df))
         return df
+    except QueryGuardrailError as e:
+        # Timeout, VM step budget, heap limit or a denied (non-SELECT) action
+        logging.error(f"Query stopped by guardrail ({e.kind}): {e.message}\n{sql}")
+        record_execution(question, plan, time.perf_counter() - started, error=e.kind)
+        raise
     except Exception as e:
         logging.error(f"Query failed:\n{sql}")
+        record_execution(question, plan, time.perf_counter() - started, error=str(e))
         raise e
 
 # === Prompt Builder ===
-def generate_sql_from_prompt(question: str, schema_hint: str = "") -> str:
+SYSTEM_PROMPT = "You are an expert in Olist's DB. Return only valid SQL. No explanation or markdown."
+
+def sql_prompt():
+    """Prompt builder whose prefix is the instructions plus the full compact schema."""
+    return get_prompt_builder("llm_sql_pipeline", SYSTEM_PROMPT, OlistDatasetInfo.get_compact_dataset_info())
+
+def cached_layout() -> bool:
+    """Whether prompts use the cacheable full-schema prefix instead of the pruned schema."""
+    if prompt_layout == "auto":
+        return sql_prompt().cacheable
+    return prompt_layout == "cached"
+
+def build_messages(question: str, schema_hint: str = "") -> list[dict]:
+    if cached_layout():
+        # Everything before the question is identical across questions
+        return sql_prompt().messages(question, context=schema_hint)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user",
+         "content": f"Dataset info:\n{schema_hint}\n\nQuestion:\n{question}"}
+    ]
+
+def prompt_key(schema_hint: str) -> str:
+    """Hash of everything sent besides the question, so a prompt change misses the result cache."""
+    return messages_hash(build_messages("", schema_hint))
+
+def record_prompt_usage(response, started: float):
+    prefix = sql_prompt().prefix_hash if cached_layout() else "pruned"
+    prompt_cache_stats.record(prefix, response.usage, time.perf_counter() - started)
+
+def extract_sql(sql_code: str) -> str:
+    # Optional: Clean output (useful if LLM adds any extra lines)
+    match = re.search(r"(SELECT .*?;?$)", sql_code, re.IGNORECASE | re.DOTALL)
+    return match.group(1).strip() if match else sql_code.strip()
+
+def generate_sql_from_prompt(question: str, schema_hint: str = "", stream: bool = None) -> str:
+    stream = stream_sql if stream is None else stream
     try:
-        response = client.chat.completions.create(
+        started = time.perf_counter()
+        response = get_client(LLM_PROFILE).chat.completions.create(
             model=deployment,
-            messages=[
-                {"role": "system",
-                 "content": "You are an expert in Olist's DB. Return only valid SQL. No explanation or markdown."},
-                {"role": "user",
-                 "content": f"Dataset info:\n{schema_hint}\n\nQuestion:\n{question}"}
-            ],
+            messages=build_messages(question, schema_hint),
             temperature=0.0,
+            stream=stream,
         )
+        if stream:
+            # Returns once the statement's ";" (or closing fence) arrives and
+            # closes the stream, so the SQL reaches the executor immediately
+            # (without usage, so nothing is recorded in prompt_cache_stats)
+            streamed = read_sql_stream(response, SQLStatementDetector(), started)
+            return streamed.sql or extract_sql(streamed.text)
 
+        record_prompt_usage(response, started)
         sql_code = response.choices[0].message.content  # ✅ CORRECTED this line
-
-        # Optional: Clean output (useful if LLM adds any extra lines)
-        match = re.search(r"(SELECT .*?;?$)", sql_code, re.IGNORECASE | re.DOTALL)
-        return match.group(1).strip() if match else sql_code.strip()
+        return extract_sql(sql_code)
 
     except Exception as e:
         logging.error(f"LLM failed to generate SQL for: {question}")
         raise e
 
-# === Basic SQL Safety Check ===
+async def agenerate_sql_from_prompt(question: str, schema_hint: str = "", async_client=None,
+                                    stream: bool = None) -> str:
+    """Async twin of generate_sql_from_prompt used by the batch runner."""
+    stream = stream_sql if stream is None else stream
+    started = time.perf_counter()
+    response = await (async_client or get_async_client(LLM_PROFILE)).chat.completions.create(
+        model=deployment,
+        messages=build_messages(question, schema_hint),
+        temperature=0.0,
+        stream=stream,
+    )
+    if stream:
+        streamed = await aread_sql_stream(response, SQLStatementDetector(), started)
+        return streamed.sql or extract_sql(streamed.text)
+    record_prompt_usage(response, started)
+    return extract_sql(response.choices[0].message.content)
+
+# === Schema Linking ===
+def get_schema_hint(question: str) -> str:
+    """
+    Question-specific schema text. With the cached layout the schema is in the
+    prompt prefix, so this is only the names of the linked tables; otherwise
+    the schema prompt pruned to those tables. Either way followed by the
+    database literals of category / city / state terms in the question.
+    """
+    values = expand_question(question).hint() if query_expansion else ""
+    if not schema_pruning:
+        hint = "" if cached_layout() else OlistDatasetInfo.get_compact_dataset_info()
+        return "\n\n".join(filter(None, [hint, values]))
+    linked = link_schema(question)
+    if cached_layout():
+        return "\n\n".join(filter(None, [f"Relevant tables: {', '.join(linked.tables)}", values]))
+    logging.info(f"Schema linking kept {len(linked.tables)} tables ({', '.join(linked.tables)}), "
+                 f"saved {linked.tokens_saved} of {linked.full_tokens} schema tokens")
+    return "\n\n".join(filter(None, [linked.prompt, values]))
+
+# === SQL Safety Check ===
 def is_safe_sql(sql: str) -> bool:
-    forbidden = ['DROP', 'DELETE', 'UPDATE', 'ALTER', 'INSERT']
-    return not any(cmd in sql.upper() for cmd in forbidden)
+    # Tokenized parse: exactly one SELECT / WITH ... SELECT, so keywords inside
+    # literals or column names (e.g. "updated_at") no longer trip the check
+    try:
+        parse_sql(sql)
+        return True
+    except SQLValidationError as e:
+        logging.warning(f"Rejected SQL: {e}")
+        return False
+
+def validate_generated_sql(sql: str) -> str:
+    """Parse generated SQL once and return the statement to execute (no trailing semicolon)."""
+    try:
+        parsed = parse_sql(sql.strip())
+    except SQLValidationError as e:
+        raise ValueError(f"Unsafe SQL detected ({e}):\n{sql}") from e
+    logging.info(f"SQL reads tables: {', '.join(sorted(parsed.tables)) or '-'} [{parsed.fingerprint}]")
+    return parsed.statement
 
 # === Pipeline ===
-def run_llm_query(question: str, expected_type: type) -> Union[int, float, str, pd.DataFrame]:
-    schema_hint = OlistDatasetInfo.get_dataset_info()
-    sql = generate_sql_from_prompt(question, schema_hint)
+def get_sql_and_result(question: str, expected_type: type, schema_hint: str) -> tuple[str, pd.DataFrame]:
+    """Generate and run SQL for a question, serving repeats from the result cache."""
+    cache_key = QueryResultCache.make_key(question, expected_type, prompt_key(schema_hint), deployment)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"Cache hit for: {question}")
+        return cached.sql, cached.result
 
-    if not is_safe_sql(sql):
-        raise ValueError(f"Unsafe SQL detected:\n{sql}")
+    sql = validate_generated_sql(generate_sql_from_prompt(question, schema_hint))
 
-    result = query_db(sql)
+    result = query_db(sql, scalar=expected_type in [int, float, str], question=question)
+    result_cache.put(cache_key, sql, result)
+    return sql, result
 
+def run_llm_query(question: str, expected_type: type) -> Union[int, float, str, pd.DataFrame]:
+    schema_hint = get_schema_hint(question)
+    sql, result = get_sql_and_result(question, expected_type, schema_hint)
+
+    return cast_result(result, expected_type)
+
+def cast_result(result: pd.DataFrame, expected_type: type) -> Union[int, float, str, pd.DataFrame]:
     # Auto-cast to expected type for scalar outputs
     if expected_type in [int, float, str] and len(result) == 1 and len(result.columns) == 1:
         val = result.iloc[0, 0]
@@ -85,6 +228,44 @@ def run_llm_query(question: str, expected_type: type) -> Union[int, float, str,
 
     return result
 
+# === Batch Pipeline ===
+async def run_llm_queries(questions, concurrency: int = 4, timeout: float = 60.0,
+                          async_client=None, rate_limiter: DeploymentRateLimiter = None):
+    """
+    Answer many (question, expected_type) pairs concurrently.
+
+    Async generator yielding BatchResult objects in completion order; a failed
+    question carries its exception in ``error`` instead of aborting the batch.
+    At most ``concurrency`` LLM calls are in flight and requests are paced
+    against the deployment's RPM/TPM quota.
+    """
+    rate_limiter = rate_limiter or DeploymentRateLimiter()
+
+    async def answer(item):
+        question, expected_type = item
+        schema_hint = get_schema_hint(question)
+        cache_key = QueryResultCache.make_key(question, expected_type, prompt_key(schema_hint), deployment)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return cast_result(cached.result, expected_type)
+
+        sql = validate_generated_sql(await agenerate_sql_from_prompt(question, schema_hint, async_client))
+
+        # Keep the event loop free while SQLite works on a pooled connection
+        result = await asyncio.to_thread(query_db, sql, expected_type in [int, float, str], question)
+        result_cache.put(cache_key, sql, result)
+        return cast_result(result, expected_type)
+
+    # Budget against the unpruned schema so the TPM estimate never undershoots
+    prompt_tokens = estimate_tokens(OlistDatasetInfo.get_compact_dataset_info()) + 256
+    async for outcome in run_batch(questions, answer, concurrency=concurrency, timeout=timeout,
+                                   rate_limiter=rate_limiter, cost=lambda item: prompt_tokens):
+        if outcome.ok:
+            logging.info(f"✅ {outcome.item[0]} → {outcome.value} ({outcome.latency:.2f}s)")
+        else:
+            logging.error(f"❌ {outcome.item[0]} → {outcome.error}")
+        yield outcome
+
 # === Questions & Expected Output Types ===
 QUESTIONS = [
     ("Which seller has delivered the most orders to customers in Rio de Janeiro?", str),
@@ -122,17 +303,10 @@ import logging
 
 
 def run_single_question(question: str, expected_type: type) -> Union[int, float, str, pd.DataFrame]:
-    schema_hint = OlistDatasetInfo.get_dataset_info2()
-    sql = generate_sql_from_prompt(question, schema_hint)
-
-    sql = sql.strip().rstrip(";")
+    schema_hint = get_schema_hint(question)
+    sql, result = get_sql_and_result(question, expected_type, schema_hint)
     print(f"\n🔍 Generated SQL:\n{sql}")
 
-    if not is_safe_sql(sql):
-        raise ValueError(f"❌ Unsafe SQL detected:\n{sql}")
-
-    result = query_db(sql)
-
     if expected_type in [int, float, str] and len(result) == 1 and len(result.columns) == 1:
         val = result.iloc[0, 0]
         try:
@@ -149,4 +323,13 @@ if __name__ == "__main__":
     expected_type = str  # Change based on your expected output type
     answer = run_single_question(user_question, expected_type)
     print(f"\n✅ Final Answer: {answer}")
+    logging.info(f"DB pool stats: {get_pool().stats().as_dict()}")
+    logging.info(f"Result cache stats: {result_cache.stats().as_dict()}")
+    logging.info(f"LLM client stats: {client_metrics()}")
+    logging.info(f"LLM resilience stats: {resilience_stats()}")
+    logging.info(f"Prompt cache stats: {prompt_cache_stats.as_dict()}")
+    logging.info(f"LLM usage by call site: {llmstats.summary()}")
+    logging.info(f"Query expansion stats: {expansion_stats.as_dict()}")
+    if stream_sql:
+        logging.info(f"SQL stream stats: {stream_stats.as_dict()}")
 
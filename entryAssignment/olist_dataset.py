@@ -1,9 +1,21 @@
+from src.utils.schema_prompt import DEFAULT_TOKEN_BUDGET, get_compact_schema
+
+
 class OlistDatasetInfo:
     """
     This class provides a structured description of the Olist dataset,
     making it easier for AI models to understand and generate accurate SQL queries.
     """
 
+    @staticmethod
+    def get_compact_dataset_info(token_budget: int = DEFAULT_TOKEN_BUDGET, db_path: str = None):
+        """
+        Schema generated from the live database instead of the hand-written
+        text below: one line per table with row counts, frequent values and
+        join keys, trimmed to ``token_budget`` and cached per DB fingerprint.
+        """
+        return get_compact_schema(db_path=db_path, token_budget=token_budget)
+
     @staticmethod
     def get_dataset_info():
         return """
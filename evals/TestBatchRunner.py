@@ -0,0 +1,106 @@
+import asyncio
+import time
+import unittest
+
+from src.utils.batch_runner import is_rate_limited, run_batch
+from src.utils.fake_llm import FakeAsyncAzureOpenAI
+from src.utils.rate_limit import DeploymentRateLimiter
+
+
+def collect(items, worker, **kwargs) -> list:
+    """Drain run_batch and return its results in item order."""
+    async def drain():
+        return [outcome async for outcome in run_batch(items, worker, **kwargs)]
+    return sorted(asyncio.run(drain()), key=lambda r: r.index)
+
+
+class TestBatchRunner(unittest.TestCase):
+    """
+    run_batch against FakeAsyncAzureOpenAI: no network, no credentials and no
+    database, so these run anywhere.
+    """
+
+    @staticmethod
+    def completion_worker(client):
+        async def worker(question):
+            response = await client.chat.completions.create(model="gpt-4o",
+                                                            messages=[{"role": "user", "content": question}])
+            return response.choices[0].message.content
+        return worker
+
+    def test_concurrency_is_bounded(self):
+        """Never more than ``concurrency`` calls in flight, and every item gets its own result."""
+        client = FakeAsyncAzureOpenAI(latency=(0.02, 0.05))
+        questions = [f"question {i}" for i in range(20)]
+        results = collect(questions, self.completion_worker(client), concurrency=3)
+
+        self.assertEqual([r.item for r in results], questions)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(client.calls, 20)
+        self.assertEqual(client.peak_in_flight, 3)
+
+    def test_timeout_fails_only_the_slow_item(self):
+        async def worker(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        results = collect([0.01, 1.0, 0.01], worker, concurrency=3, timeout=0.2)
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertIsInstance(results[1].error, TimeoutError)
+        self.assertLess(results[1].latency, 0.5)
+
+    def test_rate_limited_item_is_not_retried_and_pauses_the_limiter(self):
+        """Retries belong to the transport: a 429 reaching run_batch fails the item once and pauses the batch."""
+        client = FakeAsyncAzureOpenAI(latency=(0.0, 0.0), throttle_rate=1.0, retry_after=0.3)
+        limiter = DeploymentRateLimiter(rpm=0, tpm=0)
+        results = collect(["a", "b"], self.completion_worker(client), concurrency=1, rate_limiter=limiter)
+
+        self.assertEqual(client.calls, 2)
+        self.assertTrue(all(is_rate_limited(r.error) for r in results))
+        # The second item waited out the retry-after of the first before being sent
+        self.assertGreaterEqual(results[1].latency, 0.25)
+        # ...and the second 429 pauses whoever uses the limiter next
+        started = time.monotonic()
+        asyncio.run(limiter.acquire())
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_stopping_early_cancels_pending_items(self):
+        started = []
+
+        async def worker(item):
+            started.append(item)
+            await asyncio.sleep(0.05)
+            return item
+
+        async def first():
+            async for outcome in run_batch(range(10), worker, concurrency=2):
+                return outcome
+
+        self.assertTrue(asyncio.run(first()).ok)
+        self.assertLessEqual(len(started), 4)
+
+    def test_closing_early_waits_for_cancelled_items(self):
+        started, settled = [], []
+
+        async def worker(item):
+            started.append(item)
+            try:
+                await asyncio.sleep(0.05 if item == 0 else 10)
+            finally:
+                settled.append(item)
+            return item
+
+        async def first():
+            batch = run_batch(range(6), worker, concurrency=3)
+            outcome = await batch.__anext__()
+            await batch.aclose()
+            # Every in-flight item has run its cleanup by the time aclose() returns
+            return outcome, sorted(settled)
+
+        outcome, settled_at_close = asyncio.run(first())
+        self.assertEqual(outcome.value, 0)
+        self.assertEqual(settled_at_close, sorted(started))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.utils.db_prepare import drop_prepared, prepare_database
+
+SUMMARIES = {
+    "status_facts": (("orders",), ("order_status",),
+                     "SELECT order_status, COUNT(*) AS orders FROM orders GROUP BY order_status"),
+}
+
+
+class TestDBPrepare(unittest.TestCase):
+    """prepare_database / drop_prepared on a temporary SQLite file with one summary table."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="db_prepare_test_"))
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.db_path = str(self.workdir / "olist.sqlite")
+        self.execute("CREATE TABLE orders (order_id TEXT, order_status TEXT)",
+                     "INSERT INTO orders VALUES ('o1', 'delivered'), ('o2', 'shipped'), ('o3', 'shipped')")
+
+    def execute(self, *statements) -> list:
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            return [conn.execute(sql).fetchall() for sql in statements][-1]
+        finally:
+            conn.close()
+
+    def prepare(self):
+        return prepare_database(self.db_path, indexes=[], summaries=SUMMARIES)
+
+    def test_second_run_skips_unchanged_sources(self):
+        self.assertEqual(self.prepare().built, ["status_facts"])
+        self.assertEqual(self.prepare().skipped, ["status_facts"])
+
+    def test_in_place_update_rebuilds_the_summary(self):
+        """Same row count and max rowid, different contents."""
+        self.prepare()
+        self.execute("UPDATE orders SET order_status = 'delivered' WHERE order_id = 'o2'")
+        self.assertEqual(self.prepare().built, ["status_facts"])
+        self.assertEqual(self.execute("SELECT order_status, orders FROM status_facts ORDER BY 1"),
+                         [("delivered", 2), ("shipped", 1)])
+
+    def test_drop_removes_statistics_it_created(self):
+        self.prepare()
+        self.assertEqual(drop_prepared(self.db_path), ["status_facts", "sqlite_stat1"])
+        self.assertEqual(self.execute("SELECT name FROM sqlite_master WHERE type = 'table'"), [("orders",)])
+
+    def test_drop_keeps_statistics_that_were_already_there(self):
+        self.execute("CREATE INDEX ix_orders_status ON orders (order_status)", "ANALYZE")
+        self.prepare()
+        self.assertEqual(drop_prepared(self.db_path), ["status_facts"])
+        self.assertEqual(self.execute("SELECT COUNT(*) FROM sqlite_stat1"), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import time
+import unittest
+
+import httpx
+
+from src.utils.azure_client import ClientMetrics, MeteredTransport
+from src.utils.fake_llm import FakeLLMServer
+from src.utils.llm_resilience import (CircuitOpenError, DeadlineExceeded, ResiliencePolicy, ResilientTransport,
+                                      breaker_for, request_deadline)
+
+FAST = ResiliencePolicy(max_attempts=3, backoff_base=0.01, backoff_max=0.05, deadline=10.0,
+                        failure_threshold=2, reset_timeout=0.3)
+
+
+class TestLLMResilience(unittest.TestCase):
+    """
+    ResilientTransport against a FakeLLMServer on localhost: real HTTP round
+    trips with injected throttling, outages and latency spikes.
+    """
+
+    def setUp(self):
+        self.server = FakeLLMServer(latency=(0.0, 0.0)).start()
+        self.addCleanup(self.server.stop)
+
+    def post(self, policy=FAST, metrics=None) -> httpx.Response:
+        transport = ResilientTransport(httpx.HTTPTransport(), policy)
+        if metrics is not None:
+            transport = MeteredTransport(metrics, transport)
+        with httpx.Client(transport=transport) as client:
+            return client.post(f"{self.server.url}/openai/deployments/gpt-4o/chat/completions",
+                               json={"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]})
+
+    def breaker(self):
+        request = httpx.Request("POST", f"{self.server.url}/openai/deployments/gpt-4o/chat/completions")
+        return breaker_for(request, FAST)
+
+    def test_throttled_calls_wait_for_retry_after(self):
+        self.server.throttle_rate, self.server.retry_after = 1.0, 0.2
+        started = time.monotonic()
+        response = self.post()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.server.counts["requests"], FAST.max_attempts)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2 * (FAST.max_attempts - 1))
+        # Throttling pauses the deployment but is not a failure
+        self.assertEqual(self.breaker().state, "closed")
+
+    def test_breaker_opens_fails_fast_and_recovers_through_a_probe(self):
+        self.server.down = True
+        # The retry after the threshold-th failure is already refused
+        with self.assertRaises(CircuitOpenError):
+            self.post()
+        self.assertEqual(self.server.counts["requests"], FAST.failure_threshold)
+        self.assertEqual(self.breaker().state, "open")
+
+        # Open: fails fast (still an httpx.TransportError for the SDK) without sending anything
+        sent = self.server.counts["requests"]
+        with self.assertRaises(httpx.TransportError) as raised:
+            self.post()
+        self.assertIsInstance(raised.exception, CircuitOpenError)
+        self.assertEqual(self.server.counts["requests"], sent)
+
+        # Half-open: a failed probe opens the breaker again
+        time.sleep(FAST.reset_timeout + 0.05)
+        with self.assertRaises(CircuitOpenError):
+            self.post()
+        self.assertEqual(self.server.counts["requests"], sent + 1)
+        self.assertEqual(self.breaker().state, "open")
+
+        # Half-open: a successful probe closes it
+        self.server.down = False
+        time.sleep(FAST.reset_timeout + 0.05)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.breaker().state, "closed")
+
+    def test_deadline_bounds_all_attempts(self):
+        self.server.spike_rate, self.server.spike_latency = 1.0, 1.0
+        started = time.monotonic()
+        with request_deadline(0.3), self.assertRaises(DeadlineExceeded):
+            self.post()
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_client_metrics_count_requests_that_raise(self):
+        """A call that ends in a transport error leaves nothing in flight and counts as an error."""
+        metrics = ClientMetrics()
+        self.assertEqual(self.post(metrics=metrics).status_code, 200)
+        self.server.down = True
+        with self.assertRaises(CircuitOpenError):
+            self.post(metrics=metrics)
+
+        counts = metrics.as_dict()
+        self.assertEqual((counts["requests"], counts["responses"], counts["in_flight"]), (2, 1, 0))
+        self.assertEqual(counts["errors"], 1)
+        self.assertEqual(counts["exception_counts"], {"CircuitOpenError": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
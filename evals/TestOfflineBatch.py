@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.utils.batch_jobs import LocalBatchSubmitter, read_jsonl
+
+
+def without_timings(results) -> list:
+    return [{k: v for k, v in r.items() if k != "execute_ms"} for r in results]
+
+
+def responder(messages) -> str:
+    """Answers every question with an order count, and fails the ones mentioning "unanswerable"."""
+    if "unanswerable" in messages[-1]["content"]:
+        raise RuntimeError("model refused")
+    return json.dumps({"steps": ["Count the orders"], "sql_query": "SELECT COUNT(*) AS orders FROM orders;"})
+
+
+class CountingSubmitter(LocalBatchSubmitter):
+    def __init__(self, root):
+        super().__init__(responder, root=root)
+        self.submitted = 0
+
+    def submit(self, input_path) -> str:
+        self.submitted += 1
+        return super().submit(input_path)
+
+
+class TestOfflineBatch(unittest.TestCase):
+    """
+    SQLQueryExecutor.run_offline end to end with LocalBatchSubmitter: request
+    file, batch lifecycle, output join, SQL execution against OLIST_DB_PATH
+    and resuming a submitted job from job.json. No LLM calls are made; the
+    client only needs placeholder credentials to be constructed.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+        os.environ.setdefault("OPENAI_API_KEY", "placeholder")
+        from structuredOutput.SQLQueryExecutor import SQLQueryExecutor
+        cls.executor = SQLQueryExecutor()
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="offline_batch_test_"))
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.job_dir = self.workdir / "job"
+        self.submitter = CountingSubmitter(self.workdir / "batches")
+        self.questions = ["How many orders are there?", "An unanswerable question"]
+
+    def run_offline(self, questions):
+        return self.executor.run_offline(questions, job_dir=self.job_dir, submitter=self.submitter,
+                                         poll_interval=0.05, output_path=self.workdir / "report.txt")
+
+    def test_answers_every_question_and_reports_failures(self):
+        results = self.run_offline(self.questions)
+
+        self.assertEqual([r["question"] for r in results], self.questions)
+        answered, failed = results
+        self.assertIsNone(answered["error"])
+        self.assertEqual(answered["sql"], "SELECT COUNT(*) AS orders FROM orders;")
+        self.assertEqual(answered["result"]["columns"], ["orders"])
+        self.assertGreater(answered["result"]["data"][0][0], 0)
+        self.assertIn("model refused", failed["error"])
+
+        self.assertEqual(len(read_jsonl(self.job_dir / "requests.jsonl")), 2)
+        self.assertEqual(read_jsonl(self.job_dir / "results.jsonl"), results)
+        self.assertIn("Query Error: RuntimeError: model refused", (self.workdir / "report.txt").read_text())
+
+    def test_rerun_resumes_the_submitted_batch(self):
+        first = self.run_offline(self.questions)
+        job = json.loads((self.job_dir / "job.json").read_text(encoding="utf-8"))
+        self.assertTrue(job["usage_recorded"])
+
+        self.assertEqual(without_timings(self.run_offline(self.questions)), without_timings(first))
+        self.assertEqual(self.submitter.submitted, 1)
+        self.assertEqual(json.loads((self.job_dir / "job.json").read_text(encoding="utf-8"))["batch_id"],
+                         job["batch_id"])
+
+        # Different questions are a different job
+        self.run_offline(self.questions[:1])
+        self.assertEqual(self.submitter.submitted, 2)
+
+    def set_batch_state(self, batch_id, state):
+        path = self.submitter.root / batch_id / "batch.json"
+        status = json.loads(path.read_text(encoding="utf-8"))
+        path.write_text(json.dumps(dict(status, state=state)), encoding="utf-8")
+
+    def test_rerun_resubmits_a_batch_that_did_not_complete(self):
+        first = self.run_offline(self.questions)
+        for state in ("expired", "in_progress"):     # in_progress without a live thread: its process died
+            with self.subTest(state=state):
+                batch_id = json.loads((self.job_dir / "job.json").read_text(encoding="utf-8"))["batch_id"]
+                self.set_batch_state(batch_id, state)
+                submitted = self.submitter.submitted
+
+                self.assertEqual(without_timings(self.run_offline(self.questions)), without_timings(first))
+                self.assertEqual(self.submitter.submitted, submitted + 1)
+                self.assertNotEqual(json.loads((self.job_dir / "job.json").read_text(encoding="utf-8"))["batch_id"],
+                                    batch_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
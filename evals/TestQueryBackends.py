@@ -0,0 +1,33 @@
+import importlib.util
+import unittest
+
+from src.utils.query_backends import get_backend
+from src.utils.reference_queries import load_reference_cases
+from src.utils.sql_equivalence import compare_results, is_ordered
+from src.utils.sql_parser import parse_sql
+
+
+@unittest.skipIf(importlib.util.find_spec("duckdb") is None or importlib.util.find_spec("pyarrow") is None,
+                 "the DuckDB backend needs duckdb and pyarrow (pip install -r requirements.txt)")
+class TestQueryBackends(unittest.TestCase):
+    """
+    The reference queries from correct_queries.txt on the SQLite and DuckDB
+    backends (OLIST_DB_PATH, exported to Parquet on first use) must return
+    the same results.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.sqlite, cls.duckdb = get_backend("sqlite"), get_backend("duckdb")
+
+    def test_reference_queries_agree(self):
+        for i, case in enumerate(load_reference_cases()):
+            with self.subTest(case=f"ref-{i + 1:02d}", question=case.plain_question):
+                statement = parse_sql(case.sql).statement
+                expected = self.sqlite.execute(statement)
+                verdict = compare_results(self.duckdb.execute(statement), expected, ordered=is_ordered(case.sql))
+                self.assertTrue(verdict.equivalent, f"{verdict.reason}: {verdict.sample_diff}")
+
+
+if __name__ == "__main__":
+    unittest.main()
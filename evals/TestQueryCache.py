@@ -0,0 +1,98 @@
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils.query_cache import QueryResultCache
+
+SQL = "SELECT COUNT(*) AS orders FROM orders"
+
+
+class TestQueryCache(unittest.TestCase):
+    """QueryResultCache against a throwaway SQLite database and cache file."""
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="query_cache_test_"))
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.db_path = str(self.workdir / "olist.sqlite")
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript("CREATE TABLE orders (order_id TEXT); INSERT INTO orders VALUES ('o1'), ('o2');")
+        conn.close()
+        self.cache = self.new_cache()
+        self.key = QueryResultCache.make_key("How many orders are there?", int, "schema prompt", "gpt-4o")
+
+    def new_cache(self, **kwargs) -> QueryResultCache:
+        return QueryResultCache(path=str(self.workdir / "cache.sqlite"), db_path=self.db_path, **kwargs)
+
+    def change_database(self):
+        time.sleep(0.01)    # the fingerprint starts from the file's mtime
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE sellers (seller_id TEXT)")
+        conn.close()
+
+    def test_key_covers_question_type_prompt_and_deployment(self):
+        same = QueryResultCache.make_key("  how many ORDERS are there ", int, "schema prompt", "gpt-4o")
+        self.assertEqual(same, self.key)
+        for other in [QueryResultCache.make_key("How many sellers are there?", int, "schema prompt", "gpt-4o"),
+                      QueryResultCache.make_key("How many orders are there?", float, "schema prompt", "gpt-4o"),
+                      QueryResultCache.make_key("How many orders are there?", int, "other prompt", "gpt-4o"),
+                      QueryResultCache.make_key("How many orders are there?", int, "schema prompt", "gpt-4o-mini")]:
+            self.assertNotEqual(other, self.key)
+
+    def test_hits_from_memory_then_from_disk(self):
+        self.assertIsNone(self.cache.get(self.key))
+        self.cache.put(self.key, SQL, pd.DataFrame({"orders": [2]}))
+        self.assertEqual(self.cache.get(self.key).sql, SQL)
+
+        restarted = self.new_cache()
+        answer = restarted.get(self.key)
+        self.assertEqual(answer.result.iat[0, 0], 2)
+        self.assertEqual((self.cache.stats().memory_hits, self.cache.stats().misses), (1, 1))
+        self.assertEqual(restarted.stats().disk_hits, 1)
+
+    def test_get_returns_copies(self):
+        frame = pd.DataFrame({"orders": [2]})
+        self.cache.put(self.key, SQL, frame)
+        frame.iat[0, 0] = 99
+        first = self.cache.get(self.key)
+        first.result.iat[0, 0] = 100
+        self.assertEqual(self.cache.get(self.key).result.iat[0, 0], 2)
+        self.assertIsNot(self.cache.get(self.key).result, self.cache.get(self.key).result)
+
+    def test_database_change_invalidates_entries(self):
+        self.cache.put(self.key, SQL, pd.DataFrame({"orders": [2]}))
+        self.change_database()
+
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertEqual(self.cache.stats().invalidated, 1)
+        # Dropped from disk as well, not only from memory
+        with sqlite3.connect(self.cache.path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM answers").fetchone(), (0,))
+        conn.close()
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.new_cache(ttl_seconds=0.05)
+        cache.put(self.key, SQL, pd.DataFrame({"orders": [2]}))
+        self.assertIsNotNone(cache.get(self.key))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(self.key))
+        self.assertEqual(cache.stats().expired, 1)
+
+    def test_memory_tier_is_bounded(self):
+        cache = self.new_cache(max_memory_entries=1)
+        other = QueryResultCache.make_key("How many sellers are there?", int, "schema prompt", "gpt-4o")
+        cache.put(self.key, SQL, pd.DataFrame({"orders": [2]}))
+        cache.put(other, "SELECT 0", pd.DataFrame({"sellers": [0]}))
+
+        self.assertEqual(cache.stats().evicted, 1)
+        # The evicted entry is still on disk
+        self.assertEqual(cache.get(self.key).sql, SQL)
+        self.assertEqual(cache.stats().disk_hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import sqlite3
+import unittest
+
+from src.utils.sql_parser import SQLValidationError, canonicalize
+
+SCHEMA = """
+CREATE TABLE customers (customer_id TEXT, customer_city TEXT, customer_state TEXT);
+CREATE TABLE orders (order_id TEXT, customer_id TEXT, order_status TEXT);
+CREATE TABLE order_items (order_id TEXT, price REAL);
+INSERT INTO customers VALUES ('c1', 'sao paulo', 'SP'), ('c2', 'rio de janeiro', 'RJ'), ('c3', 'campinas', 'SP');
+INSERT INTO orders VALUES ('o1', 'c1', 'delivered'), ('o2', 'c1', 'shipped'), ('o3', 'c2', 'delivered'),
+                          ('o4', 'c3', 'delivered'), ('o5', 'c9', 'canceled');
+INSERT INTO order_items VALUES ('o1', 10.5), ('o1', 99.0), ('o3', 1.5), ('o4', 250.0);
+"""
+
+
+class TestSQLCanonical(unittest.TestCase):
+    """
+    canonicalize: its fingerprint keys the result cache, the query archive and
+    the gold snapshots, so equal queries must collide and different ones must
+    not. The canonical SQL is checked against a small in-memory database.
+    """
+
+    def assertSameQuery(self, a, b, column_aliases=True):
+        self.assertEqual(canonicalize(a, column_aliases).fingerprint, canonicalize(b, column_aliases).fingerprint,
+                         f"{canonicalize(a, column_aliases).sql}\n{canonicalize(b, column_aliases).sql}")
+
+    def assertDifferentQuery(self, a, b, column_aliases=True):
+        self.assertNotEqual(canonicalize(a, column_aliases).fingerprint, canonicalize(b, column_aliases).fingerprint)
+
+    def test_equivalent_spellings_share_a_fingerprint(self):
+        self.assertSameQuery(
+            "SELECT o.order_id FROM orders o JOIN customers c ON o.customer_id = c.customer_id "
+            "WHERE c.customer_state = 'SP' AND o.order_status = 'delivered'",
+            "select orders.order_id from customers join orders on customers.customer_id = orders.customer_id "
+            "where orders.order_status='delivered' and customers.customer_state='SP';")
+        self.assertSameQuery("SELECT * FROM order_items WHERE price > 1.50",
+                             "SELECT * FROM order_items WHERE price > 1.5")
+        self.assertSameQuery("SELECT * FROM order_items WHERE price > 10", "SELECT * FROM order_items WHERE 10 < price")
+        self.assertSameQuery("SELECT * FROM orders WHERE order_status IN ('b', 'a')",
+                             "SELECT * FROM orders WHERE order_status IN ('a', 'b')")
+        self.assertSameQuery("SELECT 1 FROM orders WHERE order_status = 'x' OR order_status = 'y'",
+                             "SELECT 1 FROM orders WHERE order_status = 'y' OR order_status = 'x'")
+        self.assertSameQuery("SELECT * FROM orders WHERE order_status <> 'x'",
+                             "SELECT * FROM orders WHERE order_status != 'x'")
+
+    def test_self_join_aliases_are_renamed_consistently(self):
+        self.assertSameQuery("SELECT a.order_id FROM orders a JOIN orders b ON a.customer_id = b.customer_id",
+                             "SELECT x.order_id FROM orders x JOIN orders y ON x.customer_id = y.customer_id")
+
+    def test_column_aliases_only_matter_when_kept(self):
+        a, b = "SELECT COUNT(*) AS n FROM orders", "SELECT COUNT(*) AS total FROM orders"
+        self.assertDifferentQuery(a, b)
+        self.assertSameQuery(a, b, column_aliases=False)
+
+    def test_different_queries_do_not_collide(self):
+        for a, b in [("SELECT * FROM orders WHERE order_status = 'delivered'",
+                      "SELECT * FROM orders WHERE order_status = 'shipped'"),
+                     ("SELECT * FROM orders o LEFT JOIN customers c ON o.customer_id = c.customer_id",
+                      "SELECT * FROM customers c LEFT JOIN orders o ON o.customer_id = c.customer_id"),
+                     ("SELECT order_id FROM orders ORDER BY order_id",
+                      "SELECT order_id FROM orders ORDER BY order_id DESC"),
+                     ("SELECT order_id FROM orders LIMIT 1", "SELECT order_id FROM orders LIMIT 2"),
+                     ("SELECT order_id FROM orders", "SELECT DISTINCT order_id FROM orders")]:
+            with self.subTest(a=a, b=b):
+                self.assertDifferentQuery(a, b, column_aliases=False)
+
+    def test_canonical_sql_returns_the_same_rows(self):
+        db = sqlite3.connect(":memory:")
+        self.addCleanup(db.close)
+        db.executescript(SCHEMA)
+        for sql in ["SELECT o.order_id, c.customer_city FROM orders o JOIN customers c "
+                    "ON o.customer_id = c.customer_id WHERE c.customer_state = 'SP' AND o.order_status = 'delivered'",
+                    "SELECT c.customer_city, COUNT(*) AS n FROM customers c LEFT JOIN orders o "
+                    "ON o.customer_id = c.customer_id GROUP BY c.customer_city",
+                    "SELECT a.order_id, b.order_id FROM orders a JOIN orders b "
+                    "ON a.customer_id = b.customer_id WHERE a.order_id < b.order_id",
+                    "WITH spend AS (SELECT order_id, SUM(price) AS total FROM order_items GROUP BY order_id) "
+                    "SELECT o.order_status, s.total FROM spend s, orders o WHERE s.order_id = o.order_id "
+                    "AND s.total > 1.50",
+                    "SELECT * FROM (SELECT order_id AS id FROM orders) s WHERE s.id IN ('o3', 'o1')"]:
+            with self.subTest(sql=sql):
+                expected = sorted(db.execute(sql).fetchall())
+                self.assertEqual(sorted(db.execute(canonicalize(sql).sql).fetchall()), expected)
+                self.assertEqual(sorted(db.execute(canonicalize(sql, column_aliases=False).sql).fetchall()),
+                                 expected)
+
+    def test_invalid_sql_is_rejected_like_parse_sql(self):
+        with self.assertRaises(SQLValidationError):
+            canonicalize("DELETE FROM orders")
+
+
+if __name__ == "__main__":
+    unittest.main()
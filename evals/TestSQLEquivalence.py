@@ -0,0 +1,85 @@
+import unittest
+
+import pandas as pd
+
+from src.utils.sql_equivalence import compare_results, is_ordered, values_match
+
+
+def frame(columns, *rows) -> pd.DataFrame:
+    return pd.DataFrame(list(rows), columns=columns)
+
+
+class TestSQLEquivalence(unittest.TestCase):
+    """compare_results on hand-built frames; no database or LLM involved."""
+
+    def assertEquivalent(self, generated, expected, ordered=False):
+        verdict = compare_results(generated, expected, ordered=ordered)
+        self.assertTrue(verdict.equivalent, verdict.reason)
+
+    def assertNotEquivalent(self, generated, expected, ordered=False, reason=None):
+        verdict = compare_results(generated, expected, ordered=ordered)
+        self.assertFalse(verdict.equivalent)
+        if reason is not None:
+            self.assertEqual(verdict.reason, reason)
+
+    def test_unrounded_value_matches_rounded_gold(self):
+        """AVG(review_score) against the gold ROUND(AVG(review_score), 2)."""
+        gold = frame(["avg_score"], (4.14,))
+        self.assertEquivalent(frame(["avg_score"], (4.136712,)), gold)
+        self.assertEquivalent(frame(["avg_score"], (4.135,)), gold)
+        self.assertNotEquivalent(frame(["avg_score"], (4.1249,)), gold, reason="different values")
+        self.assertEquivalent(frame(["pct"], (91.8947,)), frame(["pct"], (91.89,)))
+
+    def test_tolerance_comes_from_the_gold_value(self):
+        """A generated value rounded further than the gold has lost precision."""
+        self.assertNotEquivalent(frame(["avg_score"], (4.1,)), frame(["avg_score"], (4.14,)),
+                                 reason="different values")
+        self.assertFalse(values_match(4.1, 4.14))
+        self.assertFalse(values_match(4.14, 4.1367))
+        self.assertTrue(values_match(4.1367, 4.14))
+
+    def test_whole_numbers_are_not_rounded(self):
+        """A count of 4 is not an average of 4.4, even though 4.4 rounds to 4."""
+        self.assertNotEquivalent(frame(["n"], (4.4,)), frame(["n"], (4,)))
+        self.assertNotEquivalent(frame(["n"], (17,)), frame(["n"], (18,)))
+
+    def test_int_and_float_compare_equal(self):
+        self.assertEquivalent(frame(["n"], (17.0,)), frame(["n"], (17,)))
+        self.assertEquivalent(frame(["n"], ("17",)), frame(["n"], (17,)))
+        self.assertEquivalent(frame(["ok"], (True,)), frame(["ok"], (1,)))
+
+    def test_column_names_and_order_are_ignored(self):
+        expected = frame(["seller_id", "orders"], ("a", 3), ("b", 5))
+        self.assertEquivalent(frame(["total", "id"], (3, "a"), (5, "b")), expected)
+        self.assertEquivalent(frame(["id", "order_count"], ("a", 3), ("b", 5)), expected)
+        self.assertNotEquivalent(frame(["id"], ("a",), ("b",)), expected, reason="1 columns instead of 2")
+
+    def test_row_order_only_matters_when_ordered(self):
+        expected = frame(["city", "n"], ("rio", 2), ("sao paulo", 1))
+        swapped = frame(["city", "n"], ("sao paulo", 1), ("rio", 2))
+        self.assertEquivalent(swapped, expected)
+        self.assertNotEquivalent(swapped, expected, ordered=True, reason="rows in a different order")
+
+        self.assertTrue(is_ordered("SELECT city FROM customers ORDER BY city"))
+        self.assertFalse(is_ordered("SELECT city FROM customers ORDER BY city LIMIT 1"))
+        self.assertFalse(is_ordered("SELECT city FROM customers"))
+
+    def test_rows_compare_as_a_multiset(self):
+        expected = frame(["n"], (1,), (1,), (2,))
+        self.assertEquivalent(frame(["n"], (2,), (1,), (1,)), expected)
+        self.assertNotEquivalent(frame(["n"], (1,), (2,), (2,)), expected)
+        self.assertNotEquivalent(frame(["n"], (1,), (2,)), expected, reason="2 rows instead of 3")
+
+    def test_nulls(self):
+        expected = frame(["city", "score"], ("rio", None), ("recife", 4.5))
+        self.assertEquivalent(frame(["city", "score"], ("recife", 4.5), ("rio", float("nan"))), expected)
+        self.assertNotEquivalent(frame(["city", "score"], ("rio", 0.0), ("recife", 4.5)), expected)
+
+    def test_values_match(self):
+        self.assertTrue(values_match(4.136712, "4.14"))
+        self.assertTrue(values_match("campina grande", "campina grande"))
+        self.assertFalse(values_match(1277, "1278"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from src.utils.sql_parser import SQLValidationError, parse_sql
+
+
+class TestSQLParser(unittest.TestCase):
+    """
+    parse_sql as the safety check in front of query execution: what it must
+    reject, what it must not reject, and the tables it reports.
+    """
+
+    def assertRejected(self, sql, message):
+        with self.assertRaises(SQLValidationError) as raised:
+            parse_sql(sql)
+        self.assertIn(message, str(raised.exception))
+
+    def test_rejects_anything_but_one_select(self):
+        for sql, message in [("DELETE FROM orders", "Only SELECT statements are allowed, got DELETE"),
+                             ("drop table orders", "got DROP"),
+                             ("PRAGMA table_info(orders)", "got PRAGMA"),
+                             ("ATTACH DATABASE 'other.db' AS other", "got ATTACH"),
+                             ("REPLACE INTO sellers VALUES (1)", "got REPLACE"),
+                             ("SELECT 1; DROP TABLE orders", "Multiple statements"),
+                             ("SELECT 1;\nDELETE FROM orders;", "Multiple statements"),
+                             ("", "Empty statement"),
+                             ("  ;  ", "Empty statement"),
+                             ("-- only a comment", "Empty statement")]:
+            with self.subTest(sql=sql):
+                self.assertRejected(sql, message)
+
+    def test_rejects_functions_that_reach_outside_the_database(self):
+        self.assertRejected("SELECT load_extension('/tmp/evil.so')", "Function load_extension is not allowed")
+        self.assertRejected("SELECT READFILE('/etc/passwd')", "Function READFILE is not allowed")
+
+    def test_rejects_malformed_sql(self):
+        self.assertRejected("SELECT (1", "Unbalanced parentheses")
+        self.assertRejected("SELECT 'unterminated", "Unterminated")
+        self.assertRejected("SELECT 1 /* unterminated", "Unterminated")
+
+    def test_keywords_inside_literals_comments_and_names_are_allowed(self):
+        """The substring check this replaced rejected all of these."""
+        for sql in ["SELECT * FROM orders WHERE order_status = 'delete'",
+                    "SELECT 'a; DROP TABLE x' AS s",
+                    "SELECT order_id FROM orders -- ; DROP TABLE orders",
+                    "SELECT 1 /* ; DELETE FROM orders */",
+                    'SELECT "update" FROM orders',
+                    "SELECT review_creation_date AS created, review_answer_timestamp AS updated_at "
+                    "FROM order_reviews"]:
+            with self.subTest(sql=sql):
+                parse_sql(sql)
+
+    def test_statement_drops_trailing_semicolons(self):
+        parsed = parse_sql("  SELECT COUNT(*) FROM orders;;\n")
+        self.assertEqual(parsed.statement, "SELECT COUNT(*) FROM orders")
+
+    def test_tables_exclude_ctes_and_include_subqueries(self):
+        parsed = parse_sql("WITH recent AS (SELECT * FROM orders WHERE order_status = 'delivered') "
+                           "SELECT c.customer_city FROM recent r JOIN customers c USING (customer_id) "
+                           "WHERE r.order_id IN (SELECT order_id FROM order_items) "
+                           "UNION SELECT seller_city FROM (SELECT * FROM sellers) s")
+        self.assertEqual(parsed.tables, frozenset({"orders", "customers", "order_items", "sellers"}))
+        self.assertEqual(parsed.ctes, ("recent",))
+
+    def test_fingerprint_ignores_layout_case_and_literals(self):
+        a = parse_sql("SELECT * FROM orders WHERE order_status = 'delivered'")
+        b = parse_sql("select *\n  from ORDERS\n where order_status = 'shipped';")
+        self.assertEqual(a.fingerprint, b.fingerprint)
+        self.assertNotEqual(a.normalized, b.normalized)
+        self.assertNotEqual(a.fingerprint, parse_sql("SELECT * FROM orders WHERE order_id = 'x'").fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,128 +1,73 @@
+import os
 import unittest
-import sqlite3
-import re  # Import the regex module
-from structuredOutput.SQLQueryGeneratorWithJsonSchema import SQLQueryGeneratorWithJsonSchema
+
+from evals.eval_runner import CASSETTE_DIR, GoldSnapshots, load_cases, run_eval
+from src.utils.azure_client import config_for
+from src.utils.sql_equivalence import values_match
 
 
 class TestSQLQueryGenerator(unittest.TestCase):
-    """Test class to validate SQL query generation and execution using an Olist SQLite database."""
+    """
+    Runs every eval case through SQLQueryGeneratorWithJsonSchema and compares
+    the result of the generated SQL with the gold result.
+
+    Cases come from correct_queries.txt, or the JSONL/YAML file in EVAL_CASES;
+    add a case there instead of a test method here. LLM calls are recorded to
+    and replayed from evals/cassettes/json_schema.jsonl (EVAL_CASSETTE_MODE,
+    default "auto"), so once recorded the suite runs offline. Without that
+    cassette and without Azure OpenAI credentials the generation test is
+    skipped; the gold queries are still checked.
+    """
 
     @classmethod
     def setUpClass(cls):
-        """Set up the SQLite database connection before running tests."""
-        cls.db_path = "../entryAssignment/olist.sqlite"  # Path to the SQLite database file
-        cls.connection = sqlite3.connect(cls.db_path)
-        cls.cursor = cls.connection.cursor()
-        cls.sql_generator = SQLQueryGeneratorWithJsonSchema()
-
-    @classmethod
-    def tearDownClass(cls):
-        """Close the database connection after tests complete."""
-        cls.cursor.close()
-        cls.connection.close()
-
-    def execute_sql(self, sql_query):
-        """Helper function to execute SQL and fetch results."""
+        """Run all cases once, in a process pool, before the tests look at the results."""
+        cls.db_path = os.getenv("OLIST_DB_PATH", "../entryAssignment/olist.sqlite")  # Path to the SQLite database file
+        cls.cases = load_cases(os.getenv("EVAL_CASES"))
+        GoldSnapshots(cls.db_path).ensure(cls.cases)
+        cls.results, cls.skip_reason = None, cls.offline_skip_reason()
+        if cls.skip_reason is None:
+            cls.results = {r.id: r for r in run_eval(cls.cases, "json_schema",
+                                                     mode=os.getenv("EVAL_CASSETTE_MODE", "auto"),
+                                                     workers=int(os.getenv("EVAL_WORKERS", "4")),
+                                                     db_path=cls.db_path)}
+
+    @staticmethod
+    def offline_skip_reason():
+        """Why the LLM cannot be reached or replayed, or None when generation can run."""
+        mode, cassette = os.getenv("EVAL_CASSETTE_MODE", "auto"), CASSETTE_DIR / "json_schema.jsonl"
+        if mode == "replay" or (mode == "auto" and cassette.exists()):
+            return None if cassette.exists() else f"no recorded cassette at {cassette}"
         try:
-            self.cursor.execute(sql_query)
-            return self.cursor.fetchall()  # Fetch all rows
-        except sqlite3.Error as e:
-            self.fail(f"SQL execution failed: {e}")  # Fails test if SQL execution fails
-
-    def normalize_sql(self, sql):
-        """Helper function to remove extra spaces, newlines, and normalize SQL."""
-        return re.sub(r"\s+", " ", sql.strip()).lower()  # Replace multiple spaces with one & lowercase
-
-    def test_scenario1(self):
-        user_question = "Which seller has delivered the most orders to customers in Rio de Janeiro? [string: seller_id]"
-        steps, generated_query = self.sql_generator.generate_sql_query(user_question)
-
-        expected_sql_query = """
-        SELECT s.seller_id
-        FROM sellers s
-        JOIN order_items oi ON s.seller_id = oi.seller_id
-        JOIN orders o ON oi.order_id = o.order_id
-        JOIN customers c ON o.customer_id = c.customer_id
-        WHERE c.customer_city = 'rio de janeiro'
-        AND o.order_status = 'delivered'
-        GROUP BY s.seller_id
-        ORDER BY COUNT(DISTINCT o.order_id) DESC
-        LIMIT 1;
-        """
-
-        expected_seller_id = "4a3ca9315b744ce9f8e9374361493884"
-
-        print("\nGenerated SQL Query:")
-        print(generated_query)
-
-        # Normalize both queries before comparing
-        self.assertEqual(
-            self.normalize_sql(generated_query),
-            self.normalize_sql(expected_sql_query),
-            "Generated SQL does not match expected SQL."
-        )
-
-        try:
-            self.cursor.execute(generated_query)
-            result = self.cursor.fetchone()  # Fetch the first row
-
-            self.assertIsNotNone(result, "Query returned no results.")
-            actual_seller_id = result[0]  # Assuming seller_id is the first column
-
-            print("Seller ID from DB:", actual_seller_id)
-            self.assertEqual(expected_seller_id, actual_seller_id, "Seller ID does not match expected.")
-
-        except sqlite3.Error as e:
-            self.fail(f"Database execution failed: {e}")  # Fails test if SQL execution fails
-
-
-    """Test case failed: generated query has column name as avg_score instead of average_review_score"""
-    def test_scenario2(self):
-        user_question = "What's the average review score for products in the 'beleza_saude' category? [float: average_review_score]"
-        steps, generated_query = self.sql_generator.generate_sql_query(user_question)
-
-        expected_sql_query = """
-        SELECT 
-            ROUND(AVG(r.review_score), 2) as avg_score
-        FROM products p
-        JOIN order_items oi ON p.product_id = oi.product_id
-        JOIN order_reviews r ON oi.order_id = r.order_id
-        WHERE p.product_category_name = 'beleza_saude';
-        """
-
-        expected_average_review_score = 4.14
-
-        print("\nGenerated SQL Query:")
-        print(generated_query)
-
-        # Normalize both queries before comparing
-        self.assertEqual(
-            self.normalize_sql(generated_query),
-            self.normalize_sql(expected_sql_query),
-            "Generated SQL does not match expected SQL."
-        )
-
-        try:
-            self.cursor.execute(generated_query)
-            result = self.cursor.fetchone()  # Fetch the first row
-
-            self.assertIsNotNone(result, "Query returned no results.")
-            actual_average_review_score = result[0]  # Assuming avg_score is the first column
-
-            print("Average Review Score from DB:", actual_average_review_score)
-
-            # Round both values for comparison
-            self.assertEqual(
-                round(expected_average_review_score, 2),
-                round(actual_average_review_score, 2),
-                "Average review score does not match expected."
-            )
-
-        except sqlite3.Error as e:
-            self.fail(f"Database execution failed: {e}")  # Fails test if SQL execution fails
-
-
+            config_for()
+        except ValueError as e:
+            return (f"no recorded cassette at {cassette} and no credentials to record one ({e}); "
+                    f"set them and run with EVAL_CASSETTE_MODE=record")
+        return None
+
+    def test_gold_queries_match_recorded_answers(self):
+        """The gold SQL still returns the answer written next to it (catches DB or case drift)."""
+        gold = GoldSnapshots(self.db_path)
+        for case in self.cases:
+            if case.expected is None:
+                continue
+            with self.subTest(case=case.id):
+                df = gold.load(case)
+                self.assertFalse(df.empty, "Gold query returned no results.")
+                actual = df.iat[0, 0]
+                self.assertTrue(values_match(actual, case.expected), f"{actual!r} != {case.expected!r}")
+
+    def test_generated_sql_returns_gold_result(self):
+        """Execution accuracy: column names and order may differ (e.g. avg_score vs average_review_score)."""
+        if self.skip_reason is not None:
+            self.skipTest(self.skip_reason)
+        for case in self.cases:
+            with self.subTest(case=case.id, question=case.question):
+                result = self.results[case.id]
+                print(f"\n{case.id} generated SQL Query:\n{result.sql}")
+                self.assertNotEqual(result.status, "error", result.reason)
+                self.assertTrue(result.passed, f"Generated SQL does not return the gold result: {result.reason}")
 
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
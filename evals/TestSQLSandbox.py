@@ -0,0 +1,78 @@
+import sqlite3
+import unittest
+from dataclasses import replace
+
+from src.utils.sql_sandbox import DEFAULT_LIMITS, QueryGuardrailError, guarded
+
+TABLES = ("orders", "customers")
+COUNT_FOREVER = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+class TestSQLSandbox(unittest.TestCase):
+    """guarded() on an in-memory database: authorizer denials, the progress-handler abort and clean-up."""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.addCleanup(self.conn.close)
+        self.conn.executescript("""
+            CREATE TABLE orders (order_id TEXT, customer_id TEXT);
+            CREATE TABLE customers (customer_id TEXT, customer_city TEXT);
+            INSERT INTO orders VALUES ('o1', 'c1'), ('o2', 'c2');
+            INSERT INTO customers VALUES ('c1', 'sao paulo'), ('c2', 'recife');
+        """)
+
+    def run_guarded(self, sql, limits=DEFAULT_LIMITS):
+        with guarded(self.conn, sql, limits, known_tables=TABLES) as conn:
+            return conn.execute(sql).fetchall()
+
+    def assertStopped(self, sql, kind, limits=DEFAULT_LIMITS) -> QueryGuardrailError:
+        with self.assertRaises(QueryGuardrailError) as raised:
+            self.run_guarded(sql, limits)
+        self.assertEqual(raised.exception.kind, kind, raised.exception.message)
+        self.assertEqual(raised.exception.to_dict()["sql"], sql)
+        return raised.exception
+
+    def test_reads_of_known_tables_and_ctes_are_allowed(self):
+        rows = self.run_guarded("WITH o AS (SELECT * FROM orders) SELECT c.customer_city, COUNT(*) FROM o "
+                                "JOIN customers c USING (customer_id) GROUP BY 1 ORDER BY 1")
+        self.assertEqual(rows, [("recife", 1), ("sao paulo", 1)])
+
+    def test_writes_and_schema_access_are_denied(self):
+        # The action reported is the last one SQLite asked about: DROP TABLE also deletes from sqlite_master
+        for sql, actions in [("INSERT INTO orders VALUES ('o3', 'c1')", {"SQLITE_INSERT"}),
+                             ("DELETE FROM orders", {"SQLITE_DELETE"}),
+                             ("DROP TABLE orders", {"SQLITE_DROP_TABLE", "SQLITE_DELETE"}),
+                             ("ATTACH DATABASE ':memory:' AS other", {"SQLITE_ATTACH"}),
+                             ("PRAGMA table_info(orders)", {"SQLITE_PRAGMA"}),
+                             ("SELECT name FROM sqlite_master", {"SQLITE_READ"})]:
+            with self.subTest(sql=sql):
+                self.assertIn(self.assertStopped(sql, "denied").details["action"], actions)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM orders").fetchone(), (2,))
+
+    def test_allowed_tables_narrow_the_readable_tables(self):
+        limits = replace(DEFAULT_LIMITS, allowed_tables=frozenset({"orders"}))
+        self.assertEqual(self.run_guarded("SELECT COUNT(*) FROM orders", limits), [(2,)])
+        error = self.assertStopped("SELECT customer_city FROM customers", "denied", limits)
+        self.assertEqual(error.details, {"action": "SQLITE_READ", "target": "customers"})
+
+    def test_step_budget_aborts_a_runaway_query(self):
+        limits = replace(DEFAULT_LIMITS, max_vm_steps=50_000, check_every=1_000, timeout_seconds=30)
+        error = self.assertStopped(COUNT_FOREVER, "step_budget", limits)
+        self.assertGreater(error.details["steps"], 50_000)
+
+    def test_timeout_aborts_a_slow_query(self):
+        limits = replace(DEFAULT_LIMITS, timeout_seconds=0.2, max_vm_steps=10 ** 12)
+        error = self.assertStopped(COUNT_FOREVER, "timeout", limits)
+        self.assertLess(error.details["elapsed"], 2.0)
+
+    def test_plain_sql_errors_keep_their_type(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.run_guarded("SELECT no_such_column FROM orders")
+
+    def test_handlers_are_removed_after_the_block(self):
+        self.assertStopped("SELECT name FROM sqlite_master", "denied")
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone(), (2,))
+
+
+if __name__ == "__main__":
+    unittest.main()
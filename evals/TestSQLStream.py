@@ -0,0 +1,105 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from src.utils.sql_stream import JSONStringFieldDetector, SQLStatementDetector, read_sql_stream
+
+CHUNK_SIZES = (1, 3, 7)
+
+# Completion text -> the statement SQLStatementDetector must cut out of it
+COMPLETIONS = {
+    "```sql\nSELECT COUNT(*) FROM orders WHERE order_status = 'a;b';\n```\nThis counts; the orders.":
+        "SELECT COUNT(*) FROM orders WHERE order_status = 'a;b';",
+    "SELECT 1 -- not the end; still a comment\n, 2 FROM orders;":
+        "SELECT 1 -- not the end; still a comment\n, 2 FROM orders;",
+    "```sql\nSELECT /* ; */ order_id FROM orders\n```\nMore text; with a semicolon":
+        "SELECT /* ; */ order_id FROM orders",
+    'SELECT "a;b", [c;d] FROM orders; and then some prose':
+        'SELECT "a;b", [c;d] FROM orders;',
+    "Select the top category first. Then run:\nSELECT product_category_name FROM products LIMIT 1;":
+        "SELECT product_category_name FROM products LIMIT 1;",
+    "```\nWITH t AS (SELECT 1 AS x) SELECT x FROM t\n```":
+        "WITH t AS (SELECT 1 AS x) SELECT x FROM t",
+    "SELECT order_id FROM orders":
+        "SELECT order_id FROM orders",
+    "There is no query in this answer.":
+        None,
+}
+
+
+def feed_in_chunks(detector, text: str, size: int):
+    """Feed ``text`` ``size`` characters at a time; the first non-None result, else result() at the end."""
+    for i in range(0, len(text), size):
+        found = detector.feed(text[i:i + size])
+        if found is not None:
+            return found
+    return detector.result()
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeStream:
+    def __init__(self, text: str, size: int):
+        self.chunks = [chunk(None)] + [chunk(text[i:i + size]) for i in range(0, len(text), size)]
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for item in self.chunks:
+            self.read += 1
+            yield item
+
+    def close(self):
+        self.closed = True
+
+
+class TestSQLStream(unittest.TestCase):
+    """
+    The detectors decide where streamed SQL ends and the stream is closed
+    there, so a wrong cut executes truncated SQL. Every completion is fed at
+    several chunk sizes, which moves the chunk boundaries through literals,
+    comments, fences and escapes.
+    """
+
+    def test_statement_detector(self):
+        for text, expected in COMPLETIONS.items():
+            for size in CHUNK_SIZES:
+                with self.subTest(text=text, size=size):
+                    self.assertEqual(feed_in_chunks(SQLStatementDetector(), text, size), expected)
+
+    def test_json_field_detector_decodes_escapes_split_across_chunks(self):
+        sql = "SELECT order_status, COUNT(*) FROM orders WHERE order_status = \"x\" AND note = 'a\\b'\nGROUP BY 1;"
+        text = json.dumps({"steps": ["Count \"orders\""], "sql_query": sql, "explanation": "done"})
+        for size in CHUNK_SIZES:
+            with self.subTest(size=size):
+                detector = JSONStringFieldDetector()
+                self.assertEqual(feed_in_chunks(detector, text, size), sql)
+                self.assertFalse(detector.text.endswith("done\"}"))
+
+    def test_json_field_detector_without_the_field(self):
+        for size in CHUNK_SIZES:
+            with self.subTest(size=size):
+                self.assertIsNone(feed_in_chunks(JSONStringFieldDetector(), '{"steps": ["x"]}', size))
+
+    def test_read_sql_stream_closes_the_stream_after_the_statement(self):
+        text = "```sql\nSELECT COUNT(*) FROM orders;\n```\n" + "A long explanation. " * 20
+        for size in CHUNK_SIZES:
+            with self.subTest(size=size):
+                stream = FakeStream(text, size)
+                result = read_sql_stream(stream)
+                self.assertEqual(result.sql, "SELECT COUNT(*) FROM orders;")
+                self.assertTrue(result.cancelled and stream.closed)
+                self.assertLess(stream.read, len(stream.chunks))
+
+    def test_read_sql_stream_reads_to_the_end_without_a_terminator(self):
+        stream = FakeStream("SELECT order_id FROM orders", 3)
+        result = read_sql_stream(stream)
+        self.assertEqual(result.sql, "SELECT order_id FROM orders")
+        self.assertFalse(result.cancelled)
+        self.assertEqual(stream.read, len(stream.chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
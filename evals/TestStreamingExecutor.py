@@ -0,0 +1,84 @@
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from src.utils.db_pool import get_pool
+from src.utils.streaming_executor import ResultLimitExceeded, collect_query, stream_query
+
+
+class TestStreamingExecutor(unittest.TestCase):
+    """
+    stream_query / collect_query against a temporary SQLite file with its own
+    pool: chunking, the row and byte caps, truncation and the scalar path.
+    """
+
+    def setUp(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="streaming_executor_test_"))
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.db_path = str(self.workdir / "olist.sqlite")
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("CREATE TABLE orders (order_id TEXT, order_status TEXT)")
+            conn.executemany("INSERT INTO orders VALUES (?, ?)",
+                             [(f"o{i}", "delivered" if i % 3 else "shipped") for i in range(100)])
+        conn.close()
+        self.pool = get_pool(self.db_path, max_connections=1, acquire_timeout=2)
+        self.addCleanup(self.pool.close)
+
+    def test_stale_fingerprint_does_not_need_a_second_connection(self):
+        """With every pooled connection checked out, a changed file must not block on sqlite_master."""
+        self.assertEqual(collect_query("SELECT COUNT(*) FROM orders", db_path=self.db_path).iat[0, 0], 100)
+        time.sleep(0.01)    # the fingerprint starts from the file's mtime
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO orders VALUES ('o100', 'canceled')")
+        conn.close()
+
+        started = time.monotonic()
+        self.assertEqual(collect_query("SELECT COUNT(*) FROM orders", db_path=self.db_path).iat[0, 0], 101)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def stream(self, sql, **kwargs) -> list:
+        return list(stream_query(sql, output="rows", db_path=self.db_path, **kwargs))
+
+    def test_chunks_cover_the_whole_result(self):
+        chunks = self.stream("SELECT order_id FROM orders", chunk_size=30)
+        self.assertEqual([len(c) for c in chunks], [30, 30, 30, 10])
+        self.assertEqual(len(collect_query("SELECT * FROM orders", db_path=self.db_path, chunk_size=30)), 100)
+
+    def test_empty_result_keeps_its_columns(self):
+        df = collect_query("SELECT order_id, order_status FROM orders WHERE 0", db_path=self.db_path)
+        self.assertEqual((len(df), list(df.columns)), (0, ["order_id", "order_status"]))
+
+    def test_row_cap_raises(self):
+        with self.assertRaises(ResultLimitExceeded) as raised:
+            self.stream("SELECT order_id FROM orders", chunk_size=30, max_rows=50)
+        self.assertEqual((raised.exception.kind, raised.exception.limit), ("row", 50))
+
+    def test_byte_cap_raises(self):
+        with self.assertRaises(ResultLimitExceeded) as raised:
+            self.stream("SELECT order_id, order_status FROM orders", max_bytes=200)
+        self.assertEqual((raised.exception.kind, raised.exception.limit), ("byte", 200))
+
+    def test_truncate_stops_silently_at_the_cap(self):
+        rows = [row for chunk in self.stream("SELECT order_id FROM orders", chunk_size=30, max_rows=50,
+                                             truncate=True) for row in chunk]
+        self.assertEqual(rows, [(f"o{i}",) for i in range(50)])
+        df = collect_query("SELECT order_id, order_status FROM orders", db_path=self.db_path, max_bytes=200,
+                           truncate=True)
+        self.assertLess(len(df), 100)
+
+    def test_scalar_query_with_one_row_returns_it(self):
+        self.assertEqual(self.stream("SELECT COUNT(*) FROM orders", scalar=True), [[(100,)]])
+
+    def test_scalar_query_with_many_rows_streams_in_full(self):
+        """scalar=True must not cut a one-column, many-row result down to its first row."""
+        chunks = self.stream("SELECT order_id FROM orders", scalar=True, chunk_size=30)
+        self.assertEqual(sum(len(c) for c in chunks), 100)
+        with self.assertRaises(ResultLimitExceeded):
+            self.stream("SELECT order_id FROM orders", scalar=True, max_rows=50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,430 @@
+"""
+Data-driven evaluation of the SQL generators against gold results.
+
+    python -m evals.eval_runner [--cases cases.jsonl] [--generator json_schema] [--mode auto]
+                                [--few-shot retrieved] [--schema info2] [--model gpt-4o]
+                                [--cassette evals/cassettes/json_schema.jsonl] [--workers 4] [--archive]
+
+Generators are the SQL strategies of this repo: json_schema
+(SQLQueryGeneratorWithJsonSchema), pipeline (llm_sql_pipeline), pydantic
+(one ``parse`` call with SQLGeneration) and refine (the chat-history
+feedback loop).
+
+Cases come from entryAssignment/correct_queries.txt (default) or a JSONL /
+YAML file of {"id", "question", "sql", "expected"} records. Each gold query
+is executed once per database fingerprint and its result snapshotted under
+.cache/eval_gold, so later runs only execute the generated SQL. Cases run in
+a process pool; every worker records or replays its LLM calls through the
+cassette (src.utils.llm_cassette), so with a recorded cassette and
+``--mode replay`` a run needs neither credentials nor network.
+
+A generated query passes when its result equals the gold result (column
+names and order ignored, rounding tolerated, see src.utils.sql_equivalence). The report has
+execution accuracy plus LLM latency, execution time and token cost per case.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from src.utils.db_pool import get_pool
+from src.utils.query_backends import get_backend
+from src.utils.reference_queries import load_reference_cases
+from src.utils.sql_equivalence import values_match
+from src.utils.sql_parser import canonicalize, parse_sql
+
+GOLD_DIR = Path(".cache") / "eval_gold"
+CASSETTE_DIR = Path(__file__).resolve().parent / "cassettes"
+
+
+@dataclass
+class EvalCase:
+    id: str
+    question: str
+    sql: str
+    expected: str = None        # answer recorded with the gold SQL (first cell), if any
+    tags: list = field(default_factory=list)
+
+
+@dataclass
+class CaseResult:
+    id: str
+    question: str
+    status: str                 # pass, fail or error
+    reason: str = ""
+    sql: str = None
+    llm_seconds: float = 0.0    # recorded latency when replayed
+    llm_calls: int = 0
+    execute_ms: float = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: float = 0.0
+    model: str = None
+    prompt_hash: str = None     # messages of the first LLM request
+    gold_hash: str = None
+    result_hash: str = None     # result_signature of the generated SQL's result
+    reused: bool = False        # copied from an archived run instead of generated again
+
+    @property
+    def passed(self) -> bool:
+        return self.status == "pass"
+
+
+# === Cases ===
+def load_cases(path=None) -> list:
+    """Cases from a .jsonl / .yaml file, or the reference questions when ``path`` is None."""
+    if path is None:
+        return [EvalCase(f"ref-{i + 1:02d}", case.question, case.sql, case.expected_value)
+                for i, case in enumerate(load_reference_cases())]
+    path = Path(path)
+    if path.suffix in (".yaml", ".yml"):
+        import yaml  # optional; only needed for YAML case files
+
+        rows = yaml.safe_load(path.read_text(encoding="utf-8"))
+    else:
+        rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    return [EvalCase(str(row.get("id") or f"{path.stem}-{i + 1:02d}"), row["question"], row["sql"],
+                     None if row.get("expected") is None else str(row["expected"]), row.get("tags", []))
+            for i, row in enumerate(rows)]
+
+
+# === Gold snapshots ===
+class GoldSnapshots:
+    """Gold query results stored per database fingerprint; executed only when missing."""
+
+    def __init__(self, db_path: str = None, root=GOLD_DIR):
+        self.db_path = db_path
+        self.dir = Path(root) / get_pool(db_path).fingerprint()
+
+    def _path(self, case: EvalCase) -> Path:
+        return self.dir / f"{gold_hash(case)}.json"
+
+    def ensure(self, cases) -> int:
+        """Snapshot every gold result that is missing; returns how many were executed."""
+        executed = 0
+        for case in cases:
+            path = self._path(case)
+            if path.exists():
+                continue
+            df = get_backend(db_path=self.db_path).execute(parse_sql(case.sql).statement)
+            snapshot = json.loads(df.to_json(orient="split", index=False))
+            first = snapshot["data"][0][0] if snapshot["data"] and snapshot["data"][0] else None
+            if case.expected is not None and not values_match(first, case.expected):
+                logging.warning(f"Gold SQL of {case.id} returns {first!r}, recorded answer is {case.expected!r}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(snapshot), encoding="utf-8")
+            executed += 1
+        return executed
+
+    def load(self, case: EvalCase):
+        import pandas as pd
+
+        return pd.DataFrame(**json.loads(self._path(case).read_text(encoding="utf-8")))
+
+
+def gold_hash(case: EvalCase) -> str:
+    return canonicalize(case.sql).fingerprint
+
+
+# === Generators ===
+# Each takes the options ({"few_shot", "schema", "model"}, all optional) and
+# returns a Generator
+SCHEMAS = ("info2", "info", "compact")
+SQL_INSTRUCTIONS = "You are an expert in Olist's DB. Provide 1-3 short reasoning steps, then a final SQL."
+
+
+def _schema_text(schema: str = None, few_shot: str = None) -> str:
+    from structuredOutput.olist_dataset import OlistDatasetInfo
+
+    if schema == "info":
+        return OlistDatasetInfo.get_dataset_info()
+    if schema == "info2":
+        return OlistDatasetInfo.get_dataset_info2(include_examples=few_shot == "static")
+    return OlistDatasetInfo.get_compact_dataset_info()
+
+
+def _question_context(question: str, few_shot: str = None) -> str:
+    """Retrieved examples and database literals sent with the question."""
+    from structuredOutput.fewShotLearning import format_examples, get_example_store
+    from structuredOutput.queryExpansion import expand_question
+
+    context = []
+    if few_shot == "retrieved":
+        examples = get_example_store().top_k(question, int(os.getenv("OLIST_FEW_SHOT_K", "3")),
+                                             min_score=float(os.getenv("OLIST_FEW_SHOT_MIN_SCORE", "0.25")))
+        context.append(format_examples(examples))
+    if os.getenv("OLIST_QUERY_EXPANSION", "1") == "1":
+        context.append(expand_question(question).hint())
+    return "\n\n".join(filter(None, context))
+
+
+@dataclass
+class Generator:
+    generate: Callable          # EvalCase -> generated SQL
+    messages: Callable          # EvalCase -> messages of the first LLM request, hashed by the archive
+    model: str
+
+
+def _json_schema_generator(options: dict) -> Generator:
+    from structuredOutput.SQLQueryGeneratorWithJsonSchema import SQLQueryGeneratorWithJsonSchema
+
+    generator = SQLQueryGeneratorWithJsonSchema(few_shot=options.get("few_shot"),
+                                                schema=options.get("schema") or "info2",
+                                                model=options.get("model") or "gpt-4o")
+    return Generator(lambda case: generator.generate_sql_query(case.question)[1],
+                     lambda case: generator.build_messages(case.question), generator.model)
+
+
+def _pipeline_generator(options: dict) -> Generator:
+    from entryAssignment import llm_sql_pipeline as pipeline
+
+    if options.get("model"):
+        pipeline.deployment = options["model"]
+    schema, few_shot = options.get("schema") or "compact", options.get("few_shot")
+    if schema == "compact" and few_shot != "retrieved":
+        hint = lambda case: pipeline.get_schema_hint(case.question)
+    else:
+        # Other schema texts are sent whole with the question, as in benchmarks.schema_prompt_benchmark
+        pipeline.prompt_layout = "pruned"
+        text = _schema_text(schema, few_shot)
+        hint = lambda case: "\n\n".join(filter(None, [text, _question_context(case.question, few_shot)]))
+    return Generator(lambda case: pipeline.generate_sql_from_prompt(case.question, hint(case), stream=False),
+                     lambda case: pipeline.build_messages(case.question, hint(case)), pipeline.deployment)
+
+
+def _chat_history_module(options: dict):
+    from structuredOutput import SQLQueryGeneratorWithChatHistory as chat_history
+
+    if options.get("model"):
+        chat_history.azure_openai_model = options["model"]
+    schema = _schema_text(options.get("schema") or "info2", options.get("few_shot"))
+    return chat_history, f"{SQL_INSTRUCTIONS}\n\nDataset info:\n{schema}"
+
+
+def _with_context(question: str, few_shot: str = None) -> str:
+    context = _question_context(question, few_shot)
+    return f"{context}\n\nQuestion:\n{question}" if context else question
+
+
+def _pydantic_generator(options: dict) -> Generator:
+    """One ``beta.chat.completions.parse`` call with the SQLGeneration model."""
+    from src.utils.azure_client import get_client
+
+    chat_history, system_prompt = _chat_history_module(options)
+
+    def messages(case):
+        return [{"role": "system", "content": system_prompt},
+                {"role": "user", "content": _with_context(case.question, options.get("few_shot"))}]
+
+    def generate(case):
+        completion = get_client().beta.chat.completions.parse(
+            model=chat_history.azure_openai_model, messages=messages(case),
+            response_format=chat_history.SQLGeneration)
+        return completion.choices[0].message.parsed.sql_query
+
+    return Generator(generate, messages, chat_history.azure_openai_model)
+
+
+def _refine_generator(options: dict) -> Generator:
+    """
+    The chat-history loop: parse, execute, and on a wrong result retry with the
+    LLM's explanation as feedback. It grades against the gold SQL, so its
+    accuracy is an upper bound; what it costs shows in calls per answer.
+    """
+    chat_history, system_prompt = _chat_history_module(options)
+
+    def generate(case):
+        with contextlib.redirect_stdout(io.StringIO()):   # the loop prints its attempts for interactive use
+            sql, _ = chat_history.refine_sql_with_feedback(_with_context(case.question, options.get("few_shot")),
+                                                           case.sql, system_prompt, retry_delay=0.0)
+        return sql
+
+    return Generator(generate, _pydantic_generator(options).messages, chat_history.azure_openai_model)
+
+
+GENERATORS = {"json_schema": _json_schema_generator, "pipeline": _pipeline_generator,
+              "pydantic": _pydantic_generator, "refine": _refine_generator}
+
+# Per worker process, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(generator: str, options: dict, cassette_path: str, mode: str, db_path: str):
+    from src.utils import llm_cassette
+
+    if mode != "live":
+        llm_cassette.activate(cassette_path, mode, persist=False)
+        if mode == "replay":
+            # Replays never reach the endpoint, but the clients still need settings to be built
+            for name, value in (("AZURE_OPENAI_ENDPOINT", "https://cassette.invalid"), ("OPENAI_API_KEY", "replay"),
+                                ("DH_ENDPOINT", "https://cassette.invalid"), ("DH_API_KEY", "replay")):
+                os.environ.setdefault(name, value)
+    _worker.update(generator=GENERATORS[generator](options), db_path=db_path, gold=GoldSnapshots(db_path))
+    get_backend(db_path=db_path)    # opened here so the first case's execution time is the query's own
+
+
+def _error_message(e: Exception) -> str:
+    # The SDK wraps transport errors (e.g. a cassette miss) in a generic "Connection error."
+    while e.__cause__ is not None:
+        e = e.__cause__
+    return f"{type(e).__name__}: {e}"
+
+
+def prompt_key(case: EvalCase) -> tuple:
+    """(prompt hash, model) of a case in a worker, computed without calling the LLM."""
+    from src.utils.prompt_builder import messages_hash
+
+    generator = _worker["generator"]
+    return messages_hash(generator.messages(case)), generator.model
+
+
+def run_case(case: EvalCase) -> tuple:
+    """Generate, execute and grade one case in a worker; returns (CaseResult, new cassette entries)."""
+    from src.utils import llm_cassette, llmstats
+    from src.utils.sql_equivalence import compare_results, is_ordered, result_signature
+
+    cassette = llm_cassette.active_cassette()
+    llmstats.reset()
+    before = cassette.stats()["latency_total"] if cassette else 0.0
+    result = CaseResult(case.id, case.question, "error", gold_hash=gold_hash(case))
+    started = time.perf_counter()
+    try:
+        result.prompt_hash, result.model = prompt_key(case)
+        result.sql = _worker["generator"].generate(case)
+    except Exception as e:
+        result.reason = f"generation failed: {_error_message(e)}"
+    llm_seconds = time.perf_counter() - started
+
+    usage = llmstats.summary().values()
+    result.llm_calls = sum(u["requests"] for u in usage)
+    for name in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        setattr(result, name, sum(u[name] for u in usage))
+    result.cost_usd = round(sum(u["cost_usd"] for u in usage), 6)
+    result.llm_seconds = round(cassette.stats()["latency_total"] - before if cassette else llm_seconds, 4)
+
+    if result.sql is not None:
+        try:
+            started = time.perf_counter()
+            df = get_backend(db_path=_worker["db_path"]).execute(parse_sql(result.sql).statement)
+            result.execute_ms = round((time.perf_counter() - started) * 1000, 2)
+            result.result_hash = result_signature(df)
+            verdict = compare_results(df, _worker["gold"].load(case), ordered=is_ordered(case.sql))
+            result.status = "pass" if verdict.equivalent else "fail"
+            result.reason = verdict.reason
+        except Exception as e:
+            result.reason = f"execution failed: {_error_message(e)}"
+    return result, cassette.drain() if cassette else []
+
+
+def run_eval(cases, generator: str = "json_schema", options: dict = None, cassette_path=None, mode: str = "auto",
+             workers: int = 4, db_path: str = None, archive=None) -> list:
+    """
+    Run ``cases`` in a process pool; new cassette recordings are saved by this
+    process. With a QueryArchive (evals.query_archive) only cases whose
+    generator, options, prompt, model, gold SQL or database changed since they
+    were archived are run, and the results are archived as a new run.
+    """
+    from src.utils.llm_cassette import Cassette
+
+    cassette_path = Path(cassette_path or CASSETTE_DIR / f"{generator}.jsonl")
+    snapshots = GoldSnapshots(db_path)
+    executed = snapshots.ensure(cases)
+    logging.info(f"Gold snapshots in {snapshots.dir}: {executed} executed, {len(cases) - executed} reused")
+
+    fingerprint = get_pool(db_path).fingerprint()
+    archived = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(generator, options or {}, str(cassette_path), mode, db_path)) as pool:
+        if archive is not None:
+            for case, (prompt_hash, model) in zip(cases, pool.map(prompt_key, cases)):
+                result = archive.lookup(case.id, gold_hash(case), prompt_hash, model, fingerprint, generator, options)
+                if result is not None:
+                    archived[case.id] = result
+            logging.info(f"Archive {archive.path}: {len(archived)} of {len(cases)} cases unchanged, "
+                         f"running {len(cases) - len(archived)}")
+        outcomes = list(pool.map(run_case, [case for case in cases if case.id not in archived]))
+    recorded = [entry for _, entries in outcomes for entry in entries]
+    if recorded:
+        Cassette(cassette_path, "record").add(recorded)
+        logging.info(f"Recorded {len(recorded)} LLM responses to {cassette_path}")
+
+    fresh = {result.id: result for result, _ in outcomes}
+    results = [archived.get(case.id) or fresh[case.id] for case in cases]
+    if archive is not None:
+        run_id = archive.add_run(generator, options or {}, fingerprint, results)
+        logging.info(f"Archived as run {run_id}")
+    return results
+
+
+# === Reporting ===
+def summarize(results) -> dict:
+    latencies = sorted(r.llm_seconds for r in results)
+    pct = lambda q: round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 3) if latencies else 0.0
+    passed = sum(r.passed for r in results)
+    return {"cases": len(results), "passed": passed, "failed": sum(r.status == "fail" for r in results),
+            "errors": sum(r.status == "error" for r in results),
+            "execution_accuracy": round(passed / len(results), 4) if results else 0.0,
+            "llm_seconds_p50": pct(0.5), "llm_seconds_p95": pct(0.95),
+            "execute_ms_mean": round(statistics.mean([r.execute_ms for r in results if r.execute_ms is not None]
+                                                     or [0.0]), 2),
+            "llm_calls": sum(r.llm_calls for r in results),
+            "prompt_tokens": sum(r.prompt_tokens for r in results),
+            "completion_tokens": sum(r.completion_tokens for r in results),
+            "cost_usd": round(sum(r.cost_usd for r in results), 6)}
+
+
+def print_report(results):
+    print(f"{'case':<10} {'status':<6} {'llm s':>6} {'exec ms':>8} {'prompt':>7} {'compl':>6} {'cost $':>9}  reason")
+    for r in results:
+        exec_ms = f"{r.execute_ms:.1f}" if r.execute_ms is not None else "-"
+        print(f"{r.id:<10} {r.status:<6} {r.llm_seconds:>6.2f} {exec_ms:>8} {r.prompt_tokens:>7} "
+              f"{r.completion_tokens:>6} {r.cost_usd:>9.5f}  {'[archived] ' if r.reused else ''}{r.reason}")
+    summary = summarize(results)
+    print(f"\nexecution accuracy {summary['passed']}/{summary['cases']} ({summary['execution_accuracy']:.0%}), "
+          f"{summary['errors']} errors, LLM p50 {summary['llm_seconds_p50']}s / p95 {summary['llm_seconds_p95']}s, "
+          f"{summary['prompt_tokens'] + summary['completion_tokens']} tokens, ${summary['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", help="JSONL or YAML case file (default: correct_queries.txt)")
+    parser.add_argument("--generator", choices=sorted(GENERATORS), default="json_schema")
+    parser.add_argument("--few-shot", choices=("none", "static", "retrieved"))
+    parser.add_argument("--schema", choices=SCHEMAS, help="dataset description in the prompt")
+    parser.add_argument("--model", help="deployment (default: the generator's)")
+    parser.add_argument("--cassette", help="default: evals/cassettes/<generator>.jsonl")
+    parser.add_argument("--mode", choices=("replay", "record", "auto", "live"), default="auto")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write the per-case results and summary as JSON")
+    parser.add_argument("--archive", nargs="?", const=True,
+                        help="archive the run and only re-run changed cases (default file: EVAL_ARCHIVE)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    options = {"few_shot": args.few_shot, "schema": args.schema, "model": args.model}
+    archive = None
+    if args.archive:
+        from evals.query_archive import DEFAULT_ARCHIVE_PATH, QueryArchive
+
+        archive = QueryArchive(DEFAULT_ARCHIVE_PATH if args.archive is True else args.archive)
+    results = run_eval(load_cases(args.cases), args.generator, options, args.cassette, args.mode, args.workers,
+                       archive=archive)
+    print_report(results)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps({"summary": summarize(results),
+                                                 "cases": [asdict(r) for r in results]}, indent=2),
+                                     encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Archive of every generated query, for incremental evaluation and run diffs.
+
+    python -m evals.eval_runner --archive            # archive a run, re-running only changed cases
+    python -m evals.query_archive runs
+    python -m evals.query_archive show [RUN]
+    python -m evals.query_archive diff [OLD_RUN NEW_RUN]    # default: the last two runs
+
+The archive is a SQLite file (EVAL_ARCHIVE, default .cache/query_archive.sqlite).
+``runs`` has one row per evaluation run. ``queries`` has one row per case
+and run: question, generated SQL, model, prompt hash, gold hash, database
+fingerprint, timings, tokens and the result hash
+(src.utils.sql_equivalence.result_signature).
+
+A case is generated again only when its generator, generator options,
+prompt, model, gold SQL or the database fingerprint differs from its last
+archived pass or fail. Errors are always retried. Reused results are copied
+into the new run, so every run is complete and a diff compares two runs row
+by row.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+from evals.eval_runner import CaseResult, print_report
+
+DEFAULT_ARCHIVE_PATH = os.getenv("EVAL_ARCHIVE", ".cache/query_archive.sqlite")
+
+# CaseResult fields stored per query, in column order
+RESULT_COLUMNS = [f.name for f in fields(CaseResult)]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    generator TEXT NOT NULL,
+    options TEXT NOT NULL,
+    db_fingerprint TEXT NOT NULL,
+    cases INTEGER NOT NULL,
+    passed INTEGER NOT NULL,
+    reused INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queries (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    db_fingerprint TEXT NOT NULL,
+    {", ".join(RESULT_COLUMNS)},
+    PRIMARY KEY (run_id, id)
+);
+CREATE INDEX IF NOT EXISTS queries_by_inputs ON queries (id, prompt_hash, model, gold_hash, db_fingerprint);
+"""
+
+
+@dataclass
+class Change:
+    id: str
+    kind: str                   # regressed, fixed, changed (same status, different result), new or removed
+    before: CaseResult = None
+    after: CaseResult = None
+
+
+# Regressions first in a diff
+CHANGE_ORDER = ("regressed", "fixed", "changed", "new", "removed")
+
+
+class QueryArchive:
+    def __init__(self, path=DEFAULT_ARCHIVE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _result(row) -> CaseResult:
+        result = CaseResult(**{name: row[name] for name in RESULT_COLUMNS})
+        result.reused = bool(result.reused)
+        return result
+
+    def lookup(self, case_id: str, gold_hash: str, prompt_hash: str, model: str, db_fingerprint: str,
+               generator: str, options: dict):
+        """
+        The latest pass/fail of a case generated from the same inputs by the
+        same generator and options, marked reused; None if there is none.
+        Generators can share a first prompt (refine starts from pydantic's).
+        """
+        row = self.conn.execute(
+            "SELECT queries.* FROM queries JOIN runs ON runs.run_id = queries.run_id "
+            "WHERE queries.id = ? AND queries.gold_hash = ? AND queries.prompt_hash = ? AND queries.model = ? "
+            "AND queries.db_fingerprint = ? AND queries.status != 'error' AND runs.generator = ? "
+            "AND runs.options = ? ORDER BY queries.run_id DESC LIMIT 1",
+            (case_id, gold_hash, prompt_hash, model, db_fingerprint, generator,
+             json.dumps(options or {}, sort_keys=True))).fetchone()
+        if row is None:
+            return None
+        result = self._result(row)
+        result.reused = True
+        return result
+
+    def add_run(self, generator: str, options: dict, db_fingerprint: str, results) -> int:
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (created_at, generator, options, db_fingerprint, cases, passed, reused) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), generator, json.dumps(options or {}, sort_keys=True), db_fingerprint, len(results),
+                 sum(r.passed for r in results), sum(r.reused for r in results))).lastrowid
+            self.conn.executemany(
+                f"INSERT INTO queries VALUES (?, ?, {', '.join('?' for _ in RESULT_COLUMNS)})",
+                [(run_id, db_fingerprint, *(getattr(r, name) for name in RESULT_COLUMNS)) for r in results])
+        return run_id
+
+    def runs(self, limit: int = 20) -> list:
+        return [dict(row) for row in self.conn.execute(
+            "SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", (limit,))]
+
+    def last_runs(self, count: int = 2) -> list:
+        """Ids of the latest ``count`` runs, oldest first."""
+        return [run["run_id"] for run in reversed(self.runs(count))]
+
+    def results(self, run_id: int) -> list:
+        return [self._result(row) for row in self.conn.execute(
+            "SELECT * FROM queries WHERE run_id = ? ORDER BY id", (run_id,))]
+
+    def diff(self, old_run: int, new_run: int) -> list:
+        """Cases whose status or result differs between two runs, regressions first."""
+        before = {r.id: r for r in self.results(old_run)}
+        after = {r.id: r for r in self.results(new_run)}
+        changes = []
+        for case_id in sorted(before.keys() | after.keys()):
+            old, new = before.get(case_id), after.get(case_id)
+            if old is None or new is None:
+                kind = "new" if old is None else "removed"
+            elif old.passed != new.passed:
+                kind = "fixed" if new.passed else "regressed"
+            elif old.status != new.status or old.result_hash != new.result_hash:
+                kind = "changed"
+            else:
+                continue
+            changes.append(Change(case_id, kind, old, new))
+        return sorted(changes, key=lambda change: CHANGE_ORDER.index(change.kind))
+
+    def close(self):
+        self.conn.close()
+
+
+def print_diff(changes, old_run: int, new_run: int):
+    if not changes:
+        print(f"runs {old_run} and {new_run} give the same answers")
+        return
+    print(f"{'case':<10} {'change':<10} {'before':<7} {'after':<7} reason")
+    for change in changes:
+        before = change.before.status if change.before else "-"
+        after = change.after.status if change.after else "-"
+        reason = change.after.reason if change.after else ""
+        print(f"{change.id:<10} {change.kind:<10} {before:<7} {after:<7} {reason}")
+        if change.kind in ("regressed", "changed") and change.before.sql != change.after.sql:
+            print(f"    before: {' '.join(change.before.sql.split()) if change.before.sql else '-'}")
+            print(f"    after:  {' '.join(change.after.sql.split()) if change.after.sql else '-'}")
+    counts = {kind: sum(c.kind == kind for c in changes) for kind in CHANGE_ORDER}
+    print("\n" + ", ".join(f"{count} {kind}" for kind, count in counts.items() if count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("runs", "show", "diff"))
+    parser.add_argument("run_ids", nargs="*", type=int)
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_PATH)
+    args = parser.parse_args()
+
+    archive = QueryArchive(args.archive)
+    if args.command == "runs":
+        print(f"{'run':>4} {'created':<19} {'generator':<12} {'passed':>7} {'reused':>7}  options")
+        for run in archive.runs():
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run["created_at"]))
+            print(f"{run['run_id']:>4} {created:<19} {run['generator']:<12} "
+                  f"{run['passed']:>3}/{run['cases']:<3} {run['reused']:>7}  {run['options']}")
+    elif args.command == "show":
+        run_ids = args.run_ids or archive.last_runs(1)
+        if not run_ids:
+            parser.error("the archive has no runs")
+        print_report(archive.results(run_ids[0]))
+    else:
+        run_ids = args.run_ids or archive.last_runs(2)
+        if len(run_ids) != 2:
+            parser.error("diff needs two runs")
+        print_diff(archive.diff(*run_ids), *run_ids)
+
+
+if __name__ == "__main__":
+    main()
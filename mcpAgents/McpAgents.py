@@ -1,32 +1,21 @@
-import os
 import asyncio
 from typing import Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
-from openai import AzureOpenAI, AsyncAzureOpenAI
-
 from agents import Agent, Runner, OpenAIChatCompletionsModel
 from agents.mcp import MCPServerSse
 from unstructuredChecklist.ResumeChecklist import ResumeChecklist
+from src.utils.azure_client import deployment_for, get_async_client, get_client
 
 # Load environment variables from .env file
 load_dotenv()
 
-# API configuration settings
-AZURE_ENDPOINT = os.getenv("DH_ENDPOINT")
-AZURE_API_KEY = os.getenv("DH_API_KEY")
+# API configuration settings (DH_ENDPOINT / DH_API_KEY); clients come from the shared registry
+LLM_PROFILE = "dh"
 MODEL_NAME = "gpt-4o"
-DEPLOYMENT_NAME = "gpt-4o"
-API_VERSION = "2024-12-01-preview"
-
-# Synchronous client for hiring decision
-sync_openai_client = AzureOpenAI(
-    api_version=API_VERSION,
-    azure_endpoint=AZURE_ENDPOINT,
-    api_key=AZURE_API_KEY
-)
+DEPLOYMENT_NAME = deployment_for(LLM_PROFILE)
 
 
 # Pydantic model to validate structured decision response
@@ -44,7 +33,7 @@ def evaluate_candidate(job_description: str, applicant_data: ResumeChecklist):
         Be precise and base your judgment on the provided data alone.
     """
 
-    completion = sync_openai_client.chat.completions.create(
+    completion = get_client(LLM_PROFILE).chat.completions.create(
         model=DEPLOYMENT_NAME,
         messages=[
             {"role": "system", "content": system_instruction},
@@ -79,11 +68,7 @@ async def run_hiring_assistant():
     )
 
     try:
-        async_client = AsyncAzureOpenAI(
-            api_version=API_VERSION,
-            azure_endpoint=AZURE_ENDPOINT,
-            api_key=AZURE_API_KEY
-        )
+        async_client = get_async_client(LLM_PROFILE)
 
         await mcp_server.connect()
 
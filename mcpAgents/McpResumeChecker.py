@@ -3,6 +3,11 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
+from src.utils import llmstats
+from src.utils.azure_client import deployment_for, get_client
+
+azure_openai_model = deployment_for()
+
 app = FastAPI(title="Resume APP")
 
 class ResumeChecklist(BaseModel):
@@ -30,14 +35,15 @@ async def resume_check(input: str):
 
 
 def extract_resume_data(input: str):
-    response = client.beta.chat.completions.parse(
-        model=azure_openai_model,
-        messages=[
-            {"role": "system", "content": "Extract structured details from the resume provided by the user."},
-            {"role": "user", "content": input},
-        ],
-        response_format=ResumeChecklist
-    )
-    llmstats.record_usage(input, response.usage)
+    # Tokens and latency are recorded by the client's llmstats hooks under this name
+    with llmstats.call_site("resume_check"):
+        response = get_client().beta.chat.completions.parse(
+            model=azure_openai_model,
+            messages=[
+                {"role": "system", "content": "Extract structured details from the resume provided by the user."},
+                {"role": "user", "content": input},
+            ],
+            response_format=ResumeChecklist
+        )
     return response.choices[0].message.parsed
 
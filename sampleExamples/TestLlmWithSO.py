@@ -1,19 +1,11 @@
-from openai import AzureOpenAI
-import dotenv
+from src.utils.azure_client import deployment_for, get_client
 import os
 import json
 
-dotenv.load_dotenv() #looks in the same dir for a .env file
-azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-openai_api_key = os.getenv("OPENAI_API_KEY")
 azure_openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-azure_openai_model = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+azure_openai_model = deployment_for()
 
-client = AzureOpenAI(
-    azure_endpoint=azure_endpoint,
-    api_key=openai_api_key,
-    api_version=azure_openai_api_version
-)
+client = get_client()  # shared client, reads AZURE_OPENAI_* / OPENAI_API_KEY (.env is loaded there)
 
 completion = client.beta.chat.completions.parse(
     model=azure_openai_api_version,
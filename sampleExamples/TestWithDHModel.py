@@ -1,18 +1,11 @@
-import os
-from openai import AzureOpenAI
+from src.utils.azure_client import deployment_for, get_client
 
-# Configuration
-endpoint = os.getenv("DH_ENDPOINT")
+# Configuration (DH_ENDPOINT / DH_API_KEY)
 model_name = "gpt-4o"
-deployment = "gpt-4o"
-api_version = "2024-12-01-preview"
+deployment = deployment_for("dh")
 
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=os.getenv("DH_API_KEY")
-)
+# Shared Azure OpenAI client
+client = get_client("dh")
 
 # Create chat completion
 response = client.chat.completions.create(
@@ -0,0 +1,260 @@
+"""
+Shared Azure OpenAI clients.
+
+    from src.utils.azure_client import get_client, get_async_client, deployment_for
+
+    client = get_client("dh")          # DH_ENDPOINT / DH_API_KEY
+    client = get_client()              # AZURE_OPENAI_* / OPENAI_API_KEY
+
+Clients are built on first use, once per (endpoint, api_version, key), so
+importing a module never needs credentials. All clients for the same key
+share one tuned httpx connection pool (keep-alive, HTTP/2 when ``h2`` is
+installed) and report request counts and latencies to client_metrics().
+Requests go through the retry / circuit breaker / hedging / deadline
+transport from src.utils.llm_resilience, so the SDK's own retries are off,
+and tokens, cost and latency of every call are recorded by src.utils.llmstats.
+While a cassette from src.utils.llm_cassette is active, new clients record
+or replay their traffic through it.
+
+``client`` and ``azure_openai_model`` are also available as lazy module
+attributes for scripts that import them directly.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+
+import dotenv
+import httpx
+from openai import AzureOpenAI, AsyncAzureOpenAI
+
+from src.utils import llmstats
+from src.utils.llm_cassette import AsyncCassetteTransport, CassetteTransport, active_cassette
+from src.utils.llm_resilience import AsyncResilientTransport, ResilientTransport
+
+dotenv.load_dotenv()
+
+# Credential sets used in this repo: the DH gateway (entryAssignment, mcpAgents,
+# unstructuredChecklist) and a plain Azure OpenAI resource (structuredOutput)
+PROFILES = {
+    "dh": {"endpoint": "DH_ENDPOINT", "api_key": "DH_API_KEY", "api_version": "DH_API_VERSION",
+           "deployment": "DH_DEPLOYMENT"},
+    "azure": {"endpoint": "AZURE_OPENAI_ENDPOINT", "api_key": "OPENAI_API_KEY",
+              "api_version": "AZURE_OPENAI_API_VERSION", "deployment": "AZURE_OPENAI_DEPLOYMENT"},
+}
+PROFILE_DEFAULTS = {"api_version": "2024-12-01-preview", "deployment": "gpt-4o"}
+DEFAULT_PROFILE = "azure"
+
+# === HTTP pool tuning ===
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=90.0)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+@dataclass(frozen=True)
+class ClientConfig:
+    endpoint: str
+    api_key: str
+    api_version: str
+    deployment: str
+
+    @property
+    def key(self) -> tuple:
+        # The API key is hashed so metrics and logs never carry it
+        return self.endpoint, self.api_version, hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def config_for(profile: str = DEFAULT_PROFILE) -> ClientConfig:
+    """Read a profile's settings from the environment; raises ValueError when incomplete."""
+    names = PROFILES[profile]
+    values = {field_: os.getenv(env) or PROFILE_DEFAULTS.get(field_) for field_, env in names.items()}
+    missing = [names[f] for f in ("endpoint", "api_key") if not values[f]]
+    if missing:
+        raise ValueError(f"Missing required Azure OpenAI environment variables: {', '.join(missing)}")
+    return ClientConfig(**values)
+
+
+def deployment_for(profile: str = DEFAULT_PROFILE) -> str:
+    """Deployment (model) name of a profile; needs no credentials."""
+    return os.getenv(PROFILES[profile]["deployment"]) or PROFILE_DEFAULTS["deployment"]
+
+
+# === Metrics ===
+@dataclass
+class ClientMetrics:
+    """
+    Request counters and latency (time to response headers) for one client
+    key. ``errors`` counts error statuses and requests that raised instead of
+    returning a response (by exception name in ``exception_counts``).
+    """
+    requests: int = 0
+    responses: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    status_counts: dict = field(default_factory=dict)
+    exception_counts: dict = field(default_factory=dict)
+    recent: deque = field(default_factory=lambda: deque(maxlen=1000), repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def started(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finished(self, status: int, latency: float):
+        with self.lock:
+            self.responses += 1
+            self.in_flight -= 1
+            self.errors += status >= 400
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.recent.append(latency)
+
+    def raised(self, error: Exception):
+        with self.lock:
+            self.in_flight -= 1
+            self.errors += 1
+            name = type(error).__name__
+            self.exception_counts[name] = self.exception_counts.get(name, 0) + 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            recent = sorted(self.recent)
+        pct = lambda q: round(recent[min(int(q * len(recent)), len(recent) - 1)], 4) if recent else 0.0
+        return {"requests": self.requests, "responses": self.responses, "errors": self.errors,
+                "in_flight": self.in_flight, "status_counts": dict(self.status_counts),
+                "exception_counts": dict(self.exception_counts),
+                "latency_mean": round(self.latency_total / self.responses, 4) if self.responses else 0.0,
+                "latency_p50": pct(0.5), "latency_p95": pct(0.95), "latency_max": round(self.latency_max, 4)}
+
+
+# === Registry ===
+_lock = threading.Lock()
+_metrics = {}
+_http_clients = {}
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()   # event loop -> {key: client}
+
+
+def _metrics_for(key: tuple) -> ClientMetrics:
+    with _lock:
+        return _metrics.setdefault(key, ClientMetrics())
+
+
+class MeteredTransport(httpx.BaseTransport):
+    """Outermost transport of a shared client: counts every request once, however it ends."""
+
+    def __init__(self, metrics: ClientMetrics, transport: httpx.BaseTransport):
+        self.metrics = metrics
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.started()
+        started = time.perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException as e:
+            self.metrics.raised(e)
+            raise
+        self.metrics.finished(response.status_code, time.perf_counter() - started)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, metrics: ClientMetrics, transport: httpx.AsyncBaseTransport):
+        self.metrics = metrics
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.started()
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:      # cancellation of a hedged or timed-out call ends it too
+            self.metrics.raised(e)
+            raise
+        self.metrics.finished(response.status_code, time.perf_counter() - started)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def get_client(profile: str = DEFAULT_PROFILE, config: ClientConfig = None) -> AzureOpenAI:
+    """Shared sync client for a profile (or an explicit config)."""
+    config = config or config_for(profile)
+    with _lock:
+        client = _clients.get(config.key)
+        if client is None:
+            metrics = _metrics.setdefault(config.key, ClientMetrics())
+            transport = ResilientTransport(httpx.HTTPTransport(http2=HTTP2, limits=HTTP_LIMITS))
+            if active_cassette():
+                transport = CassetteTransport(active_cassette(), transport)
+            http_client = _http_clients[config.key] = httpx.Client(
+                transport=MeteredTransport(metrics, transport), timeout=HTTP_TIMEOUT,
+                event_hooks=llmstats.event_hooks(False))
+            client = _clients[config.key] = AzureOpenAI(
+                azure_endpoint=config.endpoint, api_key=config.api_key, api_version=config.api_version,
+                http_client=http_client, max_retries=0)
+            logging.info(f"Created Azure OpenAI client for {config.endpoint} (HTTP/2: {HTTP2})")
+        return client
+
+
+def get_async_client(profile: str = DEFAULT_PROFILE, config: ClientConfig = None) -> AsyncAzureOpenAI:
+    """
+    Shared async client for a profile. httpx async pools are tied to the event
+    loop that opened them, so there is one client per running loop.
+    """
+    config = config or config_for(profile)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(config.key)
+        if client is None:
+            metrics = _metrics.setdefault(config.key, ClientMetrics())
+            transport = AsyncResilientTransport(httpx.AsyncHTTPTransport(http2=HTTP2, limits=HTTP_LIMITS))
+            if active_cassette():
+                transport = AsyncCassetteTransport(active_cassette(), transport)
+            http_client = httpx.AsyncClient(transport=AsyncMeteredTransport(metrics, transport),
+                                            timeout=HTTP_TIMEOUT, event_hooks=llmstats.event_hooks(True))
+            client = per_loop[config.key] = AsyncAzureOpenAI(
+                azure_endpoint=config.endpoint, api_key=config.api_key, api_version=config.api_version,
+                http_client=http_client, max_retries=0)
+        return client
+
+
+def client_metrics() -> dict:
+    """Metrics per client, keyed "endpoint (api_version, key hash)"."""
+    with _lock:
+        items = list(_metrics.items())
+    return {f"{endpoint} ({version}, {key_hash})": metrics.as_dict()
+            for (endpoint, version, key_hash), metrics in items}
+
+
+def close_clients():
+    with _lock:
+        for http_client in _http_clients.values():
+            http_client.close()
+        _http_clients.clear()
+        _clients.clear()
+
+
+def __getattr__(name: str):
+    # Lazy module attributes kept for `from src.utils.azure_client import client, azure_openai_model`
+    if name == "client":
+        return get_client()
+    if name == "azure_openai_model":
+        return deployment_for()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,255 @@
+"""
+Offline chat-completion jobs through the provider's Batch API.
+
+    requests = [batch_request(f"q-{i:05d}", body) for i, body in enumerate(bodies)]
+    write_jsonl(job_dir / "requests.jsonl", requests)
+    batch_id = submitter.submit(job_dir / "requests.jsonl")
+    status = wait_for_batch(submitter, batch_id)
+    outputs = read_batch_output(submitter.download(batch_id, job_dir))
+
+AzureBatchSubmitter uploads the file and creates a 24h batch on a Global-Batch
+deployment (about half the price of interactive calls, no RPM/TPM pressure).
+LocalBatchSubmitter is a file-based stand-in with the same lifecycle and file
+formats that answers requests with a ``responder(messages)`` function, so
+jobs can be run end to end without credentials.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BATCH_ENDPOINT = "/chat/completions"
+DEFAULT_BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT", "gpt-4o-batch")
+FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchJobError(RuntimeError):
+    """The batch ended in a state other than completed, or never finished."""
+
+
+@dataclass
+class BatchStatus:
+    id: str
+    state: str                  # validating, in_progress, finalizing, completed, failed, expired, cancelled
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINAL_STATES
+
+
+@dataclass
+class BatchOutput:
+    """One line of a batch output (or error) file."""
+    custom_id: str
+    content: str = None
+    usage: dict = None
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# === Files ===
+def batch_request(custom_id: str, body: dict) -> dict:
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_jsonl(path, rows) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    return path
+
+
+def read_jsonl(path) -> list:
+    with Path(path).open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_batch_output(paths) -> dict:
+    """custom_id -> BatchOutput from output/error files in the provider's format."""
+    outputs = {}
+    for path in paths:
+        for line in read_jsonl(path):
+            response, error = line.get("response") or {}, line.get("error")
+            body = response.get("body") or {}
+            if error or response.get("status_code", 200) >= 400:
+                message = (error or body.get("error") or {}).get("message") or json.dumps(error or body)
+                outputs[line["custom_id"]] = BatchOutput(line["custom_id"], error=message)
+                continue
+            content = body["choices"][0]["message"]["content"]
+            outputs[line["custom_id"]] = BatchOutput(line["custom_id"], content, body.get("usage"))
+    return outputs
+
+
+# === Submitters ===
+class BatchSubmitter:
+    """Provider batch lifecycle: submit a request file, poll it, download its results."""
+    name = "base"
+
+    def submit(self, input_path) -> str:
+        raise NotImplementedError
+
+    def status(self, batch_id: str) -> BatchStatus:
+        raise NotImplementedError
+
+    def download(self, batch_id: str, dest_dir) -> list:
+        """Write the output (and error) files into ``dest_dir``; returns their paths."""
+        raise NotImplementedError
+
+
+class AzureBatchSubmitter(BatchSubmitter):
+    """Azure OpenAI Batch API; ``client`` is a sync AzureOpenAI client."""
+    name = "azure"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, input_path) -> str:
+        with Path(input_path).open("rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                           completion_window="24h")
+        logging.info(f"Submitted batch {batch.id} (file {uploaded.id})")
+        return batch.id
+
+    def status(self, batch_id: str) -> BatchStatus:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        errors = [e.message for e in (batch.errors.data or [])] if batch.errors else []
+        return BatchStatus(batch.id, batch.status, counts.total if counts else 0,
+                           counts.completed if counts else 0, counts.failed if counts else 0, errors)
+
+    def download(self, batch_id: str, dest_dir) -> list:
+        batch = self.client.batches.retrieve(batch_id)
+        paths = []
+        for kind, file_id in (("output", batch.output_file_id), ("errors", batch.error_file_id)):
+            if file_id:
+                path = Path(dest_dir) / f"{kind}.jsonl"
+                path.write_bytes(self.client.files.content(file_id).content)
+                paths.append(path)
+        return paths
+
+
+class LocalBatchSubmitter(BatchSubmitter):
+    """
+    File-based stand-in for the Batch API. Each batch is a directory under
+    ``root`` holding the input, a batch.json status file and the output files;
+    a background thread of the submitting process answers the requests with
+    ``responder(messages)`` (``latency`` seconds each), so status moves
+    validating -> in_progress -> completed like the real service. A batch
+    whose thread is gone before it completed (the submitting process exited)
+    reports failed.
+    """
+    name = "local"
+    _workers = {}               # batch_id -> answering thread, shared by all instances of this process
+
+    def __init__(self, responder=None, root=".cache/batches", latency: float = 0.0):
+        self.responder = responder or (lambda messages: "SELECT 1;")
+        self.root = Path(root)
+        self.latency = latency
+
+    def _write_status(self, batch_dir: Path, status: BatchStatus):
+        # Written then renamed so a concurrent status() never reads half a file
+        tmp = batch_dir / "batch.json.tmp"
+        tmp.write_text(json.dumps(status.__dict__), encoding="utf-8")
+        tmp.replace(batch_dir / "batch.json")
+
+    def submit(self, input_path) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        batch_dir = self.root / batch_id
+        batch_dir.mkdir(parents=True)
+        requests = read_jsonl(input_path)
+        write_jsonl(batch_dir / "input.jsonl", requests)
+        self._write_status(batch_dir, BatchStatus(batch_id, "validating", total=len(requests)))
+        worker = threading.Thread(target=self._process, args=(batch_dir, batch_id, requests), daemon=True)
+        self._workers[batch_id] = worker
+        worker.start()
+        return batch_id
+
+    def _process(self, batch_dir: Path, batch_id: str, requests: list):
+        status = BatchStatus(batch_id, "in_progress", total=len(requests))
+        self._write_status(batch_dir, status)
+        outputs, errors = [], []
+        for request in requests:
+            time.sleep(self.latency)
+            line = {"id": f"response_{uuid.uuid4().hex[:8]}", "custom_id": request["custom_id"], "error": None}
+            try:
+                content = self.responder(request["body"]["messages"])
+                body = {"object": "chat.completion", "model": request["body"].get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": len(json.dumps(request["body"]["messages"])) // 4,
+                                  "completion_tokens": len(content) // 4}}
+                line["response"] = {"status_code": 200, "body": body}
+                outputs.append(line)
+                status.completed += 1
+            except Exception as e:
+                line["error"] = {"code": "responder_error", "message": str(e)}
+                errors.append(line)
+                status.failed += 1
+        write_jsonl(batch_dir / "output.jsonl", outputs)
+        if errors:
+            write_jsonl(batch_dir / "errors.jsonl", errors)
+        status.state = "completed"
+        self._write_status(batch_dir, status)
+
+    def _read_status(self, batch_id: str) -> BatchStatus:
+        return BatchStatus(**json.loads((self.root / batch_id / "batch.json").read_text(encoding="utf-8")))
+
+    def status(self, batch_id: str) -> BatchStatus:
+        status = self._read_status(batch_id)
+        worker = self._workers.get(batch_id)
+        if status.done or (worker is not None and worker.is_alive()):
+            return status
+        # Read again: the thread may have finished between the first read and the liveness check
+        status = self._read_status(batch_id)
+        if not status.done:
+            status.state = "failed"
+            status.errors.append("abandoned: the process answering it exited")
+            self._write_status(self.root / batch_id, status)
+        return status
+
+    def download(self, batch_id: str, dest_dir) -> list:
+        paths = []
+        for name in ("output.jsonl", "errors.jsonl"):
+            source = self.root / batch_id / name
+            if source.exists():
+                target = Path(dest_dir) / name
+                target.write_bytes(source.read_bytes())
+                paths.append(target)
+        return paths
+
+
+SUBMITTERS = {"azure": AzureBatchSubmitter, "local": LocalBatchSubmitter}
+
+
+def wait_for_batch(submitter: BatchSubmitter, batch_id: str, poll_interval: float = 30.0,
+                   timeout: float = 24 * 3600.0) -> BatchStatus:
+    """Poll until the batch reaches a final state; raises BatchJobError unless it completed."""
+    started = time.monotonic()
+    last_state = None
+    while True:
+        status = submitter.status(batch_id)
+        if status.state != last_state:
+            logging.info(f"Batch {batch_id}: {status.state} ({status.completed}/{status.total} done, "
+                         f"{status.failed} failed)")
+            last_state = status.state
+        if status.done:
+            if status.state != "completed":
+                raise BatchJobError(f"Batch {batch_id} ended {status.state}: {'; '.join(status.errors)}")
+            return status
+        if time.monotonic() - started > timeout:
+            raise BatchJobError(f"Batch {batch_id} still {status.state} after {timeout:.0f}s")
+        time.sleep(poll_interval)
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from src.utils.llm_resilience import retry_after_from_headers
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one item in a batch; exactly one of value / error is set."""
+    index: int
+    item: object
+    value: object = None
+    error: Exception = None
+    latency: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after_seconds(error: Exception):
+    """Read the retry-after header from an API error, if the server sent one."""
+    response = getattr(error, "response", None)
+    return retry_after_from_headers(getattr(response, "headers", None))
+
+
+async def run_batch(items, worker, concurrency: int = 4, timeout: float = 60.0, rate_limiter=None, cost=None):
+    """
+    Run ``await worker(item)`` for every item with at most ``concurrency``
+    in flight and yield BatchResult objects in completion order.
+
+    Each item is bounded by ``timeout`` seconds. Retries belong to the
+    clients' ResilientTransport (src.utils.llm_resilience), so an item is run
+    once. A 429 that still gets through pauses the shared ``rate_limiter``
+    for the server's retry-after delay, so the other items back off.
+    ``cost(item)`` gives the estimated token count charged against the
+    limiter's TPM bucket.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index, item):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if rate_limiter is not None:
+                    await rate_limiter.acquire(cost(item) if cost else 0)
+                value = await asyncio.wait_for(worker(item), timeout)
+                return BatchResult(index, item, value=value, latency=time.perf_counter() - started)
+            except Exception as e:
+                if is_rate_limited(e):
+                    delay = retry_after_seconds(e) or 1.0
+                    logging.warning(f"Rate limited on item {index}; pausing the batch for {delay:.2f}s")
+                    if rate_limiter is not None:
+                        rate_limiter.pause(delay)
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"Item {index} timed out after {timeout}s")
+                return BatchResult(index, item, error=e, latency=time.perf_counter() - started)
+
+    tasks = [asyncio.create_task(run_one(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Consumer stopped early (break / exception): don't leave work running, and
+        # wait for the cancellations so no task is destroyed pending
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+# === Defaults ===
+DEFAULT_DB_PATH = os.getenv("OLIST_DB_PATH", "olist.sqlite")
+
+# Pragmas applied to every pooled connection. The pool is read-only, so
+# query_only is a second line of defence on top of the mode=ro URI.
+DEFAULT_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,  # map up to 256 MB of the file into memory
+    "cache_size": -64 * 1024,        # negative value = KiB, i.e. 64 MB page cache
+    "temp_store": "MEMORY",          # sorts / temp b-trees for GROUP BY stay in RAM
+    "query_only": "ON",
+}
+
+
+@dataclass
+class PoolStats:
+    """Snapshot of pool counters, returned by SQLiteConnectionPool.stats()."""
+    hits: int = 0
+    misses: int = 0
+    waits: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+    health_check_failures: int = 0
+    open_connections: int = 0
+    idle_connections: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["hit_rate"] = round(self.hit_rate, 4)
+        return data
+
+
+class _PooledConnection:
+    """A sqlite3 connection plus the bookkeeping the pool needs."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.owner = None
+        self.last_used = time.monotonic()
+
+
+class SQLiteConnectionPool:
+    """
+    Bounded pool of read-only SQLite connections for a single database file.
+
+    Connections are opened once with a ``mode=ro`` URI and tuned pragmas, then
+    reused across queries so the parsed schema and page cache survive between
+    questions. A connection is checked out by exactly one thread at a time and
+    is preferably handed back to the thread that used it last, which keeps that
+    thread's working set warm.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_connections: int = 4,
+                 pragmas: dict = None, health_check_interval: float = 30.0,
+                 acquire_timeout: float = 30.0):
+        self.db_path = str(db_path)
+        self.max_connections = max_connections
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = []
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = PoolStats()
+        self._fingerprint = (None, None)
+        self._tables = frozenset()
+
+    # === Connection lifecycle ===
+    def _connect(self) -> sqlite3.Connection:
+        if not Path(self.db_path).exists():
+            # mode=ro would fail anyway, but with a far less helpful message
+            raise FileNotFoundError(f"SQLite database not found: {self.db_path}")
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        logging.debug(f"Opened pooled connection to {self.db_path}")
+        return conn
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logging.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def _discard(self, pooled: _PooledConnection):
+        try:
+            pooled.conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats.health_check_failures += 1
+            self._cond.notify()
+
+    def _take_idle(self, thread_id: int):
+        """Pop an idle connection, preferring the one this thread used last."""
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i].owner == thread_id:
+                return self._idle.pop(i)
+        return self._idle.pop() if self._idle else None
+
+    def _acquire(self) -> _PooledConnection:
+        thread_id = threading.get_ident()
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                pooled = self._take_idle(thread_id)
+                if pooled is None and self._open >= self.max_connections:
+                    started = time.perf_counter()
+                    if not self._cond.wait_for(lambda: self._idle or self._open < self.max_connections or self._closed,
+                                               timeout=self.acquire_timeout):
+                        raise TimeoutError(f"Timed out waiting for a connection to {self.db_path}")
+                    waited = time.perf_counter() - started
+                    self._stats.waits += 1
+                    self._stats.wait_time_total += waited
+                    self._stats.wait_time_max = max(self._stats.wait_time_max, waited)
+                    continue
+                if pooled is None:
+                    self._open += 1
+                    self._stats.misses += 1
+                else:
+                    self._stats.hits += 1
+
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(pooled):
+                self._discard(pooled)
+                continue
+
+            pooled.owner = thread_id
+            return pooled
+
+    def _release(self, pooled: _PooledConnection):
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                pooled.conn.close()
+                self._open -= 1
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the ``with`` block."""
+        pooled = self._acquire()
+        try:
+            yield pooled.conn
+        finally:
+            self._release(pooled)
+
+    def execute(self, sql: str, params=()) -> list:
+        """Run a statement on a pooled connection and return all rows."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    # === Introspection ===
+    def stats(self) -> PoolStats:
+        with self._cond:
+            snapshot = PoolStats(**asdict(self._stats))
+            snapshot.open_connections = self._open
+            snapshot.idle_connections = len(self._idle)
+        return snapshot
+
+    def fingerprint(self) -> str:
+        """
+        Stable identifier for the current database contents and schema.
+
+        Derived from the file's mtime/size plus a hash of sqlite_master, so it
+        changes whenever the file is rewritten or a table/index is altered.
+        The schema is only re-read when the file stat changes.
+        """
+        st = os.stat(self.db_path)
+        file_key = (st.st_mtime_ns, st.st_size)
+        cached_key, cached_value = self._fingerprint
+        if cached_key == file_key:
+            return cached_value
+        rows = self.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")
+        digest = hashlib.sha256(repr((file_key, rows)).encode("utf-8")).hexdigest()[:16]
+        self._fingerprint = (file_key, digest)
+        self._tables = frozenset(name for kind, name, _ in rows if kind == "table")
+        return digest
+
+    def table_names(self) -> frozenset:
+        """Names of the tables in the database, refreshed with the fingerprint."""
+        self.fingerprint()
+        return self._tables
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed when released."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().conn.close()
+                self._open -= 1
+            self._cond.notify_all()
+
+
+# === Process-wide registry ===
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = None, **kwargs) -> SQLiteConnectionPool:
+    """Return the shared pool for ``db_path``, creating it on first use."""
+    key = str(Path(db_path or DEFAULT_DB_PATH).resolve())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLiteConnectionPool(db_path or DEFAULT_DB_PATH, **kwargs)
+        return pool
+
+
+def close_all_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,287 @@
+"""
+Prepare an Olist SQLite file for the question workload.
+
+    python -m src.utils.db_prepare --db olist.sqlite [--force] [--drop]
+
+Builds covering indexes on the join keys used by the recurring questions
+(order_items -> orders -> customers / products / order_reviews), materializes
+per-seller, per-category, per-city and per-order summary tables and runs
+ANALYZE so the planner has statistics. Every object is recorded in a manifest
+table together with a hash of its definition and of the source tables, so a
+second run only rebuilds what changed.
+"""
+import argparse
+import hashlib
+import logging
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass, field
+
+from src.utils.db_pool import DEFAULT_DB_PATH
+
+MANIFEST_TABLE = "_olist_prepare_manifest"
+
+# === Covering indexes: (name, table, columns) ===
+OLIST_INDEXES = [
+    ("ix_order_items_order", "order_items", ("order_id", "seller_id", "product_id", "price", "freight_value")),
+    ("ix_order_items_seller", "order_items", ("seller_id", "order_id", "price")),
+    ("ix_order_items_product", "order_items", ("product_id", "order_id", "price", "freight_value")),
+    ("ix_orders_order", "orders", ("order_id", "customer_id", "order_status")),
+    ("ix_orders_customer", "orders", ("customer_id", "order_id", "order_status")),
+    ("ix_orders_status", "orders", ("order_status", "order_delivered_customer_date", "order_estimated_delivery_date")),
+    ("ix_customers_customer", "customers", ("customer_id", "customer_city", "customer_state")),
+    ("ix_customers_city", "customers", ("customer_city", "customer_state", "customer_id")),
+    ("ix_products_product", "products", ("product_id", "product_category_name")),
+    ("ix_products_category", "products", ("product_category_name", "product_id")),
+    ("ix_order_reviews_order", "order_reviews", ("order_id", "review_score")),
+    ("ix_order_payments_value", "order_payments", ("payment_value", "payment_installments")),
+    ("ix_sellers_seller", "sellers", ("seller_id", "seller_city", "seller_state")),
+]
+
+# === Summary tables: name -> (source tables, index columns, SELECT) ===
+# Review and price aggregates are taken over the item-level join, matching
+# the validated queries in entryAssignment/correct_queries.txt.
+OLIST_SUMMARY_TABLES = {
+    "seller_city_facts": (
+        ("order_items", "orders", "customers"), ("seller_id", "customer_city"),
+        """
+        SELECT oi.seller_id, c.customer_city, c.customer_state, o.order_status,
+               COUNT(DISTINCT o.order_id) AS orders, COUNT(*) AS items,
+               SUM(oi.price) AS revenue, SUM(oi.freight_value) AS freight_value
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN customers c ON o.customer_id = c.customer_id
+        GROUP BY oi.seller_id, c.customer_city, c.customer_state, o.order_status
+        """),
+    "category_facts": (
+        ("products", "order_items", "orders", "order_reviews"), ("product_category_name",),
+        """
+        WITH reviews AS (
+            SELECT p.product_category_name, COUNT(*) AS reviewed_items, AVG(r.review_score) AS avg_review_score,
+                   100.0 * SUM(r.review_score = 5) / COUNT(*) AS five_star_pct
+            FROM products p
+            JOIN order_items oi ON p.product_id = oi.product_id
+            JOIN order_reviews r ON oi.order_id = r.order_id
+            GROUP BY p.product_category_name
+        ), items AS (
+            SELECT p.product_category_name,
+                   COUNT(*) AS items, COUNT(DISTINCT oi.order_id) AS orders,
+                   AVG(oi.price) AS avg_price, SUM(oi.price) AS revenue,
+                   SUM(o.order_status = 'delivered' AND o.order_delivered_customer_date IS NOT NULL)
+                       AS delivered_items,
+                   AVG(CASE WHEN o.order_status = 'delivered' AND o.order_delivered_customer_date IS NOT NULL
+                            THEN JULIANDAY(o.order_delivered_customer_date) - JULIANDAY(o.order_purchase_timestamp)
+                       END) AS avg_delivery_days
+            FROM products p
+            JOIN order_items oi ON p.product_id = oi.product_id
+            LEFT JOIN orders o ON oi.order_id = o.order_id
+            GROUP BY p.product_category_name
+        )
+        SELECT i.product_category_name, i.items, i.orders, i.avg_price, i.revenue,
+               r.reviewed_items, r.avg_review_score, r.five_star_pct, i.delivered_items, i.avg_delivery_days
+        FROM items i
+        LEFT JOIN reviews r ON r.product_category_name IS i.product_category_name
+        """),
+    "customer_city_facts": (
+        ("customers", "orders", "order_items"), ("customer_city",),
+        """
+        SELECT c.customer_city, c.customer_state,
+               COUNT(DISTINCT o.order_id) AS orders, COUNT(*) AS items,
+               SUM(oi.price) AS revenue, AVG(oi.freight_value) AS avg_item_freight,
+               SUM(oi.freight_value) / COUNT(DISTINCT o.order_id) AS avg_order_freight
+        FROM customers c
+        JOIN orders o ON c.customer_id = o.customer_id
+        JOIN order_items oi ON o.order_id = oi.order_id
+        GROUP BY c.customer_city, c.customer_state
+        """),
+    "order_facts": (
+        ("orders", "order_items", "order_payments"), ("order_id",),
+        """
+        SELECT o.order_id, o.customer_id, o.order_status,
+               i.items, i.sellers, i.order_value, i.freight_value,
+               (SELECT SUM(pay.payment_value) FROM order_payments pay WHERE pay.order_id = o.order_id)
+                   AS payment_value,
+               JULIANDAY(o.order_delivered_customer_date) - JULIANDAY(o.order_purchase_timestamp) AS delivery_days,
+               CASE WHEN o.order_delivered_customer_date IS NULL OR o.order_estimated_delivery_date IS NULL
+                    THEN NULL
+                    ELSE o.order_delivered_customer_date < o.order_estimated_delivery_date
+               END AS delivered_before_estimate
+        FROM orders o
+        LEFT JOIN (SELECT order_id, COUNT(*) AS items, COUNT(DISTINCT seller_id) AS sellers,
+                          SUM(price) AS order_value, SUM(freight_value) AS freight_value
+                   FROM order_items GROUP BY order_id) i ON i.order_id = o.order_id
+        """),
+}
+
+
+@dataclass
+class PrepareReport:
+    built: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    missing: list = field(default_factory=list)
+    analyzed: bool = False
+    seconds: float = 0.0
+
+
+def _sha(*parts) -> str:
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _tables(conn: sqlite3.Connection) -> set:
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _row_checksum(*values) -> int:
+    return zlib.crc32(repr(values).encode("utf-8"))
+
+
+def _source_hash(conn: sqlite3.Connection, tables) -> str:
+    """
+    Change detector for the source tables: row count, max rowid and the sum
+    of a CRC per row, so an in-place UPDATE is caught as well as inserts and
+    deletes. One scan per table, far cheaper than the rebuild it may save.
+    """
+    conn.create_function("_row_checksum", -1, _row_checksum, deterministic=True)
+    state = []
+    for t in sorted(tables):
+        columns = ", ".join(f'"{row[1]}"' for row in conn.execute(f'PRAGMA table_info("{t}")'))
+        state.append((t, *conn.execute(f'SELECT COUNT(*), MAX(rowid), SUM(_row_checksum({columns})) FROM "{t}"')
+                      .fetchone()))
+    return _sha(state)
+
+
+def _manifest(conn: sqlite3.Connection) -> dict:
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            name TEXT PRIMARY KEY, kind TEXT NOT NULL, definition_hash TEXT NOT NULL,
+            source_hash TEXT NOT NULL, built_at REAL NOT NULL, build_seconds REAL NOT NULL)""")
+    return {name: (kind, definition, source) for name, kind, definition, source in
+            conn.execute(f"SELECT name, kind, definition_hash, source_hash FROM {MANIFEST_TABLE}")}
+
+
+def _record(conn, name: str, kind: str, definition: str, source: str, started: float):
+    conn.execute(f"INSERT OR REPLACE INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                 (name, kind, definition, source, time.time(), round(time.perf_counter() - started, 3)))
+
+
+def _is_current(conn, manifest: dict, name: str, kind: str, definition: str, source: str) -> bool:
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?", (kind, name)).fetchone()
+    return bool(exists) and manifest.get(name) == (kind, definition, source)
+
+
+def prepare_database(db_path: str = None, force: bool = False, indexes=OLIST_INDEXES,
+                     summaries=OLIST_SUMMARY_TABLES) -> PrepareReport:
+    """
+    Build the indexes and summary tables that are missing or out of date, then
+    ANALYZE. Safe to run repeatedly; ``force`` rebuilds everything.
+    """
+    report = PrepareReport()
+    started = time.perf_counter()
+    # The query pool is read-only, so preparation uses its own writable connection
+    conn = sqlite3.connect(db_path or DEFAULT_DB_PATH, isolation_level=None)
+    try:
+        manifest = _manifest(conn)
+        if force:
+            manifest = {}
+        existing = _tables(conn)
+
+        for name, table, columns in indexes:
+            if table not in existing:
+                report.missing.append(name)
+                continue
+            definition = _sha(table, columns)
+            source = "-"    # SQLite keeps indexes in sync with their table, only the definition matters
+            if _is_current(conn, manifest, name, "index", definition, source):
+                report.skipped.append(name)
+                continue
+            t0 = time.perf_counter()
+            conn.execute("BEGIN")
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            conn.execute(f'CREATE INDEX "{name}" ON "{table}" ({", ".join(columns)})')
+            _record(conn, name, "index", definition, source, t0)
+            conn.execute("COMMIT")
+            report.built.append(name)
+            logging.info(f"Built index {name} on {table}({', '.join(columns)})")
+
+        for name, (sources, index_columns, select) in summaries.items():
+            if not set(sources) <= existing:
+                report.missing.append(name)
+                continue
+            definition = _sha(" ".join(select.split()), index_columns)
+            source = _source_hash(conn, sources)
+            if _is_current(conn, manifest, name, "table", definition, source):
+                report.skipped.append(name)
+                continue
+            t0 = time.perf_counter()
+            conn.execute("BEGIN")
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            conn.execute(f'CREATE TABLE "{name}" AS {select}')
+            conn.execute(f'CREATE INDEX "ix_{name}" ON "{name}" ({", ".join(index_columns)})')
+            _record(conn, name, "table", definition, source, t0)
+            conn.execute("COMMIT")
+            report.built.append(name)
+            logging.info(f"Materialized {name} in {time.perf_counter() - t0:.2f}s")
+
+        has_stats = "sqlite_stat1" in _tables(conn)
+        if report.built or not has_stats:
+            t0 = time.perf_counter()
+            conn.execute("ANALYZE")
+            if not has_stats:
+                # Ours to remove in drop_prepared; statistics the file already had are left alone
+                _record(conn, "sqlite_stat1", "stats", "-", "-", t0)
+            report.analyzed = True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    report.seconds = round(time.perf_counter() - started, 3)
+    logging.info(f"Database prepared: {len(report.built)} built, {len(report.skipped)} up to date, "
+                 f"{len(report.missing)} skipped for missing tables ({report.seconds}s)")
+    return report
+
+
+def drop_prepared(db_path: str = None) -> list:
+    """
+    Remove every object listed in the manifest, plus the manifest itself.
+    sqlite_stat1 is only dropped when preparation created it.
+    """
+    conn = sqlite3.connect(db_path or DEFAULT_DB_PATH, isolation_level=None)
+    try:
+        if MANIFEST_TABLE not in _tables(conn):
+            return []
+        dropped = []
+        conn.execute("BEGIN")
+        for name, kind in conn.execute(f"SELECT name, kind FROM {MANIFEST_TABLE}").fetchall():
+            conn.execute(f'DROP {"INDEX" if kind == "index" else "TABLE"} IF EXISTS "{name}"')
+            dropped.append(name)
+        conn.execute(f"DROP TABLE {MANIFEST_TABLE}")
+        conn.execute("COMMIT")
+        return dropped
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--force", action="store_true", help="rebuild everything, ignoring the manifest")
+    parser.add_argument("--drop", action="store_true", help="remove the prepared objects instead")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.drop:
+        print(f"Dropped: {', '.join(drop_prepared(args.db)) or 'nothing'}")
+        return
+    report = prepare_database(args.db, force=args.force)
+    print(f"Built: {', '.join(report.built) or '-'}\nUp to date: {', '.join(report.skipped) or '-'}")
+    if report.missing:
+        print(f"Skipped (source tables missing): {', '.join(report.missing)}")
+    print(f"ANALYZE: {'run' if report.analyzed else 'not needed'}; {report.seconds}s")
+
+
+if __name__ == "__main__":
+    main()
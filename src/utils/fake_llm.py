@@ -0,0 +1,318 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+class FakeRateLimitError(Exception):
+    """Mimics openai.RateLimitError closely enough for retry handling."""
+    status_code = 429
+
+    def __init__(self, retry_after: float = 0.05):
+        super().__init__(f"429 Too Many Requests (retry after {retry_after}s)")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)})
+
+
+def make_completion(content, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    response_format=None):
+    """
+    Build an object shaped like a ChatCompletion response. ``content`` may be
+    a list for ``n > 1`` choices; with a pydantic ``response_format`` each
+    message's ``parsed`` is filled in like beta.chat.completions.parse does.
+    """
+    contents = content if isinstance(content, list) else [content]
+    choices = []
+    for index, text in enumerate(contents):
+        # A dict response_format ({"type": "json_object"}) leaves parsed empty, as in the SDK
+        parsed = response_format.model_validate_json(text) if isinstance(response_format, type) else None
+        message = SimpleNamespace(role="assistant", content=text, parsed=parsed, tool_calls=None)
+        choices.append(SimpleNamespace(index=index, message=message, finish_reason="stop"))
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            total_tokens=prompt_tokens + completion_tokens,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=0))
+    return SimpleNamespace(model=model, choices=choices, usage=usage)
+
+
+def make_chunk(delta: str, model: str = "gpt-4o"):
+    """Build an object shaped like a ChatCompletionChunk carrying ``delta``."""
+    choice = SimpleNamespace(index=0, delta=SimpleNamespace(role="assistant", content=delta), finish_reason=None)
+    return SimpleNamespace(model=model, choices=[choice], usage=None)
+
+
+class FakeAsyncStream:
+    """Async iterator of completion chunks, like openai.AsyncStream; records how much was sent."""
+
+    def __init__(self, content: str, model: str, chunk_chars: int = 8, chunk_latency: float = 0.01):
+        self.pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        self.model = model
+        self.chunk_latency = chunk_latency
+        self.chunks_sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed or self.chunks_sent >= len(self.pieces):
+            raise StopAsyncIteration
+        await asyncio.sleep(self.chunk_latency)
+        self.chunks_sent += 1
+        return make_chunk(self.pieces[self.chunks_sent - 1], self.model)
+
+    async def close(self):
+        self.closed = True
+
+
+def _default_responder(messages) -> str:
+    return "SELECT 1;"
+
+
+def reference_responder(cases=None):
+    """
+    Responder answering assignment questions with their reference SQL in the
+    structured-output JSON format ({"steps": [...], "sql_query": ...}).
+    """
+    if cases is None:
+        from src.utils.reference_queries import load_reference_cases
+        cases = load_reference_cases()
+
+    def responder(messages) -> str:
+        content = messages[-1]["content"]
+        # The question asked comes last; earlier ones may be quoted as few-shot examples
+        position, index = max((content.rfind(case.plain_question), i) for i, case in enumerate(cases))
+        if position < 0:
+            return json.dumps({"steps": ["Unknown question"], "sql_query": "SELECT 1;"})
+        return json.dumps({"steps": ["Answer with the reference query"], "sql_query": cases[index].sql})
+
+    return responder
+
+
+class FakeAsyncAzureOpenAI:
+    """
+    Local stand-in for AsyncAzureOpenAI used to exercise batch code offline.
+
+    ``responder(messages)`` returns the completion text. Each call sleeps for a
+    random latency in ``latency`` seconds and raises FakeRateLimitError with
+    probability ``throttle_rate``. Calls and peak concurrency are recorded so
+    tests can assert on fan-out behaviour. With ``stream=True`` the text is
+    returned as a FakeAsyncStream of ``stream_chunk_chars``-sized chunks.
+    """
+
+    def __init__(self, responder=None, latency=(0.05, 0.2), throttle_rate: float = 0.0,
+                 retry_after: float = 0.05, seed: int = 0, stream_chunk_chars: int = 8,
+                 stream_chunk_latency: float = 0.01):
+        self.responder = responder or _default_responder
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_latency = stream_chunk_latency
+        self.streams = []
+        self.calls = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, model, messages, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._rng.uniform(*self.latency))
+            if self._rng.random() < self.throttle_rate:
+                self.throttled += 1
+                raise FakeRateLimitError(self.retry_after)
+            content = self.responder(messages)
+            if kwargs.get("stream"):
+                stream = FakeAsyncStream(content, model, self.stream_chunk_chars, self.stream_chunk_latency)
+                self.streams.append(stream)
+                return stream
+            prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+            return make_completion(content, model, prompt_tokens, len(content) // 4)
+        finally:
+            self.in_flight -= 1
+
+
+class FakeAzureOpenAI:
+    """
+    Sync stand-in for AzureOpenAI with ``chat.completions.create`` and
+    ``beta.chat.completions.parse``.
+
+    ``responder(messages)`` returns the completion text and is called once per
+    requested choice (``n=``). A request sleeps ``latency`` seconds (uniform)
+    plus ``per_choice_latency`` for every extra choice, which models a server
+    decoding the choices of one request side by side.
+    """
+
+    def __init__(self, responder=None, latency=(0.5, 1.5), per_choice_latency: float = 0.05, seed: int = 0):
+        self.responder = responder or _default_responder
+        self.latency = latency
+        self.per_choice_latency = per_choice_latency
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self._parse)))
+
+    def _create(self, *, model, messages, n: int = 1, response_format=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            delay = self._rng.uniform(*self.latency) + self.per_choice_latency * (n - 1)
+        try:
+            time.sleep(delay)
+            contents = [self.responder(messages) for _ in range(n)]
+            prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+            return make_completion(contents, model, prompt_tokens, sum(len(c) for c in contents) // 4,
+                                   response_format)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _parse(self, *, model, messages, response_format, **kwargs):
+        return self._create(model=model, messages=messages, response_format=response_format, **kwargs)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing connections early (hedging, discarded retries) is expected
+        pass
+
+
+class FakeLLMServer:
+    """
+    Local HTTP server speaking enough of the Azure OpenAI chat completions API
+    for the real SDK clients, with injected faults:
+
+    - ``throttle_rate``: share of requests answered 429 with ``retry_after``
+    - ``error_rate``: share answered 503
+    - ``spike_rate``: share delayed by ``spike_latency`` instead of ``latency``
+    - ``down``: while True every request is answered 503 (an outage)
+
+        with FakeLLMServer(throttle_rate=0.2) as server:
+            client = AzureOpenAI(azure_endpoint=server.url, api_key="test", api_version="2024-12-01-preview")
+
+    ``stream: true`` requests get server-sent events of ``stream_chunk_chars``.
+    """
+
+    def __init__(self, responder=None, latency=(0.02, 0.05), throttle_rate: float = 0.0,
+                 retry_after: float = 0.2, error_rate: float = 0.0, spike_rate: float = 0.0,
+                 spike_latency: float = 2.0, stream_chunk_chars: int = 8, seed: int = 0):
+        self.responder = responder or _default_responder
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.stream_chunk_chars = stream_chunk_chars
+        self.down = False
+        self.counts = {"requests": 0, "ok": 0, "throttled": 0, "errors": 0, "spikes": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _decide(self):
+        """Pick this request's fate: (status, delay)."""
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._rng.random()
+            delay = self._rng.uniform(*self.latency)
+            if self.down or roll < self.error_rate:
+                self.counts["errors"] += 1
+                return 503, delay
+            if roll < self.error_rate + self.throttle_rate:
+                self.counts["throttled"] += 1
+                return 429, 0.0
+            if self._rng.random() < self.spike_rate:
+                self.counts["spikes"] += 1
+                delay = self.spike_latency
+            self.counts["ok"] += 1
+            return 200, delay
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body: bytes, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, delay = server._decide()
+                time.sleep(delay)
+                if status == 429:
+                    error = {"error": {"code": "429", "message": "Rate limit exceeded"}}
+                    return self._send(429, json.dumps(error).encode(),
+                                      headers={"retry-after-ms": str(int(server.retry_after * 1000)),
+                                               "retry-after": str(max(1, round(server.retry_after)))})
+                if status != 200:
+                    error = {"error": {"code": str(status), "message": "Service unavailable"}}
+                    return self._send(status, json.dumps(error).encode())
+
+                model = request.get("model", "gpt-4o")
+                contents = [server.responder(request["messages"]) for _ in range(request.get("n") or 1)]
+                if request.get("stream"):
+                    return self._stream(contents[0], model)
+                body = {"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": i, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}
+                                    for i, content in enumerate(contents)],
+                        "usage": {"prompt_tokens": len(json.dumps(request["messages"])) // 4,
+                                  "completion_tokens": sum(len(c) for c in contents) // 4,
+                                  "total_tokens": 0}}
+                self._send(200, json.dumps(body).encode())
+
+            def _stream(self, content, model):
+                events = []
+                for i in range(0, len(content), server.stream_chunk_chars):
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0,
+                             "model": model, "choices": [{"index": 0, "finish_reason": None,
+                                                          "delta": {"content": content[i:i + server.stream_chunk_chars]}}]}
+                    events.append(f"data: {json.dumps(chunk)}\n\n")
+                events.append("data: [DONE]\n\n")
+                self._send(200, "".join(events).encode(), content_type="text/event-stream")
+
+        return Handler
@@ -0,0 +1,226 @@
+"""
+Record / replay of LLM HTTP traffic, so evals and benchmarks run offline.
+
+    llm_cassette.activate("evals/cassettes/json_schema.jsonl", mode="replay")
+    client = get_client()       # clients created from now on read the cassette
+
+or LLM_CASSETTE=<path> / LLM_CASSETTE_MODE=<mode> in the environment. The
+client registry (src.utils.azure_client) puts CassetteTransport on top of
+the resilient transport of every client it creates while a cassette is
+active.
+
+Modes:
+
+- "replay": answer from the cassette; a request it has not seen raises CassetteMiss
+- "record": always call the deployment and append what came back
+- "auto": replay what is there, call and record the rest
+
+Requests are keyed on method, URL path (deployment included, api-version and
+host not) and the canonical JSON body, so a changed prompt, model or
+temperature is a miss rather than a stale answer. A key recorded several
+times (sampling with temperature) is replayed round-robin. Entries store the
+status, content type, body and the latency seen when recording; replays can
+sleep for ``replay_latency`` times that latency to keep timings realistic.
+Streamed responses are recorded whole and replayed as one chunk.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from src.utils.llm_resilience import RETRY_STATUSES
+
+MODES = ("replay", "record", "auto")
+
+
+class CassetteMiss(httpx.TransportError):
+    """A replay-only cassette has no entry for this request."""
+
+
+def request_key(request: httpx.Request) -> str:
+    try:
+        body = json.dumps(json.loads(request.content or b"null"), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        body = request.content.decode("utf-8", "replace")
+    payload = f"{request.method} {request.url.path}\n{body}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+class Cassette:
+    """
+    Entries of one JSONL file. With ``persist=False`` new recordings are only
+    kept in memory (``new_entries``) for a parent process to save; process
+    pools use this so workers never write to the same file.
+    """
+
+    def __init__(self, path, mode: str = "replay", persist: bool = True, replay_latency: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; choose from {', '.join(MODES)}")
+        self.path = Path(path)
+        self.mode = mode
+        self.persist = persist
+        self.replay_latency = replay_latency
+        self.entries = {}
+        self.new_entries = []
+        self.replayed = self.recorded = 0
+        self.latency_total = 0.0        # recorded latency of replays plus measured latency of live calls
+        self._cursor = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+
+    def lookup(self, key: str):
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            position = self._cursor.get(key, 0)
+            self._cursor[key] = position + 1
+            return entries[position % len(entries)]
+
+    def add(self, entries: list):
+        """Store recorded entries (from this process or handed back by a worker)."""
+        with self._lock:
+            for entry in entries:
+                self.entries.setdefault(entry["key"], []).append(entry)
+            if self.persist:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            else:
+                self.new_entries += entries
+
+    def drain(self) -> list:
+        """Entries recorded since the last drain (``persist=False``)."""
+        with self._lock:
+            entries, self.new_entries = self.new_entries, []
+            return entries
+
+    def replay(self, request: httpx.Request):
+        """A response for ``request`` from the cassette, or None when it must go to the deployment."""
+        if self.mode == "record":
+            return None
+        entry = self.lookup(request_key(request))
+        if entry is None:
+            if self.mode == "replay":
+                raise CassetteMiss(f"No cassette entry in {self.path} for {request.method} {request.url.path} "
+                                   f"(record it with mode 'auto' or 'record')", request=request)
+            return None
+        with self._lock:
+            self.replayed += 1
+            self.latency_total += entry["latency"]
+        return entry
+
+    def record(self, request: httpx.Request, status: int, headers, body: bytes, latency: float):
+        entry = {"key": request_key(request), "path": request.url.path, "status": status,
+                 "content_type": headers.get("content-type", "application/json"),
+                 "body": body.decode("utf-8", "replace"), "latency": round(latency, 4), "recorded_at": time.time()}
+        with self._lock:
+            self.recorded += 1
+            self.latency_total += latency
+        if status not in RETRY_STATUSES:
+            # Throttling and outages that outlasted the retries are not answers worth replaying
+            self.add([entry])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": str(self.path), "mode": self.mode, "entries": sum(map(len, self.entries.values())),
+                    "replayed": self.replayed, "recorded": self.recorded,
+                    "latency_total": round(self.latency_total, 4)}
+
+
+# The body is stored decoded, so these no longer describe it
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def _live_response(request: httpx.Request, response: httpx.Response, body: bytes) -> httpx.Response:
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS]
+    return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+
+def _response(request: httpx.Request, entry: dict) -> httpx.Response:
+    return httpx.Response(entry["status"], headers={"content-type": entry["content_type"]},
+                          content=entry["body"].encode("utf-8"), request=request)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self.cassette.replay(request)
+        if entry is not None:
+            time.sleep(entry["latency"] * self.cassette.replay_latency)
+            return _response(request, entry)
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        body = response.read()
+        self.cassette.record(request, response.status_code, response.headers, body, time.perf_counter() - started)
+        return _live_response(request, response, body)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        import asyncio
+
+        entry = self.cassette.replay(request)
+        if entry is not None:
+            await asyncio.sleep(entry["latency"] * self.cassette.replay_latency)
+            return _response(request, entry)
+        started = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        body = await response.aread()
+        self.cassette.record(request, response.status_code, response.headers, body, time.perf_counter() - started)
+        return _live_response(request, response, body)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# === Active cassette ===
+_active = None
+_active_lock = threading.Lock()
+
+
+def activate(path, mode: str = "replay", persist: bool = True, replay_latency: float = 0.0) -> Cassette:
+    """Make clients created from now on use this cassette."""
+    global _active
+    cassette = Cassette(path, mode, persist, replay_latency)
+    with _active_lock:
+        _active = cassette
+    logging.info(f"LLM cassette {path} active ({mode}, {cassette.stats()['entries']} entries)")
+    return cassette
+
+
+def deactivate():
+    global _active
+    with _active_lock:
+        _active = None
+
+
+def active_cassette():
+    """The active cassette, activating LLM_CASSETTE on first use; None when there is none."""
+    global _active
+    with _active_lock:
+        if _active is None and os.getenv("LLM_CASSETTE"):
+            _active = Cassette(os.environ["LLM_CASSETTE"], os.getenv("LLM_CASSETTE_MODE", "replay"),
+                               replay_latency=float(os.getenv("LLM_CASSETTE_REPLAY_LATENCY", "0")))
+        return _active
@@ -0,0 +1,401 @@
+"""
+Retries, backoff, circuit breaking, hedging and deadlines for LLM HTTP calls.
+
+The client registry (src.utils.azure_client) mounts ResilientTransport /
+AsyncResilientTransport under every client, so each chat.completions call
+(create, parse or stream) gets:
+
+- retries on 408/429/5xx and connection errors with jittered exponential
+  backoff, honouring ``retry-after-ms`` / ``retry-after``; a 429 pauses the
+  whole deployment so concurrent callers don't keep hammering it
+- a circuit breaker per deployment that fails fast after repeated failures
+  and lets one probe through after ``reset_timeout``
+- optional hedging: a second identical request once the first has been
+  waiting ``hedge_after`` seconds; the first response wins
+- a deadline shared by all attempts of a call; ``request_deadline()``
+  tightens it for a block of calls
+
+    with request_deadline(10.0):
+        get_client("dh").chat.completions.create(...)
+
+Settings come from LLM_MAX_ATTEMPTS, LLM_DEADLINE, LLM_HEDGE_AFTER,
+LLM_BREAKER_THRESHOLD and LLM_BREAKER_RESET.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, fields
+
+import httpx
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_DEPLOYMENT = re.compile(r"/deployments/([^/]+)/")
+
+
+@dataclass(frozen=True)
+class ResiliencePolicy:
+    max_attempts: int = 5
+    backoff_base: float = 0.5       # first backoff; doubles per attempt
+    backoff_max: float = 20.0
+    deadline: float = 120.0         # seconds for all attempts of one call
+    hedge_after: float = None       # None disables hedging
+    failure_threshold: int = 5      # consecutive failures that open the breaker
+    reset_timeout: float = 30.0     # open -> half-open
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        hedge_after = os.getenv("LLM_HEDGE_AFTER")
+        return cls(max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "5")),
+                   deadline=float(os.getenv("LLM_DEADLINE", "120")),
+                   hedge_after=float(hedge_after) if hedge_after else None,
+                   failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                   reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30")))
+
+    def backoff(self, attempt: int) -> float:
+        # "Equal jitter": half the exponential step plus a random share of the other half
+        step = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return step / 2 + random.uniform(0, step / 2)
+
+
+DEFAULT_POLICY = ResiliencePolicy.from_env()
+
+
+# The openai SDK maps httpx timeouts to APITimeoutError and other transport
+# errors to APIConnectionError; these stay reachable through __cause__
+class CircuitOpenError(httpx.TransportError):
+    """The deployment's circuit breaker is open; the request was not sent."""
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The call's deadline ran out before a usable response arrived."""
+
+
+def retry_after_from_headers(headers) -> float:
+    """Seconds from ``retry-after-ms`` / ``retry-after`` headers, or None."""
+    for name in ("retry-after-ms", "retry-after"):
+        value = (headers or {}).get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            continue
+        return seconds / 1000.0 if name.endswith("-ms") else seconds
+    return None
+
+
+# === Deadlines ===
+_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+
+@contextlib.contextmanager
+def request_deadline(seconds: float):
+    """Every LLM call in the block, retries included, must finish within ``seconds`` from now."""
+    outer = _deadline.get()
+    at = time.monotonic() + seconds
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+# === Circuit breaker ===
+class CircuitBreaker:
+    """
+    closed -> open after ``failure_threshold`` consecutive failures (5xx,
+    timeouts, connection errors) -> half-open after ``reset_timeout``, where
+    one probe decides between closed and open again. Throttling (429) is not
+    a failure; it pauses the deployment for the retry-after delay instead.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.paused_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state, self._probing = "half_open", False
+            if self.state == "half_open":
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logging.info(f"Circuit for {self.name} closed")
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logging.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state, self.opened_at, self._probing = "open", time.monotonic(), False
+
+    def record_throttle(self, delay: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self._probing = False
+
+    def wait_time(self) -> float:
+        return max(0.0, self.paused_until - time.monotonic())
+
+
+# === Metrics ===
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    throttled: int = 0
+    server_errors: int = 0
+    connection_errors: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0             # the hedged request answered first
+    rejected: int = 0               # failed fast on an open breaker
+    deadline_exceeded: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "lock"}
+
+
+stats = ResilienceStats()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(request: httpx.Request, policy: ResiliencePolicy) -> CircuitBreaker:
+    match = _DEPLOYMENT.search(request.url.path)
+    name = f"{request.url.netloc.decode('ascii')}/{match.group(1) if match else '-'}"
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, policy.failure_threshold, policy.reset_timeout)
+        return breaker
+
+
+def resilience_stats() -> dict:
+    """Counters over all clients plus the state of every deployment's breaker."""
+    with _breakers_lock:
+        breakers = {name: breaker.state for name, breaker in _breakers.items()}
+    return {**stats.as_dict(), "breakers": breakers}
+
+
+# === Transports ===
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def _close_quietly(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class _Call:
+    """Retry bookkeeping for one logical request; shared by the sync and async transports."""
+
+    def __init__(self, request: httpx.Request, policy: ResiliencePolicy):
+        self.request = request
+        self.policy = policy
+        self.breaker = breaker_for(request, policy)
+        outer = _deadline.get()
+        self.deadline_at = time.monotonic() + policy.deadline
+        if outer is not None:
+            self.deadline_at = min(self.deadline_at, outer)
+        self.attempt = 0
+        self.delay = 0.0
+        stats.add(calls=1)
+
+    def remaining(self) -> float:
+        return self.deadline_at - time.monotonic()
+
+    def next_wait(self) -> float:
+        """Time to sleep before the next attempt; raises when the breaker or deadline forbid one."""
+        wait_for = max(self.delay, self.breaker.wait_time())
+        if wait_for >= self.remaining():
+            stats.add(deadline_exceeded=1)
+            raise DeadlineExceeded(f"LLM deadline exceeded after {self.attempt} attempts", request=self.request)
+        return wait_for
+
+    def begin_attempt(self):
+        if not self.breaker.allow():
+            stats.add(rejected=1)
+            raise CircuitOpenError(f"Circuit open for {self.breaker.name}", request=self.request)
+        self.attempt += 1
+        stats.add(attempts=1)
+        # Bound time-to-headers by what is left of the deadline
+        remaining = self.remaining()
+        timeout = self.request.extensions.get("timeout") or {}
+        self.request.extensions["timeout"] = {name: min(timeout.get(name) or remaining, remaining)
+                                              for name in ("connect", "read", "write", "pool")}
+
+    def on_error(self, error: Exception) -> bool:
+        """Record a transport error; True when it is worth another attempt."""
+        stats.add(connection_errors=1)
+        self.breaker.record_failure()
+        self.delay = self.policy.backoff(self.attempt)
+        return self.attempt < self.policy.max_attempts and self.delay < self.remaining()
+
+    def fail(self, error: Exception):
+        """Re-raise a final transport error, as DeadlineExceeded when the deadline is what ran out."""
+        if self.remaining() <= 0:
+            stats.add(deadline_exceeded=1)
+            raise DeadlineExceeded(f"LLM deadline exceeded after {self.attempt} attempts",
+                                   request=self.request) from error
+        raise error
+
+    def on_response(self, response: httpx.Response) -> bool:
+        """Record a response; True when it should be discarded and the call retried."""
+        if response.status_code not in RETRY_STATUSES:
+            self.breaker.record_success()
+            return False
+        retry_after = retry_after_from_headers(response.headers)
+        self.delay = retry_after if retry_after is not None else self.policy.backoff(self.attempt)
+        if response.status_code == 429:
+            stats.add(throttled=1)
+            self.breaker.record_throttle(self.delay)
+        else:
+            stats.add(server_errors=1)
+            self.breaker.record_failure()
+        retry = self.attempt < self.policy.max_attempts and self.delay < self.remaining()
+        if retry:
+            stats.add(retries=1)
+            logging.warning(f"LLM call to {self.breaker.name} got {response.status_code}, "
+                            f"retrying in {self.delay:.2f}s (attempt {self.attempt}/{self.policy.max_attempts})")
+        return retry
+
+    def hedge_after(self):
+        hedge_after = self.policy.hedge_after
+        return hedge_after if hedge_after and hedge_after < self.remaining() else None
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Wraps an httpx transport with the retry/breaker/hedge/deadline policy."""
+
+    def __init__(self, transport: httpx.BaseTransport, policy: ResiliencePolicy = None):
+        self.transport = transport
+        self.policy = policy or DEFAULT_POLICY
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()      # buffered so it can be replayed
+        call = _Call(request, self.policy)
+        while True:
+            time.sleep(call.next_wait())
+            call.begin_attempt()
+            try:
+                response = self._send(call)
+            except httpx.TransportError as e:
+                if call.on_error(e):
+                    continue
+                call.fail(e)
+            if not call.on_response(response):
+                return response
+            response.close()
+
+    def _send(self, call: _Call) -> httpx.Response:
+        hedge_after = call.hedge_after()
+        if hedge_after is None:
+            return self.transport.handle_request(call.request)
+        first = _hedge_pool.submit(self.transport.handle_request, call.request)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        stats.add(hedges=1)
+        pending = {first, _hedge_pool.submit(self.transport.handle_request, call.request)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                stats.add(hedge_wins=future is not first)
+                # The slower request still finishes in the background; drop its response
+                for other in pending | (done - {future}):
+                    other.add_done_callback(_close_quietly)
+                return future.result()
+        raise error
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """Async twin of ResilientTransport; a losing hedge is cancelled rather than drained."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: ResiliencePolicy = None):
+        self.transport = transport
+        self.policy = policy or DEFAULT_POLICY
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        call = _Call(request, self.policy)
+        while True:
+            await asyncio.sleep(call.next_wait())
+            call.begin_attempt()
+            try:
+                response = await self._send(call)
+            except httpx.TransportError as e:
+                if call.on_error(e):
+                    continue
+                call.fail(e)
+            if not call.on_response(response):
+                return response
+            await response.aclose()
+
+    async def _send(self, call: _Call) -> httpx.Response:
+        hedge_after = call.hedge_after()
+        if hedge_after is None:
+            return await self.transport.handle_async_request(call.request)
+        first = asyncio.ensure_future(self.transport.handle_async_request(call.request))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+        stats.add(hedges=1)
+        pending = {first, asyncio.ensure_future(self.transport.handle_async_request(call.request))}
+        error, winner = None, None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                elif winner is None:
+                    winner = task
+                else:
+                    await task.result().aclose()
+        for task in pending:
+            task.cancel()
+        if winner is None:
+            raise error
+        stats.add(hedge_wins=winner is not first)
+        return winner.result()
+
+    async def aclose(self):
+        await self.transport.aclose()
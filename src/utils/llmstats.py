@@ -0,0 +1,411 @@
+"""
+Token, cost and latency accounting for every LLM call.
+
+The client registry (src.utils.azure_client) installs ``event_hooks()`` on
+every client, so each chat completion / embedding request is recorded with
+its prompt, completion and cached tokens, latency, model and call site, with
+no code at the call sites. The call site is the first caller outside the SDK
+and src.utils ("module:function"), or a name set for a block of calls:
+
+    with llmstats.call_site("resume_check"):
+        get_client().beta.chat.completions.parse(...)
+
+Coroutines passed straight to asyncio.gather run as their own tasks without
+the caller's frames, so async batches should name their call site.
+
+Usage obtained some other way (batch output files, fake clients) is added
+with ``record_usage(call_site, usage, latency, model)``; ``batch=True``
+prices it at the Batch API rate (BATCH_DISCOUNT of the interactive price).
+
+Each thread writes to its own shard, so recording takes no lock; summary()
+merges the shards into totals and latency p50/p95/p99 per call site and
+model. With LLMSTATS_SQLITE and/or LLMSTATS_PROMETHEUS set (or configure()
+called) every call is also flushed every LLMSTATS_FLUSH_INTERVAL seconds,
+and at exit, to an ``llm_calls`` SQLite table and a Prometheus textfile.
+
+Streamed responses are counted with their time to first byte; the SQL
+streams are closed early, so their token usage is never reported.
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+# USD per 1M tokens: (input, cached input, output); matched on the longest model name prefix.
+# LLMSTATS_PRICES='{"my-model": [1.0, 0.5, 4.0]}' adds or overrides entries.
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+}
+PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv("LLMSTATS_PRICES", "{}")).items()})
+# Share of the interactive price charged for Batch API (Global-Batch) calls
+BATCH_DISCOUNT = float(os.getenv("LLMSTATS_BATCH_DISCOUNT", "0.5"))
+
+LATENCY_SAMPLES = 2048          # per call site, model and thread
+TRACKED_PATHS = ("/chat/completions", "/completions", "/embeddings")
+_DEPLOYMENT = re.compile(r"/deployments/([^/]+)/")
+_SKIP_MODULES = ("openai", "httpx", "httpcore", "anyio", "asyncio", "concurrent.", "threading", "contextlib",
+                 "functools", "src.utils")
+
+
+@dataclass
+class CallRecord:
+    timestamp: float
+    call_site: str
+    model: str
+    status: int = 200
+    streamed: bool = False
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0
+    batch: bool = False
+
+    @property
+    def cost(self) -> float:
+        return cost_of(self.model, self.prompt_tokens, self.completion_tokens, self.cached_tokens, self.batch)
+
+
+def cost_of(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+            batch: bool = False) -> float:
+    """USD cost of one call, at the batch rate for Batch API calls; 0.0 for models missing from PRICES."""
+    matches = [name for name in PRICES if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    price_in, price_cached, price_out = PRICES[max(matches, key=len)]
+    cost = ((prompt_tokens - cached_tokens) * price_in + cached_tokens * price_cached
+            + completion_tokens * price_out) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+# === Call sites ===
+_call_site = contextvars.ContextVar("llmstats_call_site", default=None)
+
+
+@contextlib.contextmanager
+def call_site(name: str):
+    """Attribute the LLM calls made in this block (and tasks it starts) to ``name``."""
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+
+def current_call_site() -> str:
+    name = _call_site.get()
+    if name:
+        return name
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_SKIP_MODULES):
+            if module == "__main__":
+                module = Path(frame.f_code.co_filename).stem
+            return f"{module}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+# === Per-thread shards ===
+class _Counters:
+    """Totals for one (call site, model), only ever written by the shard's thread."""
+    __slots__ = ("requests", "errors", "streamed", "prompt_tokens", "completion_tokens", "cached_tokens",
+                 "cost", "latency_total", "latencies")
+
+    def __init__(self):
+        self.requests = self.errors = self.streamed = 0
+        self.prompt_tokens = self.completion_tokens = self.cached_tokens = 0
+        self.cost = self.latency_total = 0.0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+
+class _Shard:
+    def __init__(self):
+        self.counters = {}          # (call_site, model) -> _Counters
+        self.pending = deque()      # CallRecords not flushed yet; appended here, popped by the flusher
+
+
+_shards = []
+_shards_lock = threading.Lock()     # only taken when a thread records its first call
+_local = threading.local()
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def record(call: CallRecord):
+    shard = _shard()
+    key = (call.call_site, call.model)
+    counters = shard.counters.get(key)
+    if counters is None:
+        counters = shard.counters[key] = _Counters()
+    counters.requests += 1
+    counters.errors += call.status >= 400
+    counters.streamed += call.streamed
+    counters.prompt_tokens += call.prompt_tokens
+    counters.completion_tokens += call.completion_tokens
+    counters.cached_tokens += call.cached_tokens
+    counters.cost += call.cost
+    counters.latency_total += call.latency
+    counters.latencies.append(call.latency)
+    if _flusher.enabled:
+        shard.pending.append(call)
+    _flusher.ensure_started()
+
+
+def _usage_value(usage, name: str, default=0):
+    if usage is None:
+        return default
+    if isinstance(usage, dict):
+        return usage.get(name, default)
+    return getattr(usage, name, default)
+
+
+def record_usage(call_site: str, usage, latency: float = 0.0, model: str = None, status: int = 200,
+                 streamed: bool = False, batch: bool = False) -> CallRecord:
+    """Record one call from a ``response.usage`` object or its dict form; ``batch`` for Batch API usage."""
+    details = _usage_value(usage, "prompt_tokens_details", None)
+    call = CallRecord(time.time(), call_site or current_call_site(), model or "unknown", status, streamed,
+                      prompt_tokens=_usage_value(usage, "prompt_tokens") or 0,
+                      completion_tokens=_usage_value(usage, "completion_tokens") or 0,
+                      cached_tokens=_usage_value(details, "cached_tokens") or 0,
+                      latency=latency, batch=batch)
+    record(call)
+    return call
+
+
+def _merged() -> dict:
+    """(call_site, model) -> totals and latency percentiles, merged over all threads."""
+    with _shards_lock:
+        shards = list(_shards)
+    merged = {}
+    for shard in shards:
+        for key, counters in list(shard.counters.items()):
+            total = merged.setdefault(key, {"requests": 0, "errors": 0, "streamed": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0,
+                                            "latency_total": 0.0, "latencies": []})
+            for name in ("requests", "errors", "streamed", "prompt_tokens", "completion_tokens", "cached_tokens",
+                         "latency_total"):
+                total[name] += getattr(counters, name)
+            total["cost_usd"] += counters.cost
+            total["latencies"] += list(counters.latencies)
+
+    result = {}
+    for key, total in sorted(merged.items()):
+        recent = sorted(total.pop("latencies"))
+        pct = lambda q: round(recent[min(int(q * len(recent)), len(recent) - 1)], 4) if recent else 0.0
+        latency_total = total.pop("latency_total")
+        total.update(cost_usd=round(total["cost_usd"], 6),
+                     latency_mean=round(latency_total / total["requests"], 4) if total["requests"] else 0.0,
+                     latency_p50=pct(0.5), latency_p95=pct(0.95), latency_p99=pct(0.99))
+        result[key] = total
+    return result
+
+
+def summary() -> dict:
+    """Totals, cost and latency p50/p95/p99 per "call_site (model)"."""
+    return {f"{site} ({model})": total for (site, model), total in _merged().items()}
+
+
+def reset():
+    """Drop everything recorded so far (for benchmarks and repeated runs)."""
+    with _shards_lock:
+        for shard in _shards:
+            shard.counters.clear()
+            shard.pending.clear()
+
+
+# === HTTP hooks ===
+def _tracked(request) -> bool:
+    return request.method == "POST" and request.url.path.endswith(TRACKED_PATHS)
+
+
+def _on_request(request):
+    if _tracked(request):
+        request.extensions["llmstats_started"] = time.perf_counter()
+        request.extensions["llmstats_call_site"] = current_call_site()
+
+
+def _is_stream(response) -> bool:
+    return response.headers.get("content-type", "").startswith("text/event-stream")
+
+
+def _record_response(response):
+    request = response.request
+    latency = time.perf_counter() - request.extensions["llmstats_started"]
+    deployment = _DEPLOYMENT.search(request.url.path)
+    usage, model = None, deployment.group(1) if deployment else None
+    streamed = _is_stream(response)
+    if not streamed:
+        try:
+            body = response.json()
+            usage, model = body.get("usage"), body.get("model") or model
+        except ValueError:
+            pass
+    record_usage(request.extensions["llmstats_call_site"], usage, latency, model, response.status_code, streamed)
+
+
+def event_hooks(is_async: bool) -> dict:
+    """httpx event hooks that record every tracked request; the registry adds them to each client."""
+    def on_response(response):
+        if "llmstats_started" not in response.request.extensions:
+            return
+        try:
+            if not _is_stream(response):
+                response.read()
+            _record_response(response)
+        except Exception as e:
+            logging.debug(f"llmstats could not record {response.request.url}: {e}")
+
+    if not is_async:
+        return {"request": [_on_request], "response": [on_response]}
+
+    async def aon_request(request):
+        _on_request(request)
+
+    async def aon_response(response):
+        if "llmstats_started" not in response.request.extensions:
+            return
+        try:
+            if not _is_stream(response):
+                await response.aread()
+            _record_response(response)
+        except Exception as e:
+            logging.debug(f"llmstats could not record {response.request.url}: {e}")
+
+    return {"request": [aon_request], "response": [aon_response]}
+
+
+# === Flushing ===
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_calls (
+    timestamp REAL, call_site TEXT, model TEXT, status INTEGER, streamed INTEGER,
+    prompt_tokens INTEGER, completion_tokens INTEGER, cached_tokens INTEGER, latency REAL, cost_usd REAL
+)
+"""
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text() -> str:
+    """summary() in the Prometheus text exposition format."""
+    lines = ["# TYPE llm_requests_total counter", "# TYPE llm_errors_total counter",
+             "# TYPE llm_tokens_total counter", "# TYPE llm_cost_usd_total counter",
+             "# TYPE llm_latency_seconds summary"]
+    for (site, model), total in _merged().items():
+        labels = f'call_site="{_label(site)}",model="{_label(model)}"'
+        lines += [f"llm_requests_total{{{labels}}} {total['requests']}",
+                  f"llm_errors_total{{{labels}}} {total['errors']}",
+                  f'llm_tokens_total{{{labels},kind="prompt"}} {total["prompt_tokens"]}',
+                  f'llm_tokens_total{{{labels},kind="completion"}} {total["completion_tokens"]}',
+                  f'llm_tokens_total{{{labels},kind="cached"}} {total["cached_tokens"]}',
+                  f"llm_cost_usd_total{{{labels}}} {total['cost_usd']}"]
+        for quantile, name in (("0.5", "latency_p50"), ("0.95", "latency_p95"), ("0.99", "latency_p99")):
+            lines.append(f'llm_latency_seconds{{{labels},quantile="{quantile}"}} {total[name]}')
+        lines += [f"llm_latency_seconds_sum{{{labels}}} {round(total['latency_mean'] * total['requests'], 4)}",
+                  f"llm_latency_seconds_count{{{labels}}} {total['requests']}"]
+    return "\n".join(lines) + "\n"
+
+
+class _Flusher:
+    """Background thread writing pending calls to SQLite and summary() to a Prometheus textfile."""
+
+    def __init__(self):
+        self.sqlite_path = os.getenv("LLMSTATS_SQLITE") or None
+        self.prometheus_path = os.getenv("LLMSTATS_PROMETHEUS") or None
+        self.interval = float(os.getenv("LLMSTATS_FLUSH_INTERVAL", "30"))
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sqlite_path or self.prometheus_path)
+
+    def ensure_started(self):
+        if self.thread is not None or not self.enabled:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="llmstats-flush", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Write what was recorded since the last flush; returns the number of calls written."""
+        with self.lock:
+            with _shards_lock:
+                shards = list(_shards)
+            calls = []
+            for shard in shards:
+                while shard.pending:
+                    calls.append(shard.pending.popleft())
+            try:
+                if self.sqlite_path and calls:
+                    self._write_sqlite(calls)
+                if self.prometheus_path:
+                    self._write_prometheus()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"llmstats flush failed: {e}")
+            return len(calls)
+
+    def _write_sqlite(self, calls: list):
+        Path(self.sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.sqlite_path)
+        try:
+            with conn:
+                conn.execute(_SCHEMA)
+                conn.executemany("INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(c.timestamp, c.call_site, c.model, c.status, int(c.streamed), c.prompt_tokens,
+                                   c.completion_tokens, c.cached_tokens, c.latency, c.cost) for c in calls])
+        finally:
+            conn.close()
+
+    def _write_prometheus(self):
+        # Written then renamed so the node exporter never reads half a file
+        path = Path(self.prometheus_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(prometheus_text(), encoding="utf-8")
+        tmp.replace(path)
+
+
+_flusher = _Flusher()
+
+
+def configure(sqlite_path: str = None, prometheus_path: str = None, interval: float = None):
+    """Set the flush targets (overriding LLMSTATS_SQLITE / LLMSTATS_PROMETHEUS) and start flushing."""
+    with _flusher.lock:
+        _flusher.sqlite_path = sqlite_path or _flusher.sqlite_path
+        _flusher.prometheus_path = prometheus_path or _flusher.prometheus_path
+        _flusher.interval = interval or _flusher.interval
+    _flusher.ensure_started()
+
+
+def flush() -> int:
+    return _flusher.flush()
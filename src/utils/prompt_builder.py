@@ -0,0 +1,154 @@
+"""
+Chat prompts laid out for server-side prompt caching.
+
+Azure OpenAI caches the longest prompt prefix it has seen recently (from
+1024 tokens, in 128-token steps), so everything that does not depend on the
+question has to come first and be byte-for-byte identical on every call:
+
+    [system: instructions + schema] [few-shot user/assistant pairs] [user: question]
+
+    builder = get_prompt_builder("pipeline", instructions, schema_text)
+    messages = builder.messages(question, context="Relevant tables: orders")
+    ...
+    prompt_cache_stats.record(builder.prefix_hash, response.usage, latency)
+
+The prefix is hashed when built, and a changed prefix for the same builder
+name is logged, so an accidental timestamp or unordered set in the schema
+text shows up instead of silently costing cache hits. prompt_cache_stats
+tracks ``usage.prompt_tokens_details.cached_tokens`` per prefix to measure
+the effect.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+
+from src.utils.schema_prompt import count_tokens
+
+# Azure only caches prompts of at least this many tokens
+MIN_CACHEABLE_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def messages_hash(messages) -> str:
+    """Hash of the exact bytes the SDK will send for these messages."""
+    payload = json.dumps(list(messages), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class PromptBuilder:
+    """A fixed prefix (system, schema, few-shot examples) with the question appended last."""
+
+    def __init__(self, name: str, instructions: str, schema: str = "", examples=()):
+        self.name = name
+        system = f"{instructions.strip()}\n\nDataset info:\n{schema.strip()}" if schema else instructions.strip()
+        prefix = [{"role": "system", "content": system}]
+        for question, answer in examples:
+            prefix += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+        self._prefix = tuple(prefix)
+        self.prefix_hash = messages_hash(self._prefix)
+        self.prefix_tokens = sum(count_tokens(m["content"]) for m in self._prefix)
+        if self.prefix_tokens < MIN_CACHEABLE_TOKENS:
+            logging.info(f"Prompt prefix '{name}' has ~{self.prefix_tokens} tokens, "
+                         f"below the {MIN_CACHEABLE_TOKENS}-token caching threshold")
+
+    @property
+    def cacheable(self) -> bool:
+        return self.prefix_tokens >= MIN_CACHEABLE_TOKENS
+
+    def messages(self, question: str, context: str = "") -> list:
+        """Prefix copies plus one user message; ``context`` is question-specific text placed before it."""
+        prefix = [dict(message) for message in self._prefix]
+        content = f"{context.strip()}\n\nQuestion:\n{question}" if context else question
+        return prefix + [{"role": "user", "content": content}]
+
+
+_builders = {}
+_last_hash = {}
+_builders_lock = threading.Lock()
+
+
+def get_prompt_builder(name: str, instructions: str, schema: str = "", examples=()) -> PromptBuilder:
+    """
+    Shared builder for this exact content. Asking for ``name`` with different
+    content (e.g. the schema changed) builds a new one and logs the change.
+    """
+    key = (name, instructions, schema, tuple(tuple(pair) for pair in examples))
+    with _builders_lock:
+        builder = _builders.get(key)
+        if builder is not None:
+            return builder
+    builder = PromptBuilder(name, instructions, schema, examples)
+    with _builders_lock:
+        builder = _builders.setdefault(key, builder)
+        previous = _last_hash.get(name)
+        if previous is not None and previous != builder.prefix_hash:
+            logging.warning(f"Prompt prefix '{name}' changed ({previous} -> {builder.prefix_hash}); "
+                            f"the provider's prompt cache starts cold")
+        _last_hash[name] = builder.prefix_hash
+    return builder
+
+
+# === Cache metrics ===
+@dataclass
+class PrefixCacheStats:
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    hits: int = 0               # requests with any cached tokens
+    hit_latency: float = 0.0
+    miss_latency: float = 0.0
+
+    def as_dict(self) -> dict:
+        misses = self.requests - self.hits
+        return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens, "hits": self.hits,
+                "cached_share": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+                "hit_latency_mean": round(self.hit_latency / self.hits, 4) if self.hits else 0.0,
+                "miss_latency_mean": round(self.miss_latency / misses, 4) if misses else 0.0}
+
+
+@dataclass
+class PromptCacheStats:
+    """Prompt vs cached tokens from ``response.usage``, per prompt prefix hash."""
+    prefixes: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, prefix_hash: str, usage, latency: float = 0.0):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        with self.lock:
+            stats = self.prefixes.setdefault(prefix_hash, PrefixCacheStats())
+            stats.requests += 1
+            stats.prompt_tokens += usage.prompt_tokens or 0
+            stats.cached_tokens += cached
+            if cached:
+                stats.hits += 1
+                stats.hit_latency += latency
+            else:
+                stats.miss_latency += latency
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {prefix: stats.as_dict() for prefix, stats in self.prefixes.items()}
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def cacheable_prefix_tokens(previous: list, current: list, min_tokens: int = MIN_CACHEABLE_TOKENS) -> int:
+    """
+    Tokens of ``current`` a provider cache warmed by ``previous`` could serve:
+    the shared serialised prefix, counted in whole 128-token blocks once it
+    reaches ``min_tokens`` (pass 0 for the raw shared prefix).
+    """
+    a = json.dumps(previous, ensure_ascii=False, separators=(",", ":"))
+    b = json.dumps(current, ensure_ascii=False, separators=(",", ":"))
+    tokens = count_tokens(os.path.commonprefix([a, b]))
+    if not min_tokens:
+        return tokens
+    return 0 if tokens < min_tokens else tokens - tokens % CACHE_BLOCK_TOKENS
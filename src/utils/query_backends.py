@@ -0,0 +1,339 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from src.utils.db_pool import DEFAULT_DB_PATH, get_pool
+from src.utils.sql_parser import Token, parse_sql, render_tokens, tokenize
+from src.utils.sql_sandbox import DEFAULT_LIMITS, ExecutionLimits, QueryGuardrailError
+from src.utils.streaming_executor import (DEFAULT_CHUNK_SIZE, DEFAULT_MAX_BYTES, DEFAULT_MAX_ROWS,
+                                          ResultLimitExceeded, stream_query)
+
+# Backend used by query_db: "sqlite" (default) or "duckdb" (needs duckdb and pyarrow)
+DEFAULT_BACKEND = os.getenv("OLIST_BACKEND", "sqlite")
+PARQUET_DIR = Path(os.getenv("OLIST_PARQUET_DIR", ".cache/parquet"))
+
+
+class QueryBackend:
+    """
+    Executes validated SELECT statements and returns results as DataFrames.
+
+    ``stream`` has the signature of streaming_executor.stream_query (chunked
+    output, row/byte caps, scalar mode, execution limits); ``execute``
+    collects it into one DataFrame.
+    """
+    name = "base"
+
+    def stream(self, sql: str, params=(), **kwargs):
+        raise NotImplementedError
+
+    def execute(self, sql: str, params=(), **kwargs):
+        import pandas as pd
+        chunks = list(self.stream(sql, params, output="pandas", **kwargs))
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+
+    def is_stale(self) -> bool:
+        """True when the backend no longer reflects the SQLite file and must be rebuilt."""
+        return False
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(QueryBackend):
+    """Row store: the pooled, sandboxed SQLite connection."""
+    name = "sqlite"
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+
+    def stream(self, sql: str, params=(), **kwargs):
+        return stream_query(sql, params, db_path=self.db_path, **kwargs)
+
+
+# === SQLite -> DuckDB dialect translation ===
+def _call_args(tokens: list, open_index: int) -> tuple:
+    """Split the arguments of the call whose "(" is at ``open_index``; returns (args, index of ")")."""
+    args, current, depth = [], [], 0
+    for i in range(open_index + 1, len(tokens)):
+        token = tokens[i]
+        if token.type == "punct" and token.value == "(":
+            depth += 1
+        elif token.type == "punct" and token.value == ")":
+            if depth == 0:
+                args.append(current)
+                return args, i
+            depth -= 1
+        if depth == 0 and token.type == "punct" and token.value == ",":
+            args.append(current)
+            current = []
+        else:
+            current.append(token)
+    raise ValueError("Unbalanced parentheses")
+
+
+def _timestamp(arg: list) -> list:
+    # SQLite date functions return NULL for text they can't parse; TRY_CAST matches that
+    if len(arg) == 1 and arg[0].type == "string" and arg[0].value.lower() == "'now'":
+        return [Token("word", "current_timestamp")]
+    return tokenize("TRY_CAST(") + arg + tokenize("AS TIMESTAMP)")
+
+
+def translate_to_duckdb(sql: str) -> str:
+    """
+    Rewrite the SQLite-only parts of a statement for DuckDB:
+
+    * JULIANDAY(x) -> epoch(x) / 86400 + 2440587.5
+    * DATE(x) / DATETIME(x) -> casts; STRFTIME(fmt, x) -> strftime(x, fmt)
+    * [ident] and `ident` quoting -> "ident"; CAST(.. AS REAL) -> DOUBLE
+
+    Integer division is not rewritten; DuckDBBackend sets integer_division
+    so 5/2 is 2 as in SQLite.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+    return render_tokens(_translate(tokens))
+
+
+def _translate(tokens: list) -> list:
+    out, i = [], 0
+    while i < len(tokens):
+        token = tokens[i]
+        is_call = token.type == "word" and i + 1 < len(tokens) and tokens[i + 1].value == "("
+        if is_call and token.upper in ("JULIANDAY", "DATE", "DATETIME", "STRFTIME"):
+            args, close = _call_args(tokens, i + 1)
+            args = [_translate(arg) for arg in args]
+            if token.upper == "JULIANDAY":
+                out += tokenize("(epoch(") + _timestamp(args[0]) + tokenize(") / 86400.0 + 2440587.5)")
+            elif token.upper == "DATE" and len(args) == 1:
+                out += tokenize("CAST(") + _timestamp(args[0]) + tokenize("AS DATE)")
+            elif token.upper == "DATETIME" and len(args) == 1:
+                out += _timestamp(args[0])
+            elif token.upper == "STRFTIME" and len(args) == 2:
+                out += tokenize("strftime(") + _timestamp(args[1]) + [Token("punct", ",")] + args[0] + \
+                    [Token("punct", ")")]
+            else:
+                raise ValueError(f"{token.value} with {len(args)} arguments has no DuckDB translation")
+            i = close + 1
+            continue
+        if token.type == "qident" and token.value[0] in "[`":
+            token = Token("qident", '"' + token.name.replace('"', '""') + '"')
+        elif token.is_word("REAL") and out and out[-1].is_word("AS"):
+            token = Token("word", "DOUBLE")
+        out.append(token)
+        i += 1
+    return out
+
+
+# === Parquet export ===
+def _arrow_schema(conn, table: str):
+    """Arrow schema from the value types actually stored (SQLite columns can mix types)."""
+    import pyarrow as pa
+    names = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    if not names:
+        return pa.schema([])
+    kinds = conn.execute("SELECT " + ", ".join(f'group_concat(DISTINCT typeof("{n}"))' for n in names) +
+                         f' FROM "{table}"').fetchone()
+    fields = []
+    for name, found in zip(names, kinds):
+        found = set((found or "").split(",")) - {"null", ""}
+        if found and found <= {"integer"}:
+            fields.append(pa.field(name, pa.int64()))
+        elif found and found <= {"integer", "real"}:
+            fields.append(pa.field(name, pa.float64()))
+        elif found == {"blob"}:
+            fields.append(pa.field(name, pa.binary()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def export_to_parquet(db_path: str = None, out_dir: Path = None) -> Path:
+    """
+    Export every table of the SQLite database to one Parquet file per table.
+
+    The export lives in ``out_dir/<db fingerprint>`` and is reused until the
+    database changes; a _SUCCESS marker is written last so a crashed export
+    is redone. Tables are streamed in chunks, never loaded whole.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    pool = get_pool(db_path)
+    target = Path(out_dir or PARQUET_DIR) / pool.fingerprint()
+    if (target / "_SUCCESS").exists():
+        return target
+    target.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    with pool.connection() as conn:
+        for table in sorted(pool.table_names()):
+            if table.startswith(("sqlite_", "_")):
+                continue
+            schema = _arrow_schema(conn, table)
+            cursor = conn.execute(f'SELECT * FROM "{table}"')
+            with pq.ParquetWriter(target / f"{table}.parquet", schema) as writer:
+                while True:
+                    rows = cursor.fetchmany(DEFAULT_CHUNK_SIZE * 10)
+                    if not rows:
+                        break
+                    arrays = []
+                    for values, column in zip(zip(*rows), schema):
+                        if column.type == pa.string():
+                            values = [None if v is None else str(v) for v in values]
+                        arrays.append(pa.array(values, type=column.type))
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    (target / "_SUCCESS").write_text(str(time.time()))
+    logging.info(f"Exported {db_path or DEFAULT_DB_PATH} to Parquet in {time.perf_counter() - started:.1f}s")
+    return target
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Column store: queries run in an embedded DuckDB over a one-time Parquet
+    export of the SQLite file.
+
+    The DuckDB database only holds views over the Parquet files; file access
+    is then restricted to the export directory and the configuration locked,
+    so generated SQL cannot read anything else. Statements must pass the
+    sql_parser validation and may only read exported tables.
+    """
+    name = "duckdb"
+
+    def __init__(self, db_path: str = None, parquet_dir: Path = None, threads: int = None):
+        import duckdb
+
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self.source_fingerprint = get_pool(self.db_path).fingerprint()
+        self.export_dir = export_to_parquet(self.db_path, parquet_dir)
+        self.tables = frozenset(p.stem for p in self.export_dir.glob("*.parquet"))
+        self._conn = duckdb.connect(":memory:")
+        for table in sorted(self.tables):
+            path = (self.export_dir / f"{table}.parquet").resolve().as_posix()
+            self._conn.execute(f"CREATE VIEW \"{table}\" AS SELECT * FROM read_parquet('{path}')")
+        if threads:
+            self._conn.execute(f"SET threads = {int(threads)}")
+        # SQLite semantics for integer / integer, so both backends give the same answers;
+        # GLOBAL so the per-thread cursors inherit it
+        self._conn.execute("SET GLOBAL integer_division = true")
+        self._conn.execute(f"SET allowed_directories = ['{self.export_dir.resolve().as_posix()}/']")
+        self._conn.execute("SET enable_external_access = false")
+        self._conn.execute("SET lock_configuration = true")
+        self._local = threading.local()
+
+    def _cursor(self):
+        # DuckDB connections are not thread-safe; each thread gets its own cursor
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self._conn.cursor()
+        return cursor
+
+    def stream(self, sql: str, params=(), chunk_size: int = DEFAULT_CHUNK_SIZE, max_rows: int = DEFAULT_MAX_ROWS,
+               max_bytes: int = DEFAULT_MAX_BYTES, output: str = "pandas", scalar: bool = False,
+               truncate: bool = False, limits: ExecutionLimits = DEFAULT_LIMITS):
+        parsed = parse_sql(sql)
+        allowed = self.tables if limits.allowed_tables is None else self.tables & limits.allowed_tables
+        denied = sorted(parsed.tables - allowed)
+        if denied:
+            raise QueryGuardrailError("denied", f"READ on {denied[0]} is not allowed", sql,
+                                      action="SQLITE_READ", target=denied[0])
+
+        translated = translate_to_duckdb(parsed.statement)
+        cursor = self._cursor()
+        timer = threading.Timer(limits.timeout_seconds, cursor.interrupt)
+        started = time.monotonic()
+        timer.start()
+        try:
+            cursor.execute(translated, list(params))
+            reader = cursor.fetch_record_batch(chunk_size)
+            batches = iter(reader)
+            if scalar and len(reader.schema) == 1:
+                # Answer straight away only when the result is exactly one row
+                head, seen = [], 0
+                for batch in batches:
+                    head.append(batch)
+                    seen += batch.num_rows
+                    if seen > 1:
+                        break
+                if seen <= 1:
+                    yield self._to_chunk(next((b for b in head if b.num_rows), None), reader.schema, output)
+                    return
+                batches = itertools.chain(head, batches)
+
+            total_rows = total_bytes = 0
+            emitted = False
+            for batch in batches:
+                keep, exceeded = batch.num_rows, None
+                if total_rows + keep > max_rows:
+                    keep, exceeded = max_rows - total_rows, ("row", max_rows)
+                if total_bytes + batch.nbytes > max_bytes:
+                    # Arrow batches are columnar; cut proportionally to the average row size
+                    per_row = max(batch.nbytes // max(batch.num_rows, 1), 1)
+                    keep, exceeded = min(keep, (max_bytes - total_bytes) // per_row), ("byte", max_bytes)
+                total_rows += keep
+                total_bytes += batch.nbytes
+                if exceeded:
+                    if not truncate:
+                        raise ResultLimitExceeded(exceeded[0], exceeded[1], sql)
+                    logging.warning(f"Result truncated at the {exceeded[0]} limit of {exceeded[1]}")
+                    yield self._to_chunk(batch.slice(0, keep), reader.schema, output)
+                    return
+                emitted = True
+                yield self._to_chunk(batch, reader.schema, output)
+            if not emitted:
+                yield self._to_chunk(None, reader.schema, output)
+        except Exception as e:
+            # Only the limits become guardrail errors; plain SQL errors keep their duckdb type
+            import duckdb
+            elapsed = round(time.monotonic() - started, 3)
+            if isinstance(e, duckdb.InterruptException):
+                raise QueryGuardrailError("timeout", f"Query exceeded {limits.timeout_seconds}s", sql,
+                                          elapsed=elapsed) from e
+            if isinstance(e, duckdb.OutOfMemoryException):
+                raise QueryGuardrailError("memory", str(e), sql, elapsed=elapsed) from e
+            raise
+        finally:
+            timer.cancel()
+
+    def is_stale(self) -> bool:
+        return get_pool(self.db_path).fingerprint() != self.source_fingerprint
+
+    @staticmethod
+    def _to_chunk(batch, schema, output: str):
+        import pyarrow as pa
+        if batch is None:
+            batch = pa.RecordBatch.from_pylist([], schema=schema)
+        if output == "arrow":
+            return batch
+        if output == "rows":
+            return [tuple(row.values()) for row in batch.to_pylist()]
+        return batch.to_pandas()
+
+    def close(self):
+        self._conn.close()
+
+
+# === Registry ===
+BACKENDS = {"sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = None, db_path: str = None) -> QueryBackend:
+    """Shared backend instance for (name, db_path); ``name`` defaults to OLIST_BACKEND."""
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+    key = (name, str(Path(db_path or DEFAULT_DB_PATH).resolve()))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is not None and backend.is_stale():
+            backend.close()
+            backend = None
+        if backend is None:
+            backend = _backends[key] = BACKENDS[name](db_path)
+            logging.info(f"Using the {name} query backend for {key[1]}")
+        return backend
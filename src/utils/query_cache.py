@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+
+from src.utils.db_pool import get_pool
+
+DEFAULT_CACHE_PATH = os.getenv("OLIST_CACHE_PATH", ".cache/llm_sql_cache.sqlite")
+
+
+@dataclass
+class CachedAnswer:
+    """Generated SQL and its result frame, as stored in the cache."""
+    sql: str
+    result: object
+    db_fingerprint: str
+    created_at: float
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    invalidated: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["hit_rate"] = round(self.hit_rate, 4)
+        return data
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip(" ?.!")
+
+
+class QueryResultCache:
+    """
+    Two-tier cache mapping a question to its generated SQL and result frame.
+
+    Tier 1 is an in-process LRU; tier 2 is a small SQLite file so answers
+    survive restarts. Every entry remembers the fingerprint of the database it
+    was computed against and is dropped as soon as that fingerprint changes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, db_path: str = None,
+                 max_memory_entries: int = 256, max_disk_entries: int = 5000,
+                 ttl_seconds: float = 24 * 3600):
+        self.path = path
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        self._disk = None
+
+    # === Keys ===
+    @staticmethod
+    def make_key(question: str, expected_type, prompt: str, deployment: str) -> str:
+        type_name = getattr(expected_type, "__name__", str(expected_type))
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = "\x1f".join([normalize_question(question), type_name, prompt_hash, deployment])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # === Disk tier ===
+    def _disk_conn(self) -> sqlite3.Connection:
+        if self._disk is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._disk = sqlite3.connect(self.path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode = WAL")
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    sql TEXT NOT NULL,
+                    result BLOB NOT NULL,
+                    db_fingerprint TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+        return self._disk
+
+    def _disk_get(self, key: str):
+        row = self._disk_conn().execute(
+            "SELECT sql, result, db_fingerprint, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._disk.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._disk.commit()
+        return CachedAnswer(row[0], pickle.loads(row[1]), row[2], row[3])
+
+    def _disk_put(self, key: str, entry: CachedAnswer):
+        conn = self._disk_conn()
+        conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, entry.sql, pickle.dumps(entry.result), entry.db_fingerprint,
+                      entry.created_at, time.time()))
+        overflow = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            conn.execute("DELETE FROM answers WHERE key IN "
+                         "(SELECT key FROM answers ORDER BY last_access LIMIT ?)", (overflow,))
+            self._stats.evicted += overflow
+        conn.commit()
+
+    def _disk_delete(self, key: str):
+        self._disk_conn().execute("DELETE FROM answers WHERE key = ?", (key,))
+        self._disk.commit()
+
+    # === Public API ===
+    @staticmethod
+    def _detached(entry: CachedAnswer) -> CachedAnswer:
+        # Callers get their own frame, so mutating a result never edits the cache
+        result = entry.result.copy() if hasattr(entry.result, "copy") else entry.result
+        return replace(entry, result=result)
+
+    def _is_stale(self, entry: CachedAnswer, fingerprint: str) -> bool:
+        if entry.db_fingerprint != fingerprint:
+            self._stats.invalidated += 1
+            return True
+        if time.time() - entry.created_at > self.ttl_seconds:
+            self._stats.expired += 1
+            return True
+        return False
+
+    def get(self, key: str):
+        """Return the CachedAnswer for ``key`` (with a copy of the result) or None on a miss."""
+        fingerprint = get_pool(self.db_path).fingerprint()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._is_stale(entry, fingerprint):
+                    self._memory.move_to_end(key)
+                    self._stats.memory_hits += 1
+                    return self._detached(entry)
+                del self._memory[key]
+                self._disk_delete(key)
+            else:
+                try:
+                    entry = self._disk_get(key)
+                except (sqlite3.Error, pickle.UnpicklingError) as e:
+                    logging.warning(f"Ignoring unreadable cache entry: {e}")
+                    entry = None
+                if entry is not None:
+                    if not self._is_stale(entry, fingerprint):
+                        self._remember(key, entry)
+                        self._stats.disk_hits += 1
+                        return self._detached(entry)
+                    self._disk_delete(key)
+            self._stats.misses += 1
+            return None
+
+    def put(self, key: str, sql: str, result) -> CachedAnswer:
+        entry = self._detached(CachedAnswer(sql, result, get_pool(self.db_path).fingerprint(), time.time()))
+        with self._lock:
+            self._remember(key, entry)
+            try:
+                self._disk_put(key, entry)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not persist cache entry: {e}")
+        return entry
+
+    def _remember(self, key: str, entry: CachedAnswer):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats.evicted += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._disk_conn().execute("DELETE FROM answers")
+            self._disk.commit()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**asdict(self._stats))
@@ -0,0 +1,491 @@
+"""
+Query plan inspection for generated SQL, plus an index advisor over the workload.
+
+    python -m src.utils.query_plan explain "SELECT ..." [--db olist.sqlite]
+    python -m src.utils.query_plan advise [--log .cache/query_plans.jsonl]
+    python -m src.utils.query_plan apply [--log .cache/query_plans.jsonl]
+
+explain_query() runs EXPLAIN QUERY PLAN for a validated statement on the
+read-only pool and estimates the rows every SCAN / SEARCH step visits. Row
+counts come from sqlite_stat1 when the database has been ANALYZEd (db_prepare
+does that) and from MAX(rowid) otherwise. Three things are flagged when they
+visit at least OLIST_PLAN_LARGE_ROWS rows (default 100,000):
+- full scans, e.g. of order_items or geolocation,
+- automatic indexes, which SQLite builds again on every run,
+- scans repeated once per outer row.
+Each flag carries the index that would avoid it, taken from the statement's
+WHERE / ON conditions.
+
+With OLIST_PLAN_LOG set (e.g. .cache/query_plans.jsonl), query_db appends
+one JSONL line per generated statement; the log is off by default, as it is
+never rotated. Each line holds the question, the SQL, the plan, the flags,
+the execution time and the row count. ``advise`` re-plans the logged
+statements against the current database and ranks the suggested indexes by
+the rows visited, across the workload, by the steps they would replace.
+``apply`` builds them through db_prepare: they are recorded in its manifest,
+removed by ``db_prepare --drop`` and followed by ANALYZE.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+
+from src.utils.db_pool import DEFAULT_DB_PATH, get_pool
+from src.utils.sql_parser import (comparison, is_column_reference, is_constant, parse_sql, split_conditions,
+                                  walk_selects)
+
+# Steps visiting at least this many rows are flagged
+LARGE_TABLE_ROWS = int(os.getenv("OLIST_PLAN_LARGE_ROWS", "100000"))
+PLAN_LOG_PATH = os.getenv("OLIST_PLAN_LOG")     # unset: statements are not logged
+
+# Planner-style guesses where sqlite_stat1 has no answer
+_EQUALITY_SELECTIVITY = 0.1
+_RANGE_SELECTIVITY = 0.25
+_LOOKUP_ROWS = 10               # rows per equality lookup on a non-unique index without statistics
+
+_LOOP_STEP = re.compile(
+    r"^(?P<op>SCAN|SEARCH) (?:TABLE )?(?P<name>[^\s(]+)(?: AS (?P<alias>\S+))?"
+    r"(?: USING (?:(?P<automatic>AUTOMATIC )?(?:PARTIAL )?(?P<covering>COVERING )?INDEX(?: (?P<index>[^\s(]+))?"
+    r"|(?P<rowid>(?:INTEGER )?PRIMARY KEY)))?"
+    r"(?: \((?P<terms>.*)\))?$")
+_TERM = re.compile(r"(\w+)(=|>=|<=|>|<)\?")
+_MATERIALIZED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+
+
+@dataclass(frozen=True)
+class IndexSuggestion:
+    table: str
+    columns: tuple
+
+    @property
+    def name(self) -> str:
+        return f"ix_advised_{self.table}_{'_'.join(self.columns)}"
+
+    def __str__(self) -> str:
+        return f"{self.table}({', '.join(self.columns)})"
+
+
+@dataclass
+class PlanStep:
+    id: int
+    parent: int
+    detail: str
+    depth: int = 0
+    table: str = None           # real table read by a SCAN / SEARCH step
+    rows: float = 0.0           # estimated rows visited over the whole statement
+
+
+@dataclass
+class Finding:
+    kind: str                   # full_scan, automatic_index or repeated_scan
+    table: str
+    rows: float
+    message: str
+    index: IndexSuggestion = None
+
+
+@dataclass
+class QueryPlan:
+    sql: str
+    steps: list
+    estimated_rows: float
+    findings: list = field(default_factory=list)
+    statistics: str = "rowid"   # where table sizes came from: "sqlite_stat1" or "rowid"
+
+    @property
+    def suggestions(self) -> list:
+        return [f.index for f in self.findings if f.index is not None]
+
+    def render(self) -> str:
+        lines = [f"QUERY PLAN (~{self.estimated_rows:,.0f} rows visited, {self.statistics} estimates)"]
+        for step in self.steps:
+            rows = f"  ~{step.rows:,.0f} rows" if step.table else ""
+            lines.append(f"{'  ' * step.depth}{step.detail}{rows}")
+        lines += [f"! {finding.message}" for finding in self.findings]
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {"estimated_rows": round(self.estimated_rows), "statistics": self.statistics,
+                "plan": [f"{'  ' * s.depth}{s.detail}" for s in self.steps],
+                "findings": [f.message for f in self.findings],
+                "suggested_indexes": [str(index) for index in self.suggestions]}
+
+
+# === Database statistics ===
+@dataclass
+class _DatabaseStats:
+    rows: dict                  # table -> row count
+    columns: dict               # table -> set of column names
+    indexes: dict               # table -> [(index name, columns, unique)]
+    index_rows: dict            # index -> sqlite_stat1 numbers: rows, then rows per key prefix
+    source: str
+
+
+@lru_cache(maxsize=8)
+def _database_stats(db_path: str, fingerprint: str) -> _DatabaseStats:
+    """Table sizes, columns and indexes; keyed on the pool fingerprint, so re-read after a schema change."""
+    pool = get_pool(db_path)
+    tables = {t for t in pool.table_names() if not t.startswith("sqlite_")}
+    stat_rows = pool.execute("SELECT tbl, idx, stat FROM sqlite_stat1") if "sqlite_stat1" in pool.table_names() \
+        else []
+    stats = _DatabaseStats({}, {}, {}, {}, "sqlite_stat1" if stat_rows else "rowid")
+    for tbl, idx, stat in stat_rows:
+        numbers = [int(n) for n in stat.split() if n.isdigit()]
+        if numbers:
+            stats.rows[tbl.lower()] = numbers[0]
+            if idx:
+                stats.index_rows[idx.lower()] = numbers
+    for table in tables:
+        key = table.lower()
+        stats.columns[key] = {r[1].lower() for r in pool.execute(f'PRAGMA table_info("{table}")')}
+        stats.indexes[key] = [
+            (name.lower(), tuple((r[2] or "").lower() for r in pool.execute(f'PRAGMA index_info("{name}")')),
+             bool(unique))
+            for _, name, unique, *_ in pool.execute(f'PRAGMA index_list("{table}")')]
+        if key not in stats.rows:
+            try:
+                stats.rows[key] = pool.execute(f'SELECT MAX(rowid) FROM "{table}"')[0][0] or 0
+            except sqlite3.Error:       # WITHOUT ROWID table
+                stats.rows[key] = 0
+    return stats
+
+
+# === Conditions in the statement ===
+class _Scope:
+    """The real tables of one SELECT core and the conditions that constrain them."""
+
+    def __init__(self, core, stats: _DatabaseStats):
+        self.stats = stats
+        self.tables = {}            # alias or table name -> table
+        for item in core.from_items:
+            if item.table and item.table in stats.columns:
+                self.tables[item.alias or item.table] = item.table
+        self.conjuncts = split_conditions(core)
+
+    def _owner(self, reference: list):
+        if len(reference) == 3:
+            return reference[0].name
+        owners = [alias for alias, table in self.tables.items() if reference[0].name in self.stats.columns[table]]
+        return owners[0] if len(owners) == 1 else None
+
+    def predicates(self, alias: str) -> list:
+        """(column, "eq" / "range", "literal" / "column") for every condition on ``alias`` that an index can use."""
+        found = []
+        for conjunct in self.conjuncts:
+            if isinstance(conjunct, tuple):
+                if conjunct[1] in self.stats.columns[self.tables[alias]]:
+                    found.append((conjunct[1], "eq", "column"))
+                continue
+            parts = comparison(conjunct)
+            if parts is None:
+                continue
+            left, kind, right = parts
+            for column, other in ((left, right), (right, left)):
+                if is_column_reference(column) and self._owner(column) == alias \
+                        and not any(t.name == alias for t in other if t.type in ("word", "qident")):
+                    found.append((column[-1].name, kind, "literal" if is_constant(other) else "column"))
+                    break
+        return found
+
+
+def _scopes(parsed, stats: _DatabaseStats) -> dict:
+    """Plan step name (alias or table) -> _Scope of the core that reads it; the first core wins on reuse."""
+    scopes = {}
+    for select in walk_selects(parsed.ast):
+        for core in select.cores:
+            scope = _Scope(core, stats)
+            for alias in scope.tables:
+                scopes.setdefault(alias, scope)
+    return scopes
+
+
+def _index_for(table: str, predicates: list, joins: bool, stats: _DatabaseStats):
+    """Equality columns, then one range column; None when nothing is usable or an index already serves it."""
+    usable = [(column, kind) for column, kind, other in predicates if other == "literal" or joins]
+    equal = list(dict.fromkeys(column for column, kind in usable if kind == "eq"))
+    ranges = [column for column, kind in usable if kind == "range" and column not in equal]
+    columns = tuple(equal + ranges[:1])
+    if not columns:
+        return None
+    for _, existing, _ in stats.indexes.get(table, []):
+        if set(existing[:len(equal)]) == set(equal) and (not ranges or ranges[0] in existing[len(equal):][:1]):
+            return None
+    return IndexSuggestion(table, columns)
+
+
+# === Plan estimation ===
+def _estimate(step: PlanStep, match, stats: _DatabaseStats, scope: _Scope, alias: str) -> tuple:
+    """(rows visited per loop, rows produced per loop, one-off rows) of a SCAN / SEARCH step."""
+    rows = stats.rows.get(step.table, 0)
+    terms = _TERM.findall(match["terms"] or "")
+    equal = sum(op == "=" for _, op in terms)
+    ranged = any(op != "=" for _, op in terms)
+    if match["op"] == "SCAN":
+        produced = rows
+        for _, kind, other in (scope.predicates(alias) if scope else []):
+            if other == "literal":
+                produced *= _EQUALITY_SELECTIVITY if kind == "eq" else _RANGE_SELECTIVITY
+        return rows, produced, 0
+    if match["rowid"]:
+        return 1, 1, 0
+    if match["automatic"]:
+        # Built for the join keys of the outer loop, which mostly match a single row
+        return 1, 1, rows
+    index = (match["index"] or "").lower()
+    numbers = stats.index_rows.get(index)
+    if numbers:
+        per_lookup = numbers[min(equal, len(numbers) - 1)] if equal else numbers[0]
+    else:
+        unique = any(name == index and is_unique and len(columns) <= equal
+                     for name, columns, is_unique in stats.indexes.get(step.table, []))
+        per_lookup = 1 if unique else min(_LOOKUP_ROWS, rows) if equal else rows
+    if ranged:
+        per_lookup *= _RANGE_SELECTIVITY
+    return max(per_lookup, 1), max(per_lookup, 1), 0
+
+
+def _plan(statement: str, rows: list, stats: _DatabaseStats, large_rows: int) -> QueryPlan:
+    parsed = parse_sql(statement)
+    scopes = _scopes(parsed, stats)
+    steps = [PlanStep(id, parent, detail) for id, parent, _, detail in rows]
+    children = defaultdict(list)
+    for step in steps:
+        children[step.parent].append(step)
+    materialized = {}
+    findings = []
+    ordered = []
+
+    def visit(parent: int, loops: float, depth: int, correlated: bool) -> tuple:
+        total, first = 0.0, True
+        for step in children[parent]:
+            step.depth = depth
+            ordered.append(step)
+            match = _LOOP_STEP.match(step.detail)
+            if match is None:
+                inner_loops = loops if step.detail.startswith("CORRELATED") else 1
+                cost, produced = visit(step.id, inner_loops, depth + 1, step.detail.startswith("CORRELATED"))
+                total += cost
+                named = _MATERIALIZED.match(step.detail)
+                if named:
+                    materialized[named[1].lower()] = produced
+                continue
+            name = (match["alias"] or match["name"]).lower()
+            table = (match["name"].lower() if match["name"].lower() in stats.columns else
+                     scopes[name].tables[name] if name in scopes else None)
+            if table is None:
+                loops *= max(materialized.get(name, 1), 1)
+                first = False
+                continue
+            step.table = table
+            scope = scopes.get(name)
+            visited, produced, once = _estimate(step, match, stats, scope, name)
+            step.rows = loops * visited + once
+            total += step.rows
+            repeated = not first or correlated
+            if step.rows >= large_rows:
+                findings.append(_finding(step, match, loops, repeated, stats, scope, name))
+            loops *= max(produced, 1)
+            first = False
+        return total, loops
+
+    total, _ = visit(0, 1, 0, False)
+    return QueryPlan(parsed.statement, ordered, total, [f for f in findings if f], stats.source)
+
+
+def _finding(step: PlanStep, match, loops: float, repeated: bool, stats: _DatabaseStats, scope, name: str):
+    size = stats.rows.get(step.table, 0)
+    if match["automatic"]:
+        columns = tuple(dict.fromkeys(column.lower() for column, _ in _TERM.findall(match["terms"] or "")))
+        index = IndexSuggestion(step.table, columns) if columns else None
+        return Finding("automatic_index", step.table, step.rows,
+                       f"builds an automatic index on {step.table} ({size:,} rows) on every run", index)
+    if match["op"] != "SCAN":
+        return None
+    index = _index_for(step.table, scope.predicates(name), repeated, stats) if scope else None
+    if repeated and loops > 1:
+        return Finding("repeated_scan", step.table, step.rows,
+                       f"scans {step.table} ({size:,} rows) once per outer row, ~{loops:,.0f} times", index)
+    kind = "full index scan" if match["index"] else "full scan"
+    return Finding("full_scan", step.table, step.rows, f"{kind} of {step.table} ({size:,} rows)", index)
+
+
+@lru_cache(maxsize=1024)
+def _explain(db_path: str, fingerprint: str, statement: str, large_rows: int) -> QueryPlan:
+    stats = _database_stats(db_path, fingerprint)
+    rows = get_pool(db_path).execute(f"EXPLAIN QUERY PLAN {statement}")
+    return _plan(statement, rows, stats, large_rows)
+
+
+def explain_query(sql: str, db_path: str = None, large_rows: int = LARGE_TABLE_ROWS) -> QueryPlan:
+    """
+    Plan, cost estimate and findings for ``sql``, which must pass parse_sql.
+    Memoised per database fingerprint, so a schema or statistics change
+    (e.g. an applied index) gives a fresh plan.
+    """
+    statement = parse_sql(sql).statement
+    db_path = str(db_path or DEFAULT_DB_PATH)
+    return _explain(db_path, get_pool(db_path).fingerprint(), statement, large_rows)
+
+
+def inspect_query(sql: str, question: str = None, db_path: str = None):
+    """explain_query() before execution: flags are logged as warnings. None if SQLite cannot plan it."""
+    try:
+        plan = explain_query(sql, db_path)
+    except Exception as e:
+        # The execution that follows reports the real error
+        logging.debug(f"No query plan for {sql!r}: {e}")
+        return None
+    for finding in plan.findings:
+        suggestion = f"; an index on {finding.index} would avoid it" if finding.index else ""
+        logging.warning(f"Query plan for {question or 'statement'!r} {finding.message}{suggestion}")
+    return plan
+
+
+# === Workload log and index advisor ===
+class PlanLog:
+    """Append-only JSONL log of executed statements with their question, plan and timing."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(self, question: str, plan: QueryPlan, seconds: float, rows: int = None, error: str = None):
+        entry = {"time": time.time(), "question": question, "sql": plan.sql, **plan.as_dict(),
+                 "seconds": round(seconds, 4), "rows": rows, "error": error}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entries(self) -> list:
+        if not self.path.exists():
+            return []
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+@dataclass
+class AdvisedIndex:
+    index: IndexSuggestion
+    executions: int = 0
+    rows: float = 0.0           # estimated rows visited by the steps the index replaces, over all executions
+    questions: list = field(default_factory=list)
+
+
+class IndexAdvisor:
+    """Accumulates the indexes suggested by the plans of a workload."""
+
+    def __init__(self):
+        self._advised = {}
+        self._lock = threading.Lock()
+
+    def add(self, plan: QueryPlan, question: str = None, executions: int = 1):
+        with self._lock:
+            for finding in plan.findings:
+                if finding.index is None:
+                    continue
+                advised = self._advised.setdefault(finding.index, AdvisedIndex(finding.index))
+                advised.executions += executions
+                advised.rows += finding.rows * executions
+                if question and question not in advised.questions and len(advised.questions) < 3:
+                    advised.questions.append(question)
+
+    def recommendations(self, min_executions: int = 1) -> list:
+        """Most rows spared first; an index whose columns lead a longer recommendation is folded into it."""
+        with self._lock:
+            advised = [a for a in self._advised.values() if a.executions >= min_executions]
+        kept = []
+        for candidate in sorted(advised, key=lambda a: -len(a.index.columns)):
+            wider = next((k for k in kept if k.index.table == candidate.index.table
+                          and k.index.columns[:len(candidate.index.columns)] == candidate.index.columns), None)
+            if wider is None:
+                kept.append(candidate)
+            else:
+                wider.rows += candidate.rows
+                wider.executions += candidate.executions
+        return sorted(kept, key=lambda a: -a.rows)
+
+    @classmethod
+    def from_log(cls, log: PlanLog, db_path: str = None, large_rows: int = LARGE_TABLE_ROWS) -> "IndexAdvisor":
+        """Re-plan every logged statement against the database as it is now."""
+        advisor = cls()
+        counts, questions = defaultdict(int), {}
+        for entry in log.entries():
+            counts[entry["sql"]] += 1
+            questions.setdefault(entry["sql"], entry.get("question"))
+        for sql, executions in counts.items():
+            try:
+                advisor.add(explain_query(sql, db_path, large_rows), questions[sql], executions)
+            except Exception as e:
+                logging.warning(f"Skipping logged statement that no longer plans: {e}")
+        return advisor
+
+
+def apply_indexes(recommendations, db_path: str = None):
+    """Build the recommended indexes with db_prepare's writable connection and manifest, then ANALYZE."""
+    from src.utils.db_prepare import prepare_database
+
+    indexes = [(a.index.name, a.index.table, a.index.columns) for a in recommendations]
+    return prepare_database(db_path, indexes=indexes, summaries={})
+
+
+plan_log = PlanLog(PLAN_LOG_PATH) if PLAN_LOG_PATH else None
+index_advisor = IndexAdvisor()
+
+
+def record_execution(question: str, plan: QueryPlan, seconds: float, rows: int = None, error: str = None):
+    """Feed a statement run by the pipeline to the process-wide advisor, and to OLIST_PLAN_LOG when set."""
+    if plan is None:
+        return
+    if plan_log is not None:
+        plan_log.record(question, plan, seconds, rows, error)
+    index_advisor.add(plan, question)
+    logging.info(f"Query ran in {seconds:.3f}s, {rows if rows is not None else '-'} rows, "
+                 f"~{plan.estimated_rows:,.0f} rows visited by the plan")
+
+
+def print_recommendations(recommendations):
+    if not recommendations:
+        print("no index suggestions")
+        return
+    print(f"{'index':<60} {'runs':>5} {'rows visited':>14}  example question")
+    for advised in recommendations:
+        example = advised.questions[0] if advised.questions else "-"
+        print(f"{str(advised.index):<60} {advised.executions:>5} {advised.rows:>14,.0f}  {example}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("explain", "advise", "apply"))
+    parser.add_argument("sql", nargs="?", help="statement to explain")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--log", default=PLAN_LOG_PATH, help="plan log to advise on (default OLIST_PLAN_LOG)")
+    parser.add_argument("--min-runs", type=int, default=1, help="suggest only indexes needed by this many runs")
+    parser.add_argument("--large-rows", type=int, default=LARGE_TABLE_ROWS, help="rows visited before a flag")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "explain":
+        if not args.sql:
+            parser.error("explain needs a statement")
+        print(explain_query(args.sql, args.db, args.large_rows).render())
+        return
+    if not args.log:
+        parser.error(f"{args.command} needs --log or OLIST_PLAN_LOG")
+    advisor = IndexAdvisor.from_log(PlanLog(args.log), args.db, args.large_rows)
+    recommendations = advisor.recommendations(args.min_runs)
+    print_recommendations(recommendations)
+    if args.command == "apply" and recommendations:
+        report = apply_indexes(recommendations, args.db)
+        print(f"Built: {', '.join(report.built) or '-'}\nUp to date: {', '.join(report.skipped) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
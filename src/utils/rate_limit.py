@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+
+# Deployment quotas (Azure shows these per deployment as RPM / TPM)
+DEFAULT_RPM = int(os.getenv("LLM_RPM_LIMIT", "300"))
+DEFAULT_TPM = int(os.getenv("LLM_TPM_LIMIT", "50000"))
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Wait until ``amount`` tokens are available; returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # Holding the lock while sleeping keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class DeploymentRateLimiter:
+    """
+    Client-side throttle for one deployment's requests-per-minute and
+    tokens-per-minute quota. A 429 from the server pauses every caller
+    sharing the limiter, not just the one that was throttled.
+    """
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, estimated_tokens: int = 0) -> float:
+        waited = 0.0
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+            waited += pause
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens and estimated_tokens:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English/SQL)."""
+    return max(1, len(text) // 4)
@@ -0,0 +1,66 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[2]
+ASSIGNMENT_PATH = _ROOT / "entryAssignment" / "1-entry-assignment.md"
+CORRECT_QUERIES_PATH = _ROOT / "entryAssignment" / "correct_queries.txt"
+
+_ANSWER_LINE = re.compile(r"^--\s*(\w+)\s*:\s*(.*?)\s*(?:--)?\s*$")
+_TYPE_HINT = re.compile(r"\[(\w+)\s*:\s*(\w+)\]\s*$")
+_TYPES = {"string": str, "float": float, "integer": int, "int": int}
+
+
+@dataclass
+class ReferenceCase:
+    """One assignment question with its validated SQL and expected answer."""
+    question: str                 # as written in the assignment, including the [type: column] hint
+    sql: str
+    expected_column: str = None
+    expected_value: str = None    # raw text from correct_queries.txt; None when not recorded
+
+    @property
+    def plain_question(self) -> str:
+        return _TYPE_HINT.sub("", self.question).strip()
+
+    @property
+    def expected_type(self) -> type:
+        match = _TYPE_HINT.search(self.question)
+        return _TYPES.get(match.group(1).lower(), str) if match else str
+
+
+def load_questions(path=ASSIGNMENT_PATH) -> list:
+    """The numbered questions under '## Detailed Questions' in the assignment."""
+    questions, in_section = [], False
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.startswith("## "):
+            in_section = line.strip() == "## Detailed Questions"
+            continue
+        match = re.match(r"^\d+\.\s+(.*)$", line.strip())
+        if in_section and match:
+            questions.append(match.group(1).strip())
+    return questions
+
+
+def parse_reference_sql(text: str) -> list:
+    """Split correct_queries.txt into (sql, column, value) triples."""
+    entries, current = [], []
+    for line in text.splitlines():
+        match = _ANSWER_LINE.match(line.strip())
+        if match and current:
+            value = match.group(2).strip().strip("'\"")
+            entries.append(("\n".join(current).strip(), match.group(1), value))
+            current = []
+        elif line.strip() or current:
+            current.append(line)
+    if "\n".join(current).strip():
+        entries.append(("\n".join(current).strip(), None, None))
+    return entries
+
+
+def load_reference_cases(queries_path=CORRECT_QUERIES_PATH, assignment_path=ASSIGNMENT_PATH) -> list:
+    """Pair the assignment questions with the validated SQL, in file order."""
+    entries = parse_reference_sql(Path(queries_path).read_text(encoding="utf-8"))
+    questions = load_questions(assignment_path)
+    return [ReferenceCase(question, sql, column, value)
+            for question, (sql, column, value) in zip(questions, entries)]
@@ -0,0 +1,251 @@
+import json
+import logging
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.utils.db_pool import get_pool
+from src.utils.schema_prompt import (DEFAULT_TOKEN_BUDGET, count_tokens, get_compact_schema, infer_joins,
+                                     introspect_schema, render_compact_schema, quote_identifier, SKIP_VALUE_COLUMNS,
+                                     SUMMARY_TABLE_SUFFIX)
+
+INDEX_CACHE_DIR = Path(".cache/schema_index")
+
+# Words in questions that never point at a table or column
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "to", "from", "by", "with", "per", "and", "or", "is", "are",
+    "was", "were", "be", "have", "has", "had", "what", "which", "who", "how", "many", "much", "most", "least",
+    "highest", "lowest", "top", "than", "more", "less", "over", "under", "total", "average", "number", "count",
+    "s", "id", "name", "string", "integer", "float", "value", "rate", "common", "based", "each", "all", "do",
+    "does", "that", "this", "it", "its", "their", "them", "there", "before", "after",
+}
+
+# Question vocabulary -> schema vocabulary for the Olist dataset
+OLIST_SYNONYMS = {
+    "expensive": "price", "cheap": "price", "cheapest": "price", "cost": "price", "spent": "payment",
+    "paid": "payment", "pay": "payment", "installments": "installment", "star": "review",
+    "rating": "review", "rated": "review", "delivery": "delivered", "deliver": "delivered",
+    "shipping": "freight", "purchase": "order", "purchased": "order", "bought": "order",
+    "buyer": "customer", "buyers": "customer", "vendor": "seller", "merchant": "seller",
+    "english": "translation", "lead": "leads", "city": "city", "state": "state",
+}
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _words(text: str) -> list:
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def _normalize_value(value: str) -> str:
+    return " ".join(_words(str(value).replace("_", " ")))
+
+
+@dataclass
+class LinkedSchema:
+    """Result of linking one question to the schema."""
+    tables: list
+    prompt: str
+    full_tokens: int
+    pruned_tokens: int
+    scores: dict
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.full_tokens - self.pruned_tokens
+
+
+class SchemaIndex:
+    """
+    Lexical index over table names, column names and categorical values,
+    plus the join graph, used to find the tables a question is about.
+    """
+
+    def __init__(self, tables: dict, joins: list, values: dict):
+        self.tables = tables
+        self.joins = joins
+        self.graph = {name: set() for name in tables}
+        for join in joins:
+            self.graph[join.left_table].add(join.right_table)
+            self.graph[join.right_table].add(join.left_table)
+
+        # term -> {table: weight}; the last word of a table name ("items",
+        # "reviews", "translation") is the strongest signal for that table
+        self.terms = {}
+        for name, table in tables.items():
+            words = [_stem(w) for w in _words(name.replace("_", " "))]
+            for i, word in enumerate(words):
+                self._add_term(word, name, 2.0 if i == len(words) - 1 else 1.0)
+            for column in table.columns:
+                for word in _words(column.name.replace("_", " ")):
+                    self._add_term(_stem(word), name, 1.0)
+
+        # normalized value phrase -> set of tables containing it
+        self.values = {}
+        for name, phrases in values.items():
+            for phrase in phrases:
+                self.values.setdefault(phrase, set()).add(name)
+        self.max_phrase_words = max((len(p.split()) for p in self.values), default=1)
+
+    def _add_term(self, term: str, table: str, weight: float):
+        if term in _STOPWORDS:
+            return
+        entry = self.terms.setdefault(term, {})
+        entry[table] = max(entry.get(table, 0.0), weight)
+
+    # === Scoring ===
+    def score(self, question: str) -> dict:
+        scores = {}
+
+        def credit(weights: dict, strength: float):
+            total = sum(weights.values())
+            for table, weight in weights.items():
+                scores[table] = scores.get(table, 0.0) + strength * weight / total
+
+        words = _words(question)
+        for word in words:
+            if word in _STOPWORDS:
+                continue
+            term = _stem(OLIST_SYNONYMS.get(word, word))
+            if term in self.terms:
+                credit(self.terms[term], 1.0)
+
+        # Literal values ('beleza_saude', 'rio de janeiro', 'delivered') as 1..n-word phrases
+        for size in range(1, self.max_phrase_words + 1):
+            for i in range(len(words) - size + 1):
+                phrase = " ".join(words[i:i + size])
+                if phrase in self.values and not (size == 1 and phrase in _STOPWORDS):
+                    credit({t: 1.0 for t in self.values[phrase]}, 1.5)
+        return scores
+
+    def connect(self, seeds: list) -> list:
+        """Smallest set of tables joining all seeds (greedy shortest-path Steiner tree)."""
+        if not seeds:
+            return []
+        tree, remaining = {seeds[0]}, list(seeds[1:])
+        while remaining:
+            path = self._nearest_path(tree, set(remaining))
+            if path is None:
+                # Not joinable with what we have; keep it anyway
+                tree.update(remaining)
+                break
+            tree.update(path)
+            remaining = [t for t in remaining if t not in tree]
+        return sorted(tree)
+
+    def _nearest_path(self, sources: set, targets: set):
+        parents = {s: None for s in sources}
+        queue = deque(sources)
+        while queue:
+            node = queue.popleft()
+            if node in targets:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path
+            for neighbour in sorted(self.graph.get(node, ())):
+                if neighbour not in parents:
+                    parents[neighbour] = node
+                    queue.append(neighbour)
+        return None
+
+    def select_tables(self, question: str, min_score: float = 0.3) -> tuple:
+        scores = self.score(question)
+        seeds = sorted((t for t, s in scores.items() if s >= min_score), key=lambda t: (-scores[t], t))
+        return self.connect(seeds), scores
+
+    # === Persistence ===
+    def to_json(self) -> dict:
+        return {"values": {t: sorted(p) for t, p in self._values_by_table().items()}}
+
+    def _values_by_table(self) -> dict:
+        by_table = {}
+        for phrase, tables in self.values.items():
+            for table in tables:
+                by_table.setdefault(table, set()).add(phrase)
+        return by_table
+
+
+def collect_values(db_path: str = None, max_distinct: int = 5000, max_length: int = 40) -> dict:
+    """Distinct values of every low/medium-cardinality text column, per table."""
+    values = {}
+    with get_pool(db_path).connection() as conn:
+        for table, columns in _text_columns(conn).items():
+            phrases = set()
+            for column in columns:
+                sample = conn.execute(
+                    f"SELECT DISTINCT {quote_identifier(column)} FROM {quote_identifier(table)} "
+                    f"WHERE {quote_identifier(column)} IS NOT NULL AND LENGTH({quote_identifier(column)}) <= ? LIMIT ?",
+                    (max_length, max_distinct + 1)).fetchall()
+                if len(sample) > max_distinct:
+                    continue
+                phrases.update(_normalize_value(r[0]) for r in sample)
+            phrases.discard("")
+            values[table] = phrases
+    return values
+
+
+def _text_columns(conn) -> dict:
+    columns = {}
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '\\_%' ESCAPE '\\'"):
+        columns[table] = [r[1] for r in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")
+                          if (r[2] or "").lower() in ("text", "") and not SKIP_VALUE_COLUMNS.search(r[1])]
+    return columns
+
+
+# === Cached entry points ===
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_schema_index(db_path: str = None) -> SchemaIndex:
+    """SchemaIndex for ``db_path``, rebuilt only when the DB fingerprint changes."""
+    fingerprint = get_pool(db_path).fingerprint()
+    with _lock:
+        if fingerprint in _indexes:
+            return _indexes[fingerprint]
+
+    # Summary tables repeat base-table columns and would outscore them; pruned
+    # prompts link base tables only (the full compact schema still lists them)
+    tables = {name: table for name, table in introspect_schema(db_path).items()
+              if not name.endswith(SUMMARY_TABLE_SUFFIX)}
+    cache_file = INDEX_CACHE_DIR / f"{fingerprint}.json"
+    if cache_file.exists():
+        values = {t: set(p) for t, p in json.loads(cache_file.read_text(encoding="utf-8"))["values"].items()}
+    else:
+        values = {t: p for t, p in collect_values(db_path).items() if t in tables}
+    index = SchemaIndex(tables, infer_joins(tables), values)
+    if not cache_file.exists():
+        try:
+            INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_file.write_text(json.dumps(index.to_json()), encoding="utf-8")
+        except OSError as e:
+            logging.warning(f"Could not write schema index cache: {e}")
+
+    with _lock:
+        _indexes[fingerprint] = index
+    return index
+
+
+def link_schema(question: str, db_path: str = None, token_budget: int = DEFAULT_TOKEN_BUDGET) -> LinkedSchema:
+    """
+    Prune the schema prompt to the tables relevant to ``question``.
+
+    Falls back to the full compact schema when nothing in the question
+    matches the index.
+    """
+    index = get_schema_index(db_path)
+    full_prompt = get_compact_schema(db_path, token_budget)
+    selected, scores = index.select_tables(question)
+    if not selected:
+        tokens = count_tokens(full_prompt)
+        return LinkedSchema(sorted(index.tables), full_prompt, tokens, tokens, scores)
+
+    subset = {name: index.tables[name] for name in selected}
+    prompt = render_compact_schema(subset, index.joins, token_budget)
+    return LinkedSchema(selected, prompt, count_tokens(full_prompt), count_tokens(prompt), scores)
@@ -0,0 +1,244 @@
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.utils.db_pool import get_pool
+from src.utils.rate_limit import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 1200
+SCHEMA_CACHE_DIR = Path(".cache/schema_prompts")
+
+# Relationships that are not declared as foreign keys and don't share a column
+# name (see "Relationships among tables" in OlistDatasetInfo)
+OLIST_IMPLICIT_JOINS = [
+    ("customers", "customer_zip_code_prefix", "geolocation", "geolocation_zip_code_prefix"),
+    ("sellers", "seller_zip_code_prefix", "geolocation", "geolocation_zip_code_prefix"),
+]
+
+# Short version of the guidelines in OlistDatasetInfo.get_dataset_info2()
+OLIST_NOTES = [
+    "SQLite dialect; use JULIANDAY(a) - JULIANDAY(b) for date differences.",
+    "product_category_name is Portuguese; English names are in product_category_name_translation.",
+    "States are two-letter codes (SP, RJ, MG); cities are lowercase without accents.",
+    "An order can have several items and sellers; use COUNT(DISTINCT order_id) when counting orders.",
+    "Use 100.0 * x / y for percentages, ROUND(.., 2) for review scores, LIMIT 1 for 'most'/'top' questions.",
+    "Return only the columns the question asks for.",
+]
+
+# Summary tables materialized by src.utils.db_prepare
+SUMMARY_TABLE_SUFFIX = "_facts"
+SUMMARY_TABLE_NOTE = ("Tables ending in _facts are precomputed aggregates of the base tables; "
+                      "prefer them when they have every column the question needs.")
+
+# Columns whose values are never useful as prompt hints
+SKIP_VALUE_COLUMNS = re.compile(r"(_id$|_date$|_timestamp$|_at$|_comment_|_message$|_title$|_prefix$)")
+
+
+def count_tokens(text: str) -> int:
+    """Token count using tiktoken when installed, else a character estimate."""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens(text)
+    return len(tiktoken.get_encoding("o200k_base").encode(text))
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    type: str
+    primary_key: bool = False
+    top_values: list = field(default_factory=list)
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: list
+    row_count: int
+    foreign_keys: list = field(default_factory=list)  # (column, ref_table, ref_column)
+
+
+@dataclass(frozen=True)
+class Join:
+    left_table: str
+    left_column: str
+    right_table: str
+    right_column: str
+
+    def render(self) -> str:
+        return f"{self.left_table}.{self.left_column}={self.right_table}.{self.right_column}"
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def introspect_schema(db_path: str = None, top_k: int = 5, max_distinct: int = 60) -> dict:
+    """
+    Read tables, columns, keys, row counts and frequent categorical values.
+
+    A TEXT column is treated as categorical when it has at most
+    ``max_distinct`` distinct values; its ``top_k`` most frequent values are
+    kept so the model can use exact literals ('delivered', 'SP', ...).
+    """
+    pool = get_pool(db_path)
+    tables = {}
+    with pool.connection() as conn:
+        names = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '\\_%' ESCAPE '\\' ORDER BY name")]
+        for name in names:
+            columns = []
+            for _, col, col_type, _, _, pk in conn.execute(f"PRAGMA table_info({quote_identifier(name)})"):
+                columns.append(ColumnInfo(col, (col_type or "").lower(), bool(pk)))
+            foreign_keys = [(r[3], r[2], r[4]) for r in conn.execute(f"PRAGMA foreign_key_list({quote_identifier(name)})")]
+            row_count = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(name)}").fetchone()[0]
+
+            for column in columns:
+                if column.type not in ("text", "") or SKIP_VALUE_COLUMNS.search(column.name):
+                    continue
+                distinct = conn.execute(
+                    f"SELECT COUNT(*) FROM (SELECT DISTINCT {quote_identifier(column.name)} FROM {quote_identifier(name)} "
+                    f"LIMIT {max_distinct + 1})").fetchone()[0]
+                if distinct > max_distinct:
+                    continue
+                column.top_values = [r[0] for r in conn.execute(
+                    f"SELECT {quote_identifier(column.name)} FROM {quote_identifier(name)} WHERE {quote_identifier(column.name)} IS NOT NULL "
+                    f"GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT {top_k}")]
+
+            tables[name] = TableInfo(name, columns, row_count, foreign_keys)
+    return tables
+
+
+def _owns(table: TableInfo, column: str) -> bool:
+    if any(c.name == column and c.primary_key for c in table.columns):
+        return True
+    return column == f"{table.name.rstrip('s')}_id"
+
+
+def infer_joins(tables: dict, implicit_joins=OLIST_IMPLICIT_JOINS) -> list:
+    """Join edges from declared foreign keys, shared column names and known implicit joins."""
+    joins = set()
+    for table in tables.values():
+        for column, ref_table, ref_column in table.foreign_keys:
+            if ref_table in tables:
+                joins.add(Join(table.name, column, ref_table, ref_column or column))
+
+    # Shared column names: link every table to the column's owning table
+    # (orders for order_id, sellers for seller_id, ...) rather than to each other
+    by_column = {}
+    for table in tables.values():
+        for column in table.columns:
+            by_column.setdefault(column.name, []).append(table.name)
+    for column, owners in sorted(by_column.items()):
+        if len(owners) < 2:
+            continue
+        owner = next((t for t in owners if _owns(tables[t], column)), None)
+        pairs = [(t, owner) for t in owners if t != owner] if owner else \
+            [(a, b) for i, a in enumerate(owners) for b in owners[i + 1:]]
+        for left, right in pairs:
+            joins.add(Join(left, column, right, column))
+
+    for left, left_column, right, right_column in implicit_joins:
+        if left in tables and right in tables:
+            joins.add(Join(left, left_column, right, right_column))
+    return sorted(joins, key=lambda j: (j.left_table, j.right_table, j.left_column))
+
+
+def _format_value(value) -> str:
+    return f"'{value}'" if isinstance(value, str) else str(value)
+
+
+def _render(tables: list, joins: list, top_k: int, with_types: bool, notes: list) -> str:
+    lines = ["SQLite schema (table [rows]: columns; e.g. = frequent values):"]
+    for table in tables:
+        parts = []
+        for column in table.columns:
+            part = column.name
+            if with_types and column.type:
+                part += f" {column.type}"
+            if column.primary_key:
+                part += " pk"
+            if top_k and column.top_values:
+                part += " e.g. " + "|".join(_format_value(v) for v in column.top_values[:top_k])
+            parts.append(part)
+        lines.append(f"{table.name} [{table.row_count}]: " + ", ".join(parts))
+
+    kept = {t.name for t in tables}
+    edges = [j.render() for j in joins if j.left_table in kept and j.right_table in kept]
+    if edges:
+        lines.append("Joins: " + "; ".join(edges))
+    if notes:
+        lines.append("Notes:")
+        lines.extend(f"- {note}" for note in notes)
+    return "\n".join(lines)
+
+
+def render_compact_schema(tables: dict, joins: list, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                          top_k: int = 5, notes=None) -> str:
+    """
+    Render the schema as one line per table and shrink it until it fits
+    ``token_budget``: fewer example values first, then no column types, then
+    dropping the least connected tables.
+    """
+    if notes is None:
+        notes = OLIST_NOTES + ([SUMMARY_TABLE_NOTE] if any(name.endswith(SUMMARY_TABLE_SUFFIX) for name in tables) else [])
+    degree = {name: 0 for name in tables}
+    for join in joins:
+        if join.left_table in degree and join.right_table in degree:
+            degree[join.left_table] += 1
+            degree[join.right_table] += 1
+    # Most connected (and then largest) tables are the last to be dropped
+    ordered = sorted(tables.values(), key=lambda t: (-degree[t.name], -t.row_count, t.name))
+
+    text = ""
+    for k in range(top_k, -1, -1):
+        for with_types in (True, False):
+            text = _render(ordered, joins, k, with_types, notes)
+            if count_tokens(text) <= token_budget:
+                return text
+
+    kept = list(ordered)
+    while len(kept) > 1:
+        kept.pop()
+        text = _render(kept, joins, 0, False, notes)
+        if count_tokens(text) <= token_budget:
+            break
+    logging.warning(f"Schema prompt trimmed to {len(kept)} tables to fit {token_budget} tokens")
+    return text
+
+
+# === Cached entry point ===
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_compact_schema(db_path: str = None, token_budget: int = DEFAULT_TOKEN_BUDGET, top_k: int = 5) -> str:
+    """
+    Compact schema prompt for ``db_path``, rebuilt only when the database
+    fingerprint changes. Results are also written to .cache/schema_prompts so
+    new processes skip the introspection queries.
+    """
+    fingerprint = get_pool(db_path).fingerprint()
+    key = (fingerprint, token_budget, top_k)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    cache_file = SCHEMA_CACHE_DIR / f"{fingerprint}-{token_budget}-{top_k}.txt"
+    if cache_file.exists():
+        text = cache_file.read_text(encoding="utf-8")
+    else:
+        tables = introspect_schema(db_path, top_k=top_k)
+        text = render_compact_schema(tables, infer_joins(tables), token_budget, top_k)
+        try:
+            SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_file.write_text(text, encoding="utf-8")
+        except OSError as e:
+            logging.warning(f"Could not write schema prompt cache: {e}")
+
+    with _cache_lock:
+        _cache[key] = text
+    return text
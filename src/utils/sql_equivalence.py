@@ -0,0 +1,245 @@
+"""
+Decide locally whether two SELECT statements are equivalent.
+
+    from src.utils.sql_equivalence import check_equivalence
+
+    verdict = check_equivalence(generated_sql, correct_sql)
+    verdict.equivalent, verdict.method, verdict.reason
+
+Queries with the same canonical form (src.utils.sql_parser.canonicalize:
+aliases, case, literal spelling, predicate and inner-join order, output
+column names) are equivalent without running anything. Otherwise both run on
+the query backend and their result sets are compared as multisets of rows:
+column order and names are ignored, numbers compare with a tolerance taken
+from the reference value (1 == 1.0 == '1.0', and 4.1367 matches a gold 4.14
+because a value rounded to two places only fixes two places, while 4.1 does
+not), and row order only matters when the reference query sorts its final
+result without LIMIT.
+"""
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from itertools import permutations
+
+from src.utils.db_pool import get_pool
+from src.utils.query_backends import get_backend
+from src.utils.sql_parser import canonicalize, parse_sql
+
+# Significant digits kept when floats are used as sort/hash keys
+SIGNIFICANT_DIGITS = 6
+REL_TOL = 1e-6
+ABS_TOL = 1e-9
+MAX_COLUMN_PERMUTATIONS = 720    # 6 columns; wider results must match column by column
+
+
+@dataclass
+class EquivalenceResult:
+    equivalent: bool
+    method: str                 # "ast", "result" or "error"
+    reason: str = ""
+    generated_rows: int = None
+    expected_rows: int = None
+    sample_diff: list = field(default_factory=list)   # a few rows only in one side
+
+    def as_dict(self) -> dict:
+        return {"equivalent": self.equivalent, "method": self.method, "reason": self.reason,
+                "generated_rows": self.generated_rows, "expected_rows": self.expected_rows,
+                "sample_diff": self.sample_diff}
+
+
+# === Value normalisation ===
+def normalize_value(value):
+    """Map values that SQLite/pandas may type differently onto one representation."""
+    if value is None:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()            # numpy scalars
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (bool, int, Decimal)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return float(text)
+        except ValueError:
+            return text
+    return value
+
+
+def _key(value):
+    # Floats rounded to significant digits so near-equal values sort together
+    if isinstance(value, float):
+        return 1, float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+    if value is None:
+        return 0, 0
+    return 2, str(value)
+
+
+def _decimal_places(value: float) -> int:
+    """Places after the point in the shortest repr: 4.14 -> 2, 4.0 -> 0, 1e-07 -> 7."""
+    if not math.isfinite(value):
+        return 0
+    return max(0, -Decimal(repr(value)).normalize().as_tuple().exponent)
+
+
+def _close(generated, expected) -> bool:
+    """
+    Equal up to float noise, or up to the rounding of the expected value: gold
+    ROUND(AVG(x), 2) = 4.14 accepts an unrounded 4.1367 within half a unit in
+    the second place, but a generated value with fewer places than the gold
+    (4.1) has lost precision and does not match. Whole numbers stay exact, so a
+    count never matches an average that happens to be near it.
+    """
+    if isinstance(generated, float) and isinstance(expected, float):
+        if math.isclose(generated, expected, rel_tol=REL_TOL, abs_tol=ABS_TOL):
+            return True
+        places = _decimal_places(expected)
+        return 0 < places <= _decimal_places(generated) and \
+            abs(generated - expected) <= 0.5 * 10 ** -places + ABS_TOL
+    return generated == expected
+
+
+def values_match(value, expected) -> bool:
+    """Compare two single values the way compare_results compares cells."""
+    return _close(normalize_value(value), normalize_value(expected))
+
+
+def _rows(df) -> list:
+    return [tuple(normalize_value(v) for v in row) for row in df.itertuples(index=False, name=None)]
+
+
+def _canonical_columns(rows: list, width: int) -> list:
+    """Column order that does not depend on how the query ordered or named them."""
+    columns = [sorted((_key(row[i]) for row in rows)) for i in range(width)]
+    return sorted(range(width), key=lambda i: columns[i])
+
+
+def result_signature(df) -> str:
+    """Hash of a result set that ignores row/column order, column names and float noise."""
+    rows = _rows(df)
+    order = _canonical_columns(rows, len(df.columns))
+    canonical = sorted(tuple(_key(row[i]) for i in order) for row in rows)
+    return hashlib.sha1(repr(canonical).encode("utf-8")).hexdigest()
+
+
+# === Result comparison ===
+def _rows_match(generated: list, expected: list, ordered: bool) -> bool:
+    if not ordered:
+        generated = sorted(generated, key=lambda row: [_key(v) for v in row])
+        expected = sorted(expected, key=lambda row: [_key(v) for v in row])
+    return all(_close(a, b) for g, e in zip(generated, expected) for a, b in zip(g, e))
+
+
+def _same_column(generated: list, expected: list) -> bool:
+    return all(_close(a, b) for a, b in zip(generated, expected))
+
+
+def _column_orders(generated: list, expected: list, width: int):
+    """Candidate mappings of generated columns onto expected ones, most likely first."""
+    yield tuple(range(width))
+    gen_columns = [sorted((row[i] for row in generated), key=_key) for i in range(width)]
+    exp_columns = [sorted((row[i] for row in expected), key=_key) for i in range(width)]
+    if math.factorial(width) > MAX_COLUMN_PERMUTATIONS:
+        # Pair each expected column with the first unused generated column holding the same values
+        used, order = set(), []
+        for exp in exp_columns:
+            match = next((i for i, gen in enumerate(gen_columns) if i not in used and _same_column(gen, exp)), None)
+            if match is None:
+                return
+            used.add(match)
+            order.append(match)
+        yield tuple(order)
+        return
+    for order in permutations(range(width)):
+        if all(_same_column(gen_columns[g], exp_columns[e]) for e, g in enumerate(order)):
+            yield order
+
+
+def compare_results(generated_df, expected_df, ordered: bool = False) -> EquivalenceResult:
+    """Compare two result frames as multisets of rows (sequences when ``ordered``)."""
+    generated, expected = _rows(generated_df), _rows(expected_df)
+    counts = {"generated_rows": len(generated), "expected_rows": len(expected)}
+    width = len(expected_df.columns)
+    if len(generated_df.columns) != width:
+        return EquivalenceResult(False, "result", f"{len(generated_df.columns)} columns instead of {width}",
+                                 **counts)
+    if len(generated) != len(expected):
+        return EquivalenceResult(False, "result", f"{len(generated)} rows instead of {len(expected)}", **counts)
+
+    for order in _column_orders(generated, expected, width):
+        reordered = [tuple(row[i] for i in order) for row in generated]
+        if _rows_match(reordered, expected, ordered):
+            return EquivalenceResult(True, "result", **counts)
+
+    expected_keys = {tuple(_key(v) for v in row) for row in expected}
+    only_generated = [list(row) for row in generated if tuple(_key(v) for v in row) not in expected_keys]
+    reason = "rows in a different order" if not only_generated and ordered else "different values"
+    return EquivalenceResult(False, "result", reason, sample_diff=only_generated[:3], **counts)
+
+
+def is_ordered(sql: str) -> bool:
+    """
+    True when row order is part of the answer: the outermost query has an
+    ORDER BY and no LIMIT (with LIMIT the ordering already shaped which rows
+    are returned, and the set comparison covers that).
+    """
+    ast = parse_sql(sql).ast
+    return bool(ast is not None and ast.order_by and not ast.limit)
+
+
+# === Execution ===
+class _ResultCache:
+    """Small LRU of reference results, keyed on the database fingerprint."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_run(self, backend, canonical: str, run):
+        key = (backend.name, get_pool(backend.db_path).fingerprint(), canonical)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        result = run()
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+
+_reference_results = _ResultCache()
+
+
+def check_equivalence(generated_sql: str, expected_sql: str, backend=None) -> EquivalenceResult:
+    """
+    Compare a generated query with a reference one: by normalised text first,
+    then by executing both. Errors in the generated query make it
+    non-equivalent; errors in the reference query are raised.
+    """
+    expected = parse_sql(expected_sql)
+    try:
+        generated = parse_sql(generated_sql)
+    except ValueError as e:
+        return EquivalenceResult(False, "error", f"invalid SQL: {e}")
+    if canonicalize(generated_sql, column_aliases=False) == canonicalize(expected_sql, column_aliases=False):
+        return EquivalenceResult(True, "ast")
+
+    backend = backend or get_backend()
+    expected_df = _reference_results.get_or_run(backend, canonicalize(expected_sql).sql,
+                                                lambda: backend.execute(expected.statement))
+    try:
+        generated_df = backend.execute(generated.statement)
+    except Exception as e:
+        return EquivalenceResult(False, "error", f"query failed: {e}", expected_rows=len(expected_df))
+
+    result = compare_results(generated_df, expected_df, ordered=is_ordered(expected_sql))
+    logging.debug(f"Equivalence check: {result.equivalent} ({result.reason or result.method})")
+    return result
@@ -0,0 +1,810 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<blob>[xX]'[0-9a-fA-F]*')
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<param>\?\d*|[:@$][^\W\d]\w*)
+  | (?P<error>/\*|['"`\[])
+  | (?P<op>\|\||<<|>>|<=|>=|==|!=|<>|->>|->|[-+*/%&|~<>=])
+  | (?P<punct>[(),;.])
+""", re.VERBOSE | re.DOTALL)
+
+# Words that end a FROM item, so they can never be a bare table alias
+_CLAUSE_WORDS = {
+    "WHERE", "GROUP", "HAVING", "WINDOW", "ORDER", "LIMIT", "OFFSET", "UNION", "INTERSECT", "EXCEPT",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "ON", "USING", "AS",
+}
+_JOIN_WORDS = {"JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL"}
+_COMPOUND_WORDS = {"UNION", "INTERSECT", "EXCEPT"}
+_CORE_CLAUSES = ("FROM", "WHERE", "GROUP", "HAVING", "WINDOW")
+
+# Functions that reach outside the database when an extension provides them
+DENIED_FUNCTIONS = {"LOAD_EXTENSION", "READFILE", "WRITEFILE", "EDIT", "FTS3_TOKENIZER"}
+
+
+class SQLValidationError(ValueError):
+    """Raised when SQL is not a single read-only SELECT statement."""
+
+
+@dataclass(frozen=True)
+class Token:
+    type: str    # word, qident, string, blob, number, param, op, punct
+    value: str
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper()
+
+    def is_word(self, *words) -> bool:
+        return self.type == "word" and self.value.upper() in words
+
+    @property
+    def name(self) -> str:
+        """Identifier value with quotes removed, lowercased (SQLite identifiers are case-insensitive)."""
+        if self.type == "qident":
+            inner = self.value[1:-1]
+            quote = self.value[0]
+            return (inner.replace(quote * 2, quote) if quote in "\"`" else inner).lower()
+        return self.value.lower()
+
+
+def tokenize(sql: str) -> list:
+    """Split SQL into tokens, dropping whitespace and comments."""
+    tokens, pos = [], 0
+    while pos < len(sql):
+        match = _TOKEN_RE.match(sql, pos)
+        if match is None or match.lastgroup == "error":
+            kind = "comment or literal" if match else "character"
+            raise SQLValidationError(f"Unterminated or unexpected {kind} at offset {pos}: {sql[pos:pos + 20]!r}")
+        if match.lastgroup not in ("ws", "comment"):
+            tokens.append(Token(match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+
+# === AST ===
+@dataclass
+class FromItem:
+    join: str                   # "" for the first item, "," or "LEFT JOIN" etc. for the rest
+    table: str = None           # real or CTE name; None for a subquery
+    subquery: "Select" = None
+    alias: str = None
+    on: list = field(default_factory=list)
+    using: list = field(default_factory=list)
+
+
+@dataclass
+class Column:
+    expr: list
+    alias: str = None
+
+
+@dataclass
+class SelectCore:
+    distinct: bool = False
+    columns: list = field(default_factory=list)
+    from_items: list = field(default_factory=list)
+    where: list = field(default_factory=list)
+    group_by: list = field(default_factory=list)
+    having: list = field(default_factory=list)
+    subqueries: list = field(default_factory=list)  # Selects nested in expressions
+
+
+@dataclass
+class Select:
+    ctes: list = field(default_factory=list)        # (name, Select)
+    cores: list = field(default_factory=list)
+    compound_ops: list = field(default_factory=list)
+    order_by: list = field(default_factory=list)
+    limit: list = field(default_factory=list)
+    subqueries: list = field(default_factory=list)  # nested in ORDER BY / LIMIT
+
+
+class _Parser:
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def next(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise SQLValidationError("Unexpected end of statement")
+        self.pos += 1
+        return token
+
+    def expect_word(self, word: str):
+        token = self.next()
+        if not token.is_word(word):
+            raise SQLValidationError(f"Expected {word}, found {token.value!r}")
+
+    def at_word(self, *words) -> bool:
+        token = self.peek()
+        return token is not None and token.is_word(*words)
+
+    def at_punct(self, value: str) -> bool:
+        token = self.peek()
+        return token is not None and token.type == "punct" and token.value == value
+
+    # --- statements ---
+    def parse_select(self) -> Select:
+        select = Select()
+        if self.at_word("WITH"):
+            self.next()
+            if self.at_word("RECURSIVE"):
+                self.next()
+            while True:
+                name = self.next()
+                if name.type not in ("word", "qident"):
+                    raise SQLValidationError(f"Bad CTE name {name.value!r}")
+                if self.at_punct("("):          # column list
+                    self.take_group()
+                self.expect_word("AS")
+                if self.at_word("NOT"):
+                    self.next()
+                if self.at_word("MATERIALIZED"):
+                    self.next()
+                if not self.at_punct("("):
+                    raise SQLValidationError("Expected ( after AS in WITH clause")
+                select.ctes.append((name.name, self.parse_group_select()))
+                if not self.at_punct(","):
+                    break
+                self.next()
+
+        while True:
+            select.cores.append(self.parse_core())
+            if not self.at_word(*_COMPOUND_WORDS):
+                break
+            op = self.next().upper
+            if self.at_word("ALL"):
+                self.next()
+                op += " ALL"
+            select.compound_ops.append(op)
+
+        if self.at_word("ORDER"):
+            self.next()
+            self.expect_word("BY")
+            select.order_by = self.take_until({"LIMIT"}, select.subqueries)
+        if self.at_word("LIMIT"):
+            self.next()
+            select.limit = self.take_until(set(), select.subqueries)
+        return select
+
+    def parse_core(self) -> SelectCore:
+        core = SelectCore()
+        if self.at_word("VALUES"):
+            self.next()
+            core.columns = [Column(self.take_until(set(_COMPOUND_WORDS) | {"ORDER", "LIMIT"}, core.subqueries))]
+            return core
+        self.expect_word("SELECT")
+        if self.at_word("DISTINCT", "ALL"):
+            core.distinct = self.next().upper == "DISTINCT"
+        stop = set(_CORE_CLAUSES) | _COMPOUND_WORDS | {"ORDER", "LIMIT"}
+        core.columns = [self.make_column(expr) for expr in
+                        self.split_commas(self.take_until(stop, core.subqueries))]
+        if self.at_word("FROM"):
+            self.next()
+            core.from_items = self.parse_from(core)
+        if self.at_word("WHERE"):
+            self.next()
+            core.where = self.take_until(stop - {"WHERE"}, core.subqueries)
+        if self.at_word("GROUP"):
+            self.next()
+            self.expect_word("BY")
+            core.group_by = self.take_until(stop - {"WHERE", "GROUP"}, core.subqueries)
+        if self.at_word("HAVING"):
+            self.next()
+            core.having = self.take_until(stop - {"WHERE", "GROUP", "HAVING"}, core.subqueries)
+        if self.at_word("WINDOW"):
+            self.next()
+            self.take_until(_COMPOUND_WORDS | {"ORDER", "LIMIT"}, core.subqueries)
+        return core
+
+    def parse_from(self, core: SelectCore) -> list:
+        items, join = [], ""
+        while True:
+            item = FromItem(join)
+            token = self.peek()
+            if token is None:
+                raise SQLValidationError("Expected table after FROM/JOIN")
+            if token.type == "punct" and token.value == "(":
+                if self.peek(1) is not None and self.peek(1).is_word("SELECT", "WITH", "VALUES"):
+                    item.subquery = self.parse_group_select()
+                else:
+                    # Parenthesised join list: flatten it into this FROM clause
+                    self.next()
+                    items.extend(self.parse_from(core))
+                    if not self.at_punct(")"):
+                        raise SQLValidationError("Unbalanced parentheses in FROM")
+                    self.next()
+                    item = None
+            elif token.type in ("word", "qident"):
+                self.next()
+                name = token
+                if self.at_punct("."):             # schema.table
+                    self.next()
+                    name = self.next()
+                    if token.name not in ("main",):
+                        raise SQLValidationError(f"Access to database {token.name!r} is not allowed")
+                item.table = name.name
+                if self.at_punct("("):             # table-valued function
+                    self.take_group()
+            else:
+                raise SQLValidationError(f"Unexpected {token.value!r} in FROM")
+
+            if item is not None:
+                if self.at_word("AS"):
+                    self.next()
+                    item.alias = self.next().name
+                elif self.peek() is not None and self.peek().type in ("word", "qident") \
+                        and not self.peek().is_word(*_CLAUSE_WORDS, *_CORE_CLAUSES, "INDEXED", "NOT"):
+                    item.alias = self.next().name
+                if self.at_word("INDEXED"):             # INDEXED BY index_name
+                    self.next()
+                    self.expect_word("BY")
+                    self.next()
+                elif self.at_word("NOT") and self.peek(1) is not None and self.peek(1).is_word("INDEXED"):
+                    self.pos += 2
+                if self.at_word("ON"):
+                    self.next()
+                    item.on = self.take_until(_JOIN_WORDS | set(_CORE_CLAUSES) | _COMPOUND_WORDS | {"ORDER", "LIMIT"},
+                                              core.subqueries, stop_at_comma=True)
+                elif self.at_word("USING"):
+                    self.next()
+                    item.using = [t.name for t in self.take_group() if t.type in ("word", "qident")]
+                items.append(item)
+
+            if self.at_punct(","):
+                self.next()
+                join = ","
+            elif self.at_word(*_JOIN_WORDS):
+                words = []
+                while not self.at_word("JOIN"):
+                    words.append(self.next().upper)
+                self.next()
+                join = " ".join(words + ["JOIN"])
+            else:
+                return items
+
+    def parse_group_select(self) -> Select:
+        """Parse ``( SELECT ... )`` starting at the opening parenthesis."""
+        self.next()
+        select = self.parse_select()
+        if not self.at_punct(")"):
+            raise SQLValidationError("Unbalanced parentheses around subquery")
+        self.next()
+        return select
+
+    # --- token helpers ---
+    def take_group(self) -> list:
+        """Consume a balanced ( ... ) group and return its inner tokens."""
+        self.next()
+        depth, inner = 1, []
+        while True:
+            token = self.next()
+            if token.type == "punct" and token.value == "(":
+                depth += 1
+            elif token.type == "punct" and token.value == ")":
+                depth -= 1
+                if depth == 0:
+                    return inner
+            inner.append(token)
+
+    def take_until(self, stop_words: set, subqueries: list, stop_at_comma: bool = False) -> list:
+        """
+        Consume tokens at this nesting level until a stop word, a closing
+        parenthesis or a semicolon. Parenthesised SELECTs met on the way are
+        parsed into ``subqueries`` and kept in the token list as a single
+        placeholder token so clause text can still be rebuilt.
+        """
+        taken = []
+        while True:
+            token = self.peek()
+            if token is None or (token.type == "punct" and token.value in (")", ";")):
+                return taken
+            if token.type == "word" and token.upper in stop_words:
+                return taken
+            if stop_at_comma and token.type == "punct" and token.value == ",":
+                return taken
+            if token.type == "punct" and token.value == "(":
+                after = self.peek(1)
+                if after is not None and after.is_word("SELECT", "WITH", "VALUES"):
+                    subqueries.append(self.parse_group_select())
+                    taken.append(Token("subquery", str(len(subqueries) - 1)))
+                    continue
+                start = self.pos
+                inner = self.take_group_with_subqueries(subqueries)
+                taken.extend(self.tokens[start:start + 1] + inner + [Token("punct", ")")])
+                continue
+            taken.append(self.next())
+
+    def take_group_with_subqueries(self, subqueries: list) -> list:
+        self.next()
+        inner = self.take_until(set(), subqueries)
+        if not self.at_punct(")"):
+            raise SQLValidationError("Unbalanced parentheses")
+        self.next()
+        return inner
+
+    @staticmethod
+    def split_commas(tokens: list) -> list:
+        parts, current, depth = [], [], 0
+        for token in tokens:
+            if token.type == "punct" and token.value == "(":
+                depth += 1
+            elif token.type == "punct" and token.value == ")":
+                depth -= 1
+            if depth == 0 and token.type == "punct" and token.value == ",":
+                parts.append(current)
+                current = []
+            else:
+                current.append(token)
+        if current:
+            parts.append(current)
+        return parts
+
+    @staticmethod
+    def make_column(expr: list) -> Column:
+        if len(expr) >= 3 and expr[-2].is_word("AS"):
+            return Column(expr[:-2], expr[-1].name)
+        if len(expr) >= 2 and expr[-1].type in ("word", "qident") and \
+                (expr[-2].type in ("word", "qident", "number", "string", "subquery")
+                 or expr[-2].value == ")") and not expr[-2].is_word("CASE", "ELSE", "THEN", "WHEN", "AND", "OR",
+                                                                   "NOT", "IS", "IN", "LIKE", "DISTINCT",
+                                                                   "COLLATE") \
+                and not expr[-1].is_word("END", "NULL", "ASC", "DESC"):
+            return Column(expr[:-1], expr[-1].name)
+        return Column(expr)
+
+
+# === Parsed statement ===
+@dataclass
+class ParsedQuery:
+    """A validated single read-only statement plus facts derived from it."""
+    statement: str          # original text without trailing semicolon
+    tokens: list
+    ast: Select
+    tables: frozenset       # real tables read, CTE names excluded
+    ctes: tuple
+    normalized: str         # keyword/identifier case and whitespace normalised
+    fingerprint: str        # hash of ``normalized`` with literals replaced by ?
+
+
+def walk_selects(select: Select):
+    """Yield ``select`` and every SELECT nested in it: CTEs, subqueries and FROM subqueries."""
+    yield select
+    for _, cte in select.ctes:
+        yield from walk_selects(cte)
+    for sub in select.subqueries:
+        yield from walk_selects(sub)
+    for core in select.cores:
+        for item in core.from_items:
+            if item.subquery is not None:
+                yield from walk_selects(item.subquery)
+        for sub in core.subqueries:
+            yield from walk_selects(sub)
+
+
+def render_tokens(tokens: list, literal_placeholder: bool = False) -> str:
+    """Join tokens with canonical spacing: keywords upper, identifiers lower."""
+    out, previous = [], None
+    for token in tokens:
+        if token.type == "word":
+            text = token.upper if token.upper in _KEYWORDS else token.value.lower()
+        elif token.type in ("string", "number", "blob") and literal_placeholder:
+            text = "?"
+        else:
+            text = token.value
+        is_call = text == "(" and previous is not None and previous.type in ("word", "qident") \
+            and previous.upper not in _KEYWORDS
+        if out and (text in (")", ",", ".") or is_call or out[-1].endswith(("(", "."))):
+            out[-1] += text
+        else:
+            out.append(text)
+        previous = token
+    return " ".join(out)
+
+
+_KEYWORDS = {
+    "SELECT", "DISTINCT", "ALL", "FROM", "WHERE", "GROUP", "BY", "HAVING", "ORDER", "LIMIT", "OFFSET", "AS",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "ON", "USING", "AND", "OR", "NOT",
+    "IN", "IS", "NULL", "LIKE", "GLOB", "BETWEEN", "CASE", "WHEN", "THEN", "ELSE", "END", "UNION",
+    "INTERSECT", "EXCEPT", "WITH", "RECURSIVE", "ASC", "DESC", "EXISTS", "CAST", "VALUES", "COLLATE",
+    "ESCAPE", "NULLS", "FIRST", "LAST", "OVER", "PARTITION", "FILTER", "WINDOW", "ROWS", "RANGE",
+    "PRECEDING", "FOLLOWING", "UNBOUNDED", "CURRENT", "ROW",
+}
+
+
+@lru_cache(maxsize=2048)
+def parse_sql(sql: str) -> ParsedQuery:
+    """
+    Parse and validate ``sql`` as exactly one read-only SELECT / WITH ...
+    SELECT statement. Results are memoised, so repeated validation of the
+    same text (retries, cache keys, table extraction) costs a dict lookup.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].type == "punct" and tokens[-1].value == ";":
+        tokens.pop()
+    if not tokens:
+        raise SQLValidationError("Empty statement")
+    if any(t.type == "punct" and t.value == ";" for t in tokens):
+        raise SQLValidationError("Multiple statements are not allowed")
+    if not tokens[0].is_word("SELECT", "WITH", "VALUES"):
+        raise SQLValidationError(f"Only SELECT statements are allowed, got {tokens[0].upper}")
+
+    for token, after in zip(tokens, tokens[1:]):
+        if token.type == "word" and token.upper in DENIED_FUNCTIONS and after.value == "(":
+            raise SQLValidationError(f"Function {token.value} is not allowed")
+
+    parser = _Parser(tokens)
+    ast = parser.parse_select()
+    if parser.peek() is not None:
+        raise SQLValidationError(f"Unexpected {parser.peek().value!r} after end of SELECT")
+
+    ctes, tables = set(), set()
+    for select in walk_selects(ast):
+        ctes.update(name for name, _ in select.ctes)
+        for core in select.cores:
+            tables.update(item.table for item in core.from_items if item.table)
+
+    statement = sql.strip()
+    while statement.endswith(";"):
+        statement = statement[:-1].rstrip()
+    normalized = render_tokens(tokens)
+    fingerprint = hashlib.sha1(render_tokens(tokens, literal_placeholder=True).encode("utf-8")).hexdigest()[:16]
+    return ParsedQuery(statement, tokens, ast, frozenset(tables - ctes), tuple(sorted(ctes)), normalized,
+                       fingerprint)
+
+
+def validate_sql(sql: str) -> ParsedQuery:
+    """Alias of parse_sql that reads better at call sites that only validate."""
+    return parse_sql(sql)
+
+
+# === Canonical form ===
+# Joins that commute: their tables can be sorted and their ON conditions moved to WHERE
+_INNER_JOINS = {",", "JOIN", "INNER JOIN", "CROSS JOIN"}
+_JOIN_SPELLINGS = {",": "JOIN", "INNER JOIN": "JOIN", "CROSS JOIN": "JOIN", "LEFT OUTER JOIN": "LEFT JOIN",
+                   "RIGHT OUTER JOIN": "RIGHT JOIN", "FULL OUTER JOIN": "FULL JOIN"}
+_OPERATOR_SPELLINGS = {"<>": "!=", "==": "="}
+# Comparisons that still hold with their operands swapped
+_SWAPPED_OPERATORS = {"=": "=", "!=": "!=", "<": ">", ">": "<", "<=": ">=", ">=": "<="}
+_PLAIN_IDENTIFIER = re.compile(r"[a-z_][a-z0-9_]*")
+# Parts of a statement the AST does not keep
+_TABLE_FUNCTIONS = {"json_each", "json_tree", "generate_series"}
+
+
+@dataclass(frozen=True)
+class CanonicalQuery:
+    sql: str                # valid SQLite, same rows as the input
+    fingerprint: str        # hash of ``sql``
+
+
+def _identifier(name: str) -> Token:
+    if _PLAIN_IDENTIFIER.fullmatch(name) and name.upper() not in _KEYWORDS:
+        return Token("word", name)
+    return Token("qident", '"' + name.replace('"', '""') + '"')
+
+
+def _number(text: str) -> str:
+    if text[:2].lower() == "0x":
+        return str(int(text, 16))
+    if text.isdigit():
+        return str(int(text))
+    return repr(float(text))
+
+
+def _is_punct(token, value: str) -> bool:
+    return token is not None and token.type == "punct" and token.value == value
+
+
+def _split_top(tokens: list, word: str) -> list:
+    """Split on ``word`` (AND / OR) outside parentheses, CASE ... END and BETWEEN ... AND."""
+    parts, current, depth, between = [], [], 0, 0
+    for token in tokens:
+        if token.type == "punct" and token.value == "(" or token.is_word("CASE"):
+            depth += 1
+        elif token.type == "punct" and token.value == ")" or token.is_word("END"):
+            depth -= 1
+        elif depth == 0 and token.is_word("BETWEEN"):
+            between += 1
+        elif depth == 0 and token.is_word(word):
+            if word == "AND" and between:
+                between -= 1
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _unwrap(tokens: list) -> list:
+    """The tokens inside one pair of parentheses enclosing the whole expression, else None."""
+    if len(tokens) < 2 or not _is_punct(tokens[0], "(") or not _is_punct(tokens[-1], ")"):
+        return None
+    depth = 0
+    for i, token in enumerate(tokens):
+        depth += _is_punct(token, "(") - _is_punct(token, ")")
+        if depth == 0 and i < len(tokens) - 1:
+            return None
+    return tokens[1:-1]
+
+
+def _sort_in_lists(tokens: list) -> list:
+    """Sort the literals of ``IN (1, 3, 2)`` lists."""
+    out, i = [], 0
+    while i < len(tokens):
+        out.append(tokens[i])
+        if tokens[i].is_word("IN") and i + 1 < len(tokens) and _is_punct(tokens[i + 1], "("):
+            end = i + 2
+            while end < len(tokens) and not _is_punct(tokens[end], ")"):
+                end += 1
+            items = tokens[i + 2:end]
+            literals = items[::2]
+            if end < len(tokens) and literals and all(t.type in ("string", "number") for t in literals) \
+                    and all(_is_punct(t, ",") for t in items[1::2]):
+                ordered = sorted(literals, key=lambda t: (t.type, t.value))
+                out.append(tokens[i + 1])
+                for j, literal in enumerate(ordered):
+                    out += [literal] if j == 0 else [Token("punct", ","), literal]
+                out.append(tokens[end])
+                i = end
+        i += 1
+    return out
+
+
+def is_column_reference(tokens: list) -> bool:
+    """``column`` or ``table.column``."""
+    return len(tokens) in (1, 3) and all(t.type in ("word", "qident") for t in tokens[::2]) \
+        and not tokens[0].is_word(*_KEYWORDS) and (len(tokens) == 1 or _is_punct(tokens[1], "."))
+
+
+class _Canonicalizer:
+    """Renders a Select bottom-up; ``scope`` maps the table names and aliases in reach to canonical names."""
+
+    def __init__(self, column_aliases: bool):
+        self.column_aliases = column_aliases
+        self.derived = 0
+
+    def select(self, select: Select, scope: dict, top: bool = False) -> str:
+        parts = []
+        if select.ctes:
+            ctes = ", ".join(f"{_identifier(name).value} AS ({self.select(cte, scope)})" for name, cte in select.ctes)
+            parts.append(f"WITH {ctes}")
+        names = {}
+        for i, core in enumerate(select.cores):
+            if i:
+                parts.append(select.compound_ops[i - 1])
+            text, core_names, core_scope = self.core(core, scope, top)
+            if i == 0:
+                names, first_scope = core_names, core_scope
+            parts.append(text)
+        if select.order_by:
+            # ORDER BY of a single SELECT sees its tables; of a compound, only the result columns
+            order_scope = first_scope if len(select.cores) == 1 else scope
+            terms = []
+            for term in _Parser.split_commas(select.order_by):
+                if term and term[-1].is_word("ASC"):
+                    term = term[:-1]
+                terms.append(self.expr(term, order_scope, select.subqueries, names))
+            parts.append("ORDER BY " + ", ".join(terms))
+        if select.limit:
+            parts.append("LIMIT " + self.expr(select.limit, scope, select.subqueries))
+        return " ".join(parts)
+
+    def core(self, core: SelectCore, outer: dict, top: bool = False) -> tuple:
+        counts = {}
+        for item in core.from_items:
+            if item.table:
+                counts[item.table] = counts.get(item.table, 0) + 1
+        scope, seen, names = dict(outer), {}, []
+        for item in core.from_items:
+            if item.table is None:
+                self.derived += 1
+                name = f"sub_{self.derived}"
+            elif counts[item.table] == 1:
+                name = item.table
+            else:
+                seen[item.table] = seen.get(item.table, 0) + 1
+                name = f"{item.table}_{seen[item.table]}"
+            scope[item.alias or item.table] = name
+            names.append(name)
+
+        star = any(column.expr and column.expr[-1].value == "*" for column in core.columns)
+        conditions = core.where + [t for item in core.from_items for t in item.on]
+        aliases = [column.alias for column in core.columns if column.alias]
+        # Only the statement's own result columns: outer queries refer to those of
+        # subqueries and CTEs by name. SQLite also resolves output names in WHERE /
+        # ON, where renaming them could change the meaning.
+        rename = top and not self.column_aliases and not any(t.type in ("word", "qident") and t.name in aliases
+                                                     for t in conditions)
+        columns, renamed = [], {}
+        for i, column in enumerate(core.columns, 1):
+            expr = self.expr(column.expr, scope, core.subqueries)
+            if rename and column.expr[-1].value != "*":
+                if column.alias:
+                    renamed[column.alias] = f"c{i}"
+                columns.append(f"{expr} AS c{i}")
+            elif column.alias:
+                columns.append(f"{expr} AS {_identifier(column.alias).value}")
+            else:
+                columns.append(expr)
+        text = f"SELECT {'DISTINCT ' if core.distinct else ''}{', '.join(columns)}"
+
+        where = self.conjuncts(core.where, scope, core.subqueries)
+        if core.from_items:
+            items = [self.from_item(item, name, outer) for item, name in zip(core.from_items, names)]
+            commutes = not star and all(item.join in _INNER_JOINS and not item.using for item in core.from_items[1:])
+            if commutes:
+                for item in core.from_items[1:]:
+                    where += self.conjuncts(item.on, scope, core.subqueries)
+                text += " FROM " + " JOIN ".join(sorted(items))
+            else:
+                text += f" FROM {items[0]}"
+                for item, rendered in zip(core.from_items[1:], items[1:]):
+                    text += f" {_JOIN_SPELLINGS.get(item.join, item.join)} {rendered}"
+                    if item.on:
+                        text += " ON " + " AND ".join(sorted(self.conjuncts(item.on, scope, core.subqueries)))
+                    if item.using:
+                        text += f" USING ({', '.join(_identifier(c).value for c in item.using)})"
+        if where:
+            text += " WHERE " + " AND ".join(sorted(where))
+        if core.group_by:
+            terms = {self.expr(term, scope, core.subqueries, renamed) for term in _Parser.split_commas(core.group_by)}
+            text += " GROUP BY " + ", ".join(sorted(terms))
+        if core.having:
+            text += " HAVING " + " AND ".join(sorted(self.conjuncts(core.having, scope, core.subqueries, renamed)))
+        return text, renamed, scope
+
+    def from_item(self, item: FromItem, name: str, outer: dict) -> str:
+        if item.subquery is not None:
+            return f"({self.select(item.subquery, outer)}) AS {name}"
+        table = _identifier(item.table).value
+        return table if name == item.table else f"{table} AS {name}"
+
+    def conjuncts(self, tokens: list, scope: dict, subqueries: list, names: dict = None) -> list:
+        """Canonical AND terms of a condition; OR operands are sorted inside their term."""
+        if not tokens:
+            return []
+        disjuncts = _split_top(tokens, "OR")
+        if len(disjuncts) > 1:
+            terms = sorted(" AND ".join(sorted(self.conjuncts(d, scope, subqueries, names))) for d in disjuncts)
+            return [f"({' OR '.join(terms)})"]
+        terms = []
+        for conjunct in _split_top(tokens, "AND"):
+            inner = _unwrap(conjunct)
+            if inner is not None:
+                terms += self.conjuncts(inner, scope, subqueries, names)
+            else:
+                terms.append(self.comparison(conjunct, scope, subqueries, names))
+        return terms
+
+    def comparison(self, tokens: list, scope: dict, subqueries: list, names: dict = None) -> str:
+        mapped = self.tokens(tokens, scope, subqueries, names)
+        for i, token in enumerate(mapped):
+            if token.type == "op" and token.value in _SWAPPED_OPERATORS:
+                left, right = mapped[:i], mapped[i + 1:]
+                literal = len(left) == 1 and left[0].type in ("string", "number")
+                if is_column_reference(right) and (literal or is_column_reference(left) and
+                                             render_tokens(right) < render_tokens(left)):
+                    mapped = right + [Token("op", _SWAPPED_OPERATORS[token.value])] + left
+                break
+        return render_tokens(mapped)
+
+    def expr(self, tokens: list, scope: dict, subqueries: list, names: dict = None) -> str:
+        return render_tokens(self.tokens(tokens, scope, subqueries, names))
+
+    def tokens(self, tokens: list, scope: dict, subqueries: list, names: dict = None) -> list:
+        """Tokens with canonical table names, output names, numbers, operators and identifier quoting."""
+        out = []
+        for i, token in enumerate(tokens):
+            before = tokens[i - 1] if i else None
+            after = tokens[i + 1] if i + 1 < len(tokens) else None
+            if token.type == "subquery":
+                out.append(Token("sql", f"({self.select(subqueries[int(token.value)], scope)})"))
+            elif token.type == "qident" or token.type == "word" and token.upper not in _KEYWORDS:
+                name = token.name
+                if _is_punct(after, ".") and not _is_punct(before, "."):
+                    name = scope.get(name, name)
+                elif names and name in names and not _is_punct(before, ".") and not _is_punct(after, "("):
+                    name = names[name]
+                out.append(_identifier(name))
+            elif token.type == "number":
+                out.append(Token("number", _number(token.value)))
+            elif token.type == "op":
+                out.append(Token("op", _OPERATOR_SPELLINGS.get(token.value, token.value)))
+            else:
+                out.append(token)
+        return _sort_in_lists(out)
+
+
+def _needs_fallback(tokens: list) -> bool:
+    """Statements with parts the AST drops: WINDOW definitions, VALUES, RECURSIVE, CTE column lists, table functions."""
+    for i, token in enumerate(tokens):
+        if token.is_word("WINDOW", "VALUES", "RECURSIVE") or token.type == "word" and \
+                (token.name in _TABLE_FUNCTIONS or token.name.startswith("pragma_")):
+            return True
+        if _is_punct(token, ")") and i + 2 < len(tokens) and tokens[i + 1].is_word("AS") \
+                and _is_punct(tokens[i + 2], "("):
+            return True
+    return False
+
+
+@lru_cache(maxsize=4096)
+def canonicalize(sql: str, column_aliases: bool = True) -> CanonicalQuery:
+    """
+    Canonical form of a SELECT: identical for queries that differ only in
+    layout, case, table aliases, literal spelling, the order of AND / OR
+    operands, IN lists and GROUP BY terms, or the order of inner-joined tables.
+    With ``column_aliases=False`` output columns are named by position (c1,
+    c2, ...), for comparisons that ignore column names.
+    Raises SQLValidationError like parse_sql.
+    """
+    parsed = parse_sql(sql)
+    if _needs_fallback(parsed.tokens):
+        text = parsed.normalized
+    else:
+        text = _Canonicalizer(column_aliases).select(parsed.ast, {}, top=True)
+    return CanonicalQuery(text, hashlib.sha1(text.encode("utf-8")).hexdigest()[:16])
+
+
+# === Conditions ===
+# Comparison operators an index can serve: an equality lookup or a range
+COMPARISONS = {"=": "eq", "==": "eq", "<": "range", ">": "range", "<=": "range", ">=": "range"}
+
+
+def split_conditions(core: SelectCore) -> list:
+    """
+    The AND-ed conditions of a SELECT core's ON and WHERE clauses as token
+    lists without enclosing parentheses; a USING column is ("using", column).
+    """
+    conditions = []
+    for item in core.from_items:
+        conditions += [("using", column) for column in item.using]
+        if item.on:
+            conditions += _split_top(item.on, "AND")
+    if core.where:
+        conditions += _split_top(core.where, "AND")
+    for i, condition in enumerate(conditions):
+        while not isinstance(condition, tuple) and _unwrap(condition):
+            condition = _unwrap(condition)
+        conditions[i] = condition
+    return conditions
+
+
+def comparison(tokens: list):
+    """(left, kind, right) for ``a = b``, ``a < b``, ``a IN (...)`` and ``a BETWEEN x AND y``; else None."""
+    depth = 0
+    for i, token in enumerate(tokens):
+        depth += _is_punct(token, "(") - _is_punct(token, ")")
+        if depth or i == 0:
+            continue
+        if token.type == "op" and token.value in COMPARISONS:
+            return tokens[:i], COMPARISONS[token.value], tokens[i + 1:]
+        if token.is_word("IN", "BETWEEN") and not tokens[i - 1].is_word("NOT"):
+            return tokens[:i], "eq" if token.is_word("IN") else "range", tokens[i + 1:]
+    return None
+
+
+def is_constant(tokens: list) -> bool:
+    """No column references: literals, parameters, keywords and function calls only."""
+    for i, token in enumerate(tokens):
+        if token.type == "subquery" or token.type == "qident":
+            return False
+        if token.type == "word" and token.upper not in _KEYWORDS and \
+                not (i + 1 < len(tokens) and _is_punct(tokens[i + 1], "(")):
+            return False
+    return True
@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# sqlite3 exposes the authorizer action codes as module constants, next to
+# result codes and limit ids that reuse the same numbers, so name them explicitly
+_ALWAYS_ALLOWED = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+_ACTIONS = (
+    "CREATE_INDEX", "CREATE_TABLE", "CREATE_TEMP_INDEX", "CREATE_TEMP_TABLE", "CREATE_TEMP_TRIGGER",
+    "CREATE_TEMP_VIEW", "CREATE_TRIGGER", "CREATE_VIEW", "DELETE", "DROP_INDEX", "DROP_TABLE", "DROP_TEMP_INDEX",
+    "DROP_TEMP_TABLE", "DROP_TEMP_TRIGGER", "DROP_TEMP_VIEW", "DROP_TRIGGER", "DROP_VIEW", "INSERT", "PRAGMA",
+    "READ", "SELECT", "TRANSACTION", "UPDATE", "ATTACH", "DETACH", "ALTER_TABLE", "REINDEX", "ANALYZE",
+    "CREATE_VTABLE", "DROP_VTABLE", "FUNCTION", "SAVEPOINT", "RECURSIVE",
+)
+_ACTION_NAMES = {getattr(sqlite3, f"SQLITE_{name}"): f"SQLITE_{name}" for name in _ACTIONS
+                 if hasattr(sqlite3, f"SQLITE_{name}")}
+
+
+@dataclass
+class ExecutionLimits:
+    """Per-statement budget for generated SQL."""
+    timeout_seconds: float = float(os.getenv("OLIST_QUERY_TIMEOUT", "10"))
+    max_vm_steps: int = int(os.getenv("OLIST_QUERY_MAX_STEPS", "200000000"))
+    check_every: int = 10_000                    # VM instructions between progress callbacks
+    soft_heap_limit: int = 256 * 1024 * 1024     # SQLite starts releasing cache above this
+    hard_heap_limit: int = 1024 * 1024 * 1024    # allocations fail (SQLITE_NOMEM) above this
+    allowed_tables: frozenset = None             # None = every table in the database
+
+
+DEFAULT_LIMITS = ExecutionLimits()
+
+
+class QueryGuardrailError(Exception):
+    """
+    Structured failure for a statement stopped by the sandbox.
+
+    ``kind`` is one of "timeout", "step_budget", "denied" or "memory";
+    ``details`` carries what tripped (elapsed time, steps, the denied action
+    and object). Ordinary SQL errors are not guardrail failures and keep
+    their sqlite3 type.
+    """
+
+    def __init__(self, kind: str, message: str, sql: str = "", **details):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+        self.sql = sql
+        self.details = details
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "message": self.message, "sql": self.sql, **self.details}
+
+
+class _GuardState:
+    def __init__(self, limits: ExecutionLimits, known_tables):
+        self.limits = limits
+        self.known_tables = frozenset(known_tables or ())
+        self.allowed_tables = limits.allowed_tables if limits.allowed_tables is not None else self.known_tables
+        self.deadline = time.monotonic() + limits.timeout_seconds
+        self.started = time.monotonic()
+        self.steps = 0
+        self.tripped = None
+        self.denied = None
+
+    def progress(self) -> int:
+        self.steps += self.limits.check_every
+        if self.steps > self.limits.max_vm_steps:
+            self.tripped = "step_budget"
+            return 1
+        if time.monotonic() > self.deadline:
+            self.tripped = "timeout"
+            return 1
+        return 0
+
+    def _may_read(self, table: str, db_name) -> bool:
+        # db_name is None for reads that touch no column (COUNT(*)) and for CTEs;
+        # CTE names are not schema tables, so only real tables are checked
+        if db_name not in (None, "main") or table.lower().startswith("sqlite_"):
+            return False
+        return table in self.allowed_tables or table not in self.known_tables
+
+    def authorize(self, action, arg1, arg2, db_name, trigger) -> int:
+        if action in _ALWAYS_ALLOWED:
+            return sqlite3.SQLITE_OK
+        if action == sqlite3.SQLITE_READ and self._may_read(arg1, db_name):
+            return sqlite3.SQLITE_OK
+        self.denied = (_ACTION_NAMES.get(action, str(action)), arg1, arg2)
+        return sqlite3.SQLITE_DENY
+
+
+_heap_lock = threading.Lock()
+_heap_limits_applied = None
+
+
+def _apply_heap_limits(conn: sqlite3.Connection, limits: ExecutionLimits):
+    # Heap limits are process-wide in SQLite, so set them once per value pair
+    global _heap_limits_applied
+    wanted = (limits.soft_heap_limit, limits.hard_heap_limit)
+    with _heap_lock:
+        if _heap_limits_applied == wanted:
+            return
+        conn.execute(f"PRAGMA soft_heap_limit = {int(limits.soft_heap_limit)}")
+        conn.execute(f"PRAGMA hard_heap_limit = {int(limits.hard_heap_limit)}")
+        _heap_limits_applied = wanted
+
+
+@contextmanager
+def guarded(conn: sqlite3.Connection, sql: str = "", limits: ExecutionLimits = DEFAULT_LIMITS,
+            known_tables=None):
+    """
+    Install the wall-clock/opcode progress handler and the read-only
+    authorizer on ``conn`` for the duration of the block. Only SELECT, function
+    calls and reads of ``known_tables`` (narrowed by limits.allowed_tables) are
+    authorized. Errors caused by a tripped limit or a denied action are
+    re-raised as QueryGuardrailError; other SQLite errors pass through.
+    """
+    _apply_heap_limits(conn, limits)
+    state = _GuardState(limits, known_tables)
+    conn.set_authorizer(state.authorize)
+    conn.set_progress_handler(state.progress, limits.check_every)
+    try:
+        yield conn
+    except (sqlite3.Error, MemoryError) as e:
+        # SQLITE_NOMEM from the hard heap limit surfaces as MemoryError
+        elapsed = round(time.monotonic() - state.started, 3)
+        if state.tripped == "timeout":
+            error = QueryGuardrailError("timeout", f"Query exceeded {limits.timeout_seconds}s", sql,
+                                        elapsed=elapsed, steps=state.steps)
+        elif state.tripped == "step_budget":
+            error = QueryGuardrailError("step_budget", f"Query exceeded {limits.max_vm_steps} VM steps", sql,
+                                        elapsed=elapsed, steps=state.steps)
+        elif state.denied:
+            action, target, extra = state.denied
+            error = QueryGuardrailError("denied", f"{action} on {target or extra} is not allowed", sql,
+                                        action=action, target=target or extra)
+        elif isinstance(e, MemoryError) or "out of memory" in str(e).lower():
+            error = QueryGuardrailError("memory", f"Query exceeded the {limits.hard_heap_limit} byte heap limit",
+                                        sql, elapsed=elapsed)
+        else:
+            raise
+        logging.warning(f"Guardrail stopped query ({error.kind}): {error.message}")
+        raise error from e
+    finally:
+        conn.set_progress_handler(None, 0)
+        conn.set_authorizer(None)
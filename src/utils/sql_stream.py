@@ -0,0 +1,279 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+from src.utils.sql_parser import SQLValidationError, parse_sql
+
+
+class SQLStatementDetector:
+    """
+    Incrementally finds the first complete SQL statement in streamed text.
+
+    A statement starts with SELECT/WITH at the start of a line or right after
+    a markdown fence, and ends at a ``;`` outside string literals, quoted
+    identifiers and comments, or at a closing fence. ``feed`` returns it as
+    soon as it is complete and passes parse_sql and SQLite's own syntax
+    check; a candidate that does not (prose such as "Select the top
+    category...") is dropped and the search goes on from the next line.
+    """
+    _START = re.compile(r"(?:^|\n|```(?:sql)?)[ \t]*\n?[ \t]*(SELECT|WITH)\b", re.IGNORECASE)
+    # Opening delimiter -> closing delimiter of a region where ; does not count
+    _REGIONS = {"'": "'", '"': '"', "`": "`", "[": "]", "--": "\n", "/*": "*/"}
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._pos = 0
+        self._closing = None
+        self._search_from = 0
+
+    @staticmethod
+    def _is_statement(candidate: str) -> bool:
+        try:
+            statement = parse_sql(candidate).statement
+        except SQLValidationError:
+            return False
+        # Compiled against an empty database: missing tables are fine, syntax errors are not
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute(f"EXPLAIN {statement}")
+        except sqlite3.Error as e:
+            return str(e).startswith("no such ")
+        finally:
+            conn.close()
+        return True
+
+    def _next_start(self, pos: int):
+        match = self._START.search(self.text, pos)
+        # A keyword at the very end may still be the prefix of a longer word
+        if match is None or match.end() == len(self.text):
+            return None
+        return match.start(1)
+
+    def feed(self, delta: str):
+        if self.end is not None:
+            return self.result()
+        self.text += delta
+        while True:
+            if self.start is None:
+                self.start = self._pos = self._next_start(self._search_from)
+                if self.start is None:
+                    return None
+            candidate = self._scan()
+            if candidate is None or self._is_statement(candidate):
+                return candidate
+            self._search_from = self.start + 1
+            self.start = self.end = self._closing = None
+
+    def _scan(self):
+        text, i = self.text, self._pos
+        while i < len(text):
+            if self._closing is not None:
+                if text.startswith(self._closing, i):
+                    i += len(self._closing)
+                    self._closing = None
+                    continue
+                if len(text) - i < len(self._closing):
+                    break           # could be the first half of "*/"
+                i += 1
+                continue
+            rest = text[i:i + 3]
+            if rest in ("`", "``", "-", "/") and i + 3 > len(text):
+                break               # wait: could become ```, -- or /*
+            if text.startswith("```", i):
+                self.end = i
+                return self.result()
+            if text[i] == ";":
+                self.end = i + 1
+                return self.result()
+            opener = text[i:i + 2] if text[i:i + 2] in ("--", "/*") else text[i]
+            if opener in self._REGIONS:
+                self._closing = self._REGIONS[opener]
+                i += len(opener)
+                continue
+            i += 1
+        self._pos = i
+        return None
+
+    def result(self):
+        if self.start is None:
+            return None
+        if self.end is not None:
+            return self.text[self.start:self.end].strip()
+        # The stream ended without a terminator: the first candidate that parses
+        start = self.start
+        while start is not None:
+            candidate = self.text[start:].strip()
+            if self._is_statement(candidate):
+                return candidate
+            match = self._START.search(self.text, start + 1)
+            start = match.start(1) if match else None
+        return None
+
+
+class JSONStringFieldDetector:
+    """
+    Incrementally finds the value of a string field (default ``sql_query``)
+    in a streamed JSON object and returns it, decoded, once its closing quote
+    arrives.
+    """
+
+    def __init__(self, field_name: str = "sql_query"):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field_name))
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._pos = 0
+
+    def feed(self, delta: str):
+        if self.end is not None:
+            return self.result()
+        self.text += delta
+        if self.start is None:
+            match = self._key.search(self.text)
+            if match is None:
+                return None
+            self.start = self._pos = match.end()
+        i = self._pos
+        while i < len(self.text):
+            char = self.text[i]
+            if char == "\\":
+                if i + 1 >= len(self.text):
+                    break
+                i += 2
+                continue
+            if char == '"':
+                self.end = i
+                return self.result()
+            i += 1
+        self._pos = i
+        return None
+
+    def result(self):
+        if self.end is None:
+            return None
+        return json.loads('"' + self.text[self.start:self.end] + '"')
+
+    def parse_object(self) -> dict:
+        """The JSON object up to the detected field, when that field came last; else {}."""
+        try:
+            return json.loads(self.text[:self.end + 1] + "}")
+        except (TypeError, ValueError):
+            return {}
+
+
+# === Stream consumption ===
+@dataclass
+class StreamResult:
+    sql: str                   # None when no complete statement/field was found
+    text: str                  # everything read from the stream
+    time_to_first_token: float
+    time_to_sql: float         # None when the SQL only came with the end of the stream
+    total: float               # until the stream was closed or finished
+    cancelled: bool            # True when generation was cut short after the SQL
+    chunks: int
+
+
+def _delta(chunk) -> str:
+    # Azure sends a first chunk with no choices (prompt filter results)
+    if not chunk.choices:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+class _Reader:
+    def __init__(self, detector, started: float):
+        self.detector = detector
+        self.started = started if started is not None else time.perf_counter()
+        self.first = None
+        self.found = None
+        self.chunks = 0
+
+    def feed(self, chunk) -> bool:
+        self.chunks += 1
+        delta = _delta(chunk)
+        if delta and self.first is None:
+            self.first = time.perf_counter() - self.started
+        if delta and self.detector.feed(delta) is not None:
+            self.found = time.perf_counter() - self.started
+            return True
+        return False
+
+    def result(self, cancelled: bool) -> StreamResult:
+        result = StreamResult(self.detector.result(), self.detector.text, self.first, self.found,
+                              time.perf_counter() - self.started, cancelled, self.chunks)
+        stream_stats.record(result)
+        if result.time_to_sql is not None:
+            logging.info(f"SQL extracted after {result.time_to_sql:.2f}s of {result.total:.2f}s "
+                         f"({'generation cancelled' if cancelled else 'stream finished'})")
+        return result
+
+
+def read_sql_stream(stream, detector=None, started: float = None) -> StreamResult:
+    """
+    Consume a ``stream=True`` chat completion until ``detector`` has the SQL,
+    then close the stream so the rest of the generation is not read.
+    """
+    reader = _Reader(detector or SQLStatementDetector(), started)
+    cancelled = False
+    try:
+        for chunk in stream:
+            if reader.feed(chunk):
+                cancelled = True
+                break
+    finally:
+        stream.close()
+    return reader.result(cancelled)
+
+
+async def aread_sql_stream(stream, detector=None, started: float = None) -> StreamResult:
+    """Async twin of read_sql_stream for AsyncStream responses."""
+    reader = _Reader(detector or SQLStatementDetector(), started)
+    cancelled = False
+    try:
+        async for chunk in stream:
+            if reader.feed(chunk):
+                cancelled = True
+                break
+    finally:
+        await stream.close()
+    return reader.result(cancelled)
+
+
+# === Metrics ===
+@dataclass
+class StreamStats:
+    """Time-to-SQL next to total stream latency, over all streamed generations."""
+    streams: int = 0
+    cancelled: int = 0
+    without_sql: int = 0
+    time_to_sql: list = field(default_factory=list)
+    total: list = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, result: StreamResult):
+        with self.lock:
+            self.streams += 1
+            self.cancelled += result.cancelled
+            self.without_sql += result.time_to_sql is None
+            if result.time_to_sql is not None:
+                self.time_to_sql.append(result.time_to_sql)
+            self.total.append(result.total)
+            del self.time_to_sql[:-1000], self.total[:-1000]
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            to_sql, total = sorted(self.time_to_sql), sorted(self.total)
+        median = lambda values: round(values[len(values) // 2], 4) if values else 0.0
+        mean = lambda values: round(sum(values) / len(values), 4) if values else 0.0
+        return {"streams": self.streams, "cancelled": self.cancelled, "without_sql": self.without_sql,
+                "time_to_sql_mean": mean(to_sql), "time_to_sql_p50": median(to_sql),
+                "total_mean": mean(total), "total_p50": median(total)}
+
+
+stream_stats = StreamStats()
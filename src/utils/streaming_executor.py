@@ -0,0 +1,111 @@
+import logging
+import os
+
+from src.utils.db_pool import get_pool
+from src.utils.sql_sandbox import DEFAULT_LIMITS, ExecutionLimits, guarded
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("OLIST_CHUNK_SIZE", "5000"))
+DEFAULT_MAX_ROWS = int(os.getenv("OLIST_MAX_RESULT_ROWS", "100000"))
+DEFAULT_MAX_BYTES = int(os.getenv("OLIST_MAX_RESULT_BYTES", str(64 * 1024 * 1024)))
+
+
+class ResultLimitExceeded(Exception):
+    """Raised when a result set grows past the row or byte cap."""
+
+    def __init__(self, kind: str, limit: int, sql: str):
+        super().__init__(f"Query result exceeded {kind} limit of {limit}:\n{sql}")
+        self.kind = kind
+        self.limit = limit
+        self.sql = sql
+
+
+def _row_bytes(row) -> int:
+    """Rough in-memory size of a row: payload length for text/blobs, 8 bytes otherwise."""
+    return sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in row)
+
+
+def _to_chunk(rows, columns, output: str):
+    if output == "rows":
+        return rows
+    if output == "arrow":
+        import pyarrow as pa
+        arrays = [pa.array(list(values)) for values in zip(*rows)] if rows else \
+            [pa.array([], type=pa.null()) for _ in columns]
+        return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+    import pandas as pd
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def stream_query(sql: str, params=(), chunk_size: int = DEFAULT_CHUNK_SIZE, max_rows: int = DEFAULT_MAX_ROWS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, output: str = "pandas", scalar: bool = False,
+                 truncate: bool = False, limits: ExecutionLimits = DEFAULT_LIMITS, db_path: str = None):
+    """
+    Execute ``sql`` on a pooled connection and yield the result in chunks.
+
+    ``output`` selects the chunk type: "pandas" DataFrames, "arrow" record
+    batches or plain "rows" lists. Reading stops with ResultLimitExceeded once
+    ``max_rows`` rows or roughly ``max_bytes`` bytes have been read (or, with
+    ``truncate=True``, silently at the cap). With ``scalar=True`` a
+    single-column statement that returns exactly one row is answered after
+    reading at most two rows; anything longer is streamed as usual, so the
+    caller sees the whole result instead of an arbitrary first row.
+
+    Execution runs inside the sql_sandbox guardrails (``limits``): reads of
+    unknown tables and any non-SELECT action are denied and runaway
+    statements are interrupted with QueryGuardrailError.
+
+    The connection stays checked out until the generator is exhausted or
+    closed; wrap partial consumption in ``contextlib.closing``.
+    """
+    pool = get_pool(db_path)
+    # Resolved first: a stale fingerprint reads sqlite_master on a pooled connection of its own
+    tables = pool.table_names()
+    with pool.connection() as conn, guarded(conn, sql, limits, tables):
+        cursor = conn.execute(sql, params)
+        try:
+            columns = [d[0] for d in cursor.description or ()]
+
+            pending = []
+            if scalar and len(columns) == 1:
+                pending = cursor.fetchmany(2)
+                if len(pending) < 2:
+                    yield _to_chunk(pending, columns, output)
+                    return
+
+            total_rows = total_bytes = 0
+            emitted = False
+            while True:
+                rows = pending + cursor.fetchmany(max(chunk_size - len(pending), 1))
+                pending = []
+                if not rows:
+                    break
+                keep, exceeded = len(rows), None
+                if total_rows + keep > max_rows:
+                    keep, exceeded = max_rows - total_rows, ("row", max_rows)
+                for i in range(keep):
+                    total_bytes += _row_bytes(rows[i])
+                    if total_bytes > max_bytes:
+                        keep, exceeded = i, ("byte", max_bytes)
+                        break
+                total_rows += keep
+                if exceeded:
+                    if not truncate:
+                        raise ResultLimitExceeded(exceeded[0], exceeded[1], sql)
+                    logging.warning(f"Result truncated at the {exceeded[0]} limit of {exceeded[1]}")
+                    yield _to_chunk(rows[:keep], columns, output)
+                    return
+                emitted = True
+                yield _to_chunk(rows, columns, output)
+
+            if not emitted:
+                # Keep the column names for empty results
+                yield _to_chunk([], columns, output)
+        finally:
+            cursor.close()
+
+
+def collect_query(sql: str, params=(), **kwargs):
+    """Run ``stream_query`` to completion and return one DataFrame."""
+    import pandas as pd
+    chunks = list(stream_query(sql, params, output="pandas", **kwargs))
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
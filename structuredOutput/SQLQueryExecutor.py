@@ -1,4 +1,19 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 from structuredOutput.SQLQueryGeneratorWithJsonSchema import SQLQueryGeneratorWithJsonSchema
+from src.utils import llmstats
+from src.utils.batch_jobs import (DEFAULT_BATCH_DEPLOYMENT, AzureBatchSubmitter, batch_request,
+                                  read_batch_output, wait_for_batch, write_jsonl)
+from src.utils.batch_runner import run_batch
+from src.utils.query_backends import get_backend
+from src.utils.query_plan import inspect_query, record_execution
+from src.utils.rate_limit import DeploymentRateLimiter
+from src.utils.sql_parser import parse_sql
 
 
 class SQLQueryExecutor:
@@ -18,8 +33,131 @@ class SQLQueryExecutor:
         print("\nGenerated SQL Query:")
         print(sql_query)
 
+    async def run_batch(self, user_questions, concurrency=4, timeout=60.0):
+        """Generates SQL for all questions concurrently, printing each result as it completes."""
+        results = []
+        async for outcome in run_batch(user_questions, self.sql_generator.agenerate_sql_query,
+                                       concurrency=concurrency, timeout=timeout,
+                                       rate_limiter=DeploymentRateLimiter()):
+            print(f"\n[{outcome.index + 1}] {outcome.item} ({outcome.latency:.2f}s)")
+            if outcome.ok:
+                steps, sql_query = outcome.value
+                print(sql_query)
+            else:
+                print("Failed:", outcome.error)
+            results.append(outcome)
+        return sorted(results, key=lambda r: r.index)
+
+    # === Offline batch mode ===
+    def run_offline(self, user_questions, job_dir=".cache/batch_jobs/latest", submitter=None,
+                    model=DEFAULT_BATCH_DEPLOYMENT, workers=4, poll_interval=30.0, output_path=None):
+        """
+        Generates SQL for all questions through the Batch API, then executes it.
+
+        Writes requests.jsonl, submits it, polls until the batch is done,
+        joins the outputs back to their questions, runs every SQL on a pool of
+        ``workers`` threads and writes results.jsonl to ``job_dir`` (plus a
+        generated_queries.txt-style report when ``output_path`` is given).
+        Running again with the same job_dir and questions resumes the
+        submitted batch instead of paying for it twice, unless that batch
+        ended failed, expired or cancelled, in which case it is resubmitted.
+        """
+        job_dir = Path(job_dir)
+        job_file = job_dir / "job.json"
+        submitter = submitter or AzureBatchSubmitter(self.sql_generator.client)
+        questions = {f"q-{i:05d}": question for i, question in enumerate(user_questions)}
+
+        job = json.loads(job_file.read_text(encoding="utf-8")) if job_file.exists() else None
+        if job is not None and (job["questions"] != questions or job["submitter"] != submitter.name):
+            job = None
+        if job is not None:
+            status = submitter.status(job["batch_id"])
+            if status.done and status.state != "completed":
+                # A failed, expired or cancelled batch never produces output; submit the job again
+                print(f"Batch {job['batch_id']} ended {status.state}, submitting again")
+                job = None
+            else:
+                print(f"Resuming batch {job['batch_id']}")
+        if job is None:
+            requests = [batch_request(custom_id, self.sql_generator.batch_body(question, model))
+                        for custom_id, question in questions.items()]
+            batch_id = submitter.submit(write_jsonl(job_dir / "requests.jsonl", requests))
+            job = {"batch_id": batch_id, "submitter": submitter.name, "model": model,
+                   "submitted_at": time.time(), "questions": questions}
+            job_file.write_text(json.dumps(job, indent=2, ensure_ascii=False), encoding="utf-8")
+
+        wait_for_batch(submitter, job["batch_id"], poll_interval)
+        outputs = read_batch_output(submitter.download(job["batch_id"], job_dir))
+        if not job.get("usage_recorded"):
+            # Batch calls bypass the client hooks; count their tokens once per batch, not per resume
+            for output in outputs.values():
+                if output.usage:
+                    llmstats.record_usage("SQLQueryExecutor:run_offline", output.usage, model=job["model"],
+                                          batch=True)
+            job["usage_recorded"] = True
+            job_file.write_text(json.dumps(job, indent=2, ensure_ascii=False), encoding="utf-8")
+        results = self.execute_outputs(questions, outputs, workers)
+        write_jsonl(job_dir / "results.jsonl", results)
+        if output_path:
+            self.write_report(results, output_path)
+        failed = sum(1 for r in results if r["error"])
+        print(f"Batch {job['batch_id']}: {len(results) - failed}/{len(results)} questions answered, "
+              f"results in {job_dir / 'results.jsonl'}")
+        return results
+
+    def execute_outputs(self, questions, outputs, workers=4):
+        """Parses each batch output and runs its SQL on the query backend, ``workers`` at a time."""
+        def execute(item):
+            custom_id, question = item
+            result = {"custom_id": custom_id, "question": question, "steps": [], "sql": None,
+                      "result": None, "error": None, "execute_ms": None}
+            output = outputs.get(custom_id)
+            plan, started = None, time.perf_counter()
+            try:
+                if output is None or not output.ok:
+                    raise RuntimeError(output.error if output else "missing from batch output")
+                result["steps"], result["sql"] = self.sql_generator.parse_content(output.content)
+                statement = parse_sql(result["sql"]).statement
+                plan = inspect_query(statement, question)
+                started = time.perf_counter()
+                df = get_backend().execute(statement)
+                result["execute_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                result["result"] = json.loads(df.to_json(orient="split", index=False))
+                record_execution(question, plan, time.perf_counter() - started, rows=len(df))
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                record_execution(question, plan, time.perf_counter() - started, error=result["error"])
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(execute, questions.items()))
+
+    @staticmethod
+    def write_report(results, output_path):
+        """Writes results in the generated_queries.txt layout: SQL, its result, a separator."""
+        import pandas as pd
+
+        with Path(output_path).open("w", encoding="utf-8") as f:
+            for result in results:
+                f.write(f"{result['sql'] or '-- ' + result['question']}\n\n")
+                if result["error"]:
+                    f.write(f"Query Error: {result['error']}\n")
+                else:
+                    f.write(f"Query Result: {pd.DataFrame(**result['result'])}\n")
+                f.write("-" * 65 + "\n\n")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate and run SQL for the Olist questions.")
+    parser.add_argument("--offline", action="store_true", help="use the Batch API instead of live calls")
+    parser.add_argument("--local", action="store_true", help="offline against the local file-based batch stand-in")
+    parser.add_argument("--questions", help="file with one question per line (default: the built-in list)")
+    parser.add_argument("--job-dir", default=".cache/batch_jobs/latest")
+    parser.add_argument("--output", help="also write a generated_queries.txt-style report here")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    args = parser.parse_args()
+
     executor = SQLQueryExecutor()
 
     user_questions = [
@@ -35,5 +173,17 @@ if __name__ == "__main__":
         "What percentage of orders are delivered before the estimated delivery date? [float: percentage]",
     ]
 
-    for question in user_questions:
-        executor.run(question)
+    if args.questions:
+        user_questions = [line.strip() for line in Path(args.questions).read_text(encoding="utf-8").splitlines()
+                          if line.strip()]
+
+    if args.offline or args.local:
+        submitter = None
+        if args.local:
+            from src.utils.batch_jobs import LocalBatchSubmitter
+            from src.utils.fake_llm import reference_responder
+            submitter = LocalBatchSubmitter(reference_responder())
+        executor.run_offline(user_questions, args.job_dir, submitter, workers=args.workers,
+                             poll_interval=1.0 if args.local else args.poll_interval, output_path=args.output)
+    else:
+        asyncio.run(executor.run_batch(user_questions, concurrency=4))
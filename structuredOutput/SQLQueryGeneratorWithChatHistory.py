@@ -1,25 +1,19 @@
 from pydantic import BaseModel, Field
-from openai import AzureOpenAI
-import dotenv
-import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 import json
+import math
 import time  # For introducing small delays if needed
 
 from structuredOutput.olist_dataset import OlistDatasetInfo
+from src.utils.azure_client import deployment_for, get_client
+from src.utils.query_backends import get_backend
+from src.utils.sql_equivalence import check_equivalence, result_signature
+from src.utils.sql_parser import canonicalize, parse_sql
 
-# Load environment variables
-dotenv.load_dotenv()
-azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-openai_api_key = os.getenv("OPENAI_API_KEY")
-azure_openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-azure_openai_model = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-
-# Initialize OpenAI client
-client = AzureOpenAI(
-    azure_endpoint=azure_endpoint,
-    api_key=openai_api_key,
-    api_version=azure_openai_api_version
-)
+# Shared client from the registry (AZURE_OPENAI_* environment variables)
+azure_openai_model = deployment_for()
 
 
 # Structured output format for generated SQL
@@ -28,11 +22,11 @@ class SQLGeneration(BaseModel):
     sql_query: str = Field(..., description="The final SQL query (PostgreSQL syntax)")
 
 
-# Function to evaluate SQL quality
-def evaluate_sql(generated_sql, correct_sql, query_description):
-    """Evaluate the generated SQL against the correct SQL using an LLM"""
+# Function to explain why generated SQL is wrong
+def explain_sql_difference(generated_sql, correct_sql, query_description, difference, client=None):
+    """Ask the LLM what is wrong with the generated SQL, given how its result differs"""
     eval_prompt = f"""
-    As a SQL expert, evaluate the generated SQL query against the correct SQL query.
+    As a SQL expert, explain why the generated SQL query does not return the same result as the correct SQL query.
 
     Query task: {query_description}
 
@@ -40,26 +34,46 @@ def evaluate_sql(generated_sql, correct_sql, query_description):
 
     Correct SQL: {correct_sql}
 
+    Result difference: {difference}
+
     Provide a JSON response with the following fields:
-    - "is_correct": boolean (true if functionally equivalent, false otherwise)
-    - "errors": list of string errors if any (empty list if correct)
-    - "correction": string with corrected SQL if needed (empty string if correct)
+    - "errors": list of string errors
+    - "correction": string with corrected SQL
     - "explanation": string explaining what was wrong and how it was fixed
     """
 
-    response = client.chat.completions.create(
+    response = (client or get_client()).chat.completions.create(
         model="gpt-4o",
         messages=[{"role": "system", "content": "You are a SQL expert evaluator."},
                   {"role": "user", "content": eval_prompt}],
         response_format={"type": "json_object"}
     )
 
-    result = json.loads(response.choices[0].message.content)
+    return json.loads(response.choices[0].message.content)
+
+
+# Function to evaluate SQL quality
+def evaluate_sql(generated_sql, correct_sql, query_description, client=None, explain=True):
+    """
+    Evaluate the generated SQL against the correct SQL by executing both and
+    comparing results; the LLM is only asked to explain a mismatch.
+    """
+    verdict = check_equivalence(generated_sql, correct_sql)
+    result = {"is_correct": verdict.equivalent, "errors": [] if verdict.equivalent else [verdict.reason],
+              "correction": "", "explanation": verdict.reason, "method": verdict.method}
+    if verdict.equivalent or not explain:
+        return result
+
+    difference = verdict.reason
+    if verdict.sample_diff:
+        difference += f"; rows only in the generated result: {verdict.sample_diff}"
+    explanation = explain_sql_difference(generated_sql, correct_sql, query_description, difference, client)
+    result.update({key: explanation[key] for key in ("errors", "correction", "explanation") if key in explanation})
     return result
 
 
 # Function to iteratively improve SQL using feedback
-def refine_sql_with_feedback(question, correct_sql, system_prompt, max_attempts=3):
+def refine_sql_with_feedback(question, correct_sql, system_prompt, max_attempts=3, retry_delay=1.0, client=None):
     """
     Iteratively improves SQL generation with feedback until correctness is achieved or max attempts reached.
     """
@@ -73,7 +87,7 @@ def refine_sql_with_feedback(question, correct_sql, system_prompt, max_attempts=
         # Ask LLM for SQL query
         messages = conversation + [{"role": "user", "content": question}]
         try:
-            completion = client.beta.chat.completions.parse(
+            completion = (client or get_client()).beta.chat.completions.parse(
                 model=azure_openai_model,
                 messages=messages,
                 response_format=SQLGeneration
@@ -83,7 +97,7 @@ def refine_sql_with_feedback(question, correct_sql, system_prompt, max_attempts=
             raise ConnectionError(f"Error generating SQL: {e}")
 
         # Evaluate the SQL
-        evaluation = evaluate_sql(generated_sql, correct_sql, question)
+        evaluation = evaluate_sql(generated_sql, correct_sql, question, client=client)
 
         # Add generated SQL to conversation history
         conversation.append({"role": "assistant", "content": generated_sql})
@@ -107,34 +121,145 @@ def refine_sql_with_feedback(question, correct_sql, system_prompt, max_attempts=
         conversation.append({"role": "user", "content": feedback})
 
         # Small delay to avoid overwhelming API
-        time.sleep(1)
+        time.sleep(retry_delay)
 
     print(" Maximum attempts reached. Returning last attempted SQL.")
     return generated_sql, conversation
 
 
-# Example Query Execution with Iterative Refinement
-question = "Which product category has the highest rate of 5-star reviews? [string: category_name]"
-correct_sql_map = {
-    question: """
-    SELECT p.product_category_name 
-    FROM products p
-    JOIN order_items oi ON p.product_id = oi.product_id
-    JOIN order_reviews r ON oi.order_id = r.order_id
-    GROUP BY p.product_category_name
-    HAVING COUNT(*) > 100
-    ORDER BY (COUNT(CASE WHEN r.review_score = 5 THEN 1 END) * 100.0 / COUNT(*)) DESC
-    LIMIT 1;
+# === Self-consistency: parallel candidates voted on by their results ===
+@dataclass
+class Candidate:
+    sql: str
+    result: object = None       # DataFrame when the SQL ran
+    error: str = None
+    signature: str = None       # hash of the result set, order-insensitive
+
+
+@dataclass
+class SelfConsistencyResult:
+    sql: str
+    result: object
+    agreed: bool                # a quorum of candidates returned the same result
+    votes: int
+    candidates: list = field(default_factory=list)
+    fell_back: bool = False     # answer came from refine_sql_with_feedback
+    latency: float = 0.0
+
+
+def generate_candidates(question, system_prompt, n=5, temperature=0.8, parallel_requests=False, client=None):
     """
-}
+    Sample ``n`` SQL candidates at once: one request with ``n=`` choices, or
+    ``n`` concurrent single-choice requests when ``parallel_requests`` is set
+    (for deployments that don't support ``n``).
+    """
+    client = client or get_client()
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": question}]
+
+    def sample(count):
+        completion = client.beta.chat.completions.parse(
+            model=azure_openai_model,
+            messages=messages,
+            response_format=SQLGeneration,
+            temperature=temperature,
+            n=count
+        )
+        return [choice.message.parsed.sql_query for choice in completion.choices if choice.message.parsed]
 
-# Load dataset info
-dataset_info = OlistDatasetInfo.get_dataset_info2()
+    if not parallel_requests:
+        return sample(n)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return [sql for batch in pool.map(sample, [1] * n) for sql in batch]
 
-# Generate and refine SQL iteratively
-final_sql, conversation_history = refine_sql_with_feedback(
-    question, correct_sql_map[question], dataset_info
-)
 
-print("\n Final Optimized SQL:\n", final_sql)
-print("\n Full Conversation History:\n", conversation_history)
+def execute_candidates(sqls, max_workers=4):
+    """
+    Validate and run every candidate on the query backend concurrently.
+    Candidates with the same canonical form run once and share the result.
+    """
+    def run(sql):
+        candidate = Candidate(sql)
+        try:
+            candidate.result = get_backend().execute(parse_sql(sql).statement)
+            candidate.signature = result_signature(candidate.result)
+        except Exception as e:
+            candidate.error = str(e)
+        return candidate
+
+    def key(sql):
+        try:
+            return canonicalize(sql).fingerprint
+        except ValueError:
+            return sql
+
+    unique = {}
+    for sql in sqls:
+        unique.setdefault(key(sql), sql)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        ran = dict(zip(unique, pool.map(run, unique.values())))
+    return [replace(ran[key(sql)], sql=sql) for sql in sqls]
+
+
+def vote(candidates, min_agreement=0.5):
+    """Pick the largest group of candidates with identical results; returns (winner, votes, agreed)."""
+    counts = Counter(c.signature for c in candidates if c.signature)
+    if not counts:
+        return None, 0, False
+    signature, votes = counts.most_common(1)[0]
+    quorum = max(2, math.ceil(len(candidates) * min_agreement))
+    # Shortest SQL of the winning group is usually the cleanest one
+    winner = min((c for c in candidates if c.signature == signature), key=lambda c: len(c.sql))
+    return winner, votes, votes >= quorum
+
+
+def generate_sql_self_consistent(question, system_prompt, correct_sql=None, n=5, temperature=0.8,
+                                 parallel_requests=False, min_agreement=0.5, retry_delay=1.0, client=None):
+    """
+    Generate ``n`` candidates concurrently, execute them all and answer with
+    the result most of them agree on. Only when they disagree (and
+    ``correct_sql`` is known) does it fall back to the serial feedback loop.
+    """
+    started = time.perf_counter()
+    candidates = execute_candidates(generate_candidates(question, system_prompt, n, temperature,
+                                                        parallel_requests, client))
+    winner, votes, agreed = vote(candidates, min_agreement)
+    print(f"Self-consistency: {votes}/{len(candidates)} candidates agree"
+          f"{'' if agreed else ' (no quorum)'}")
+
+    if agreed or correct_sql is None:
+        return SelfConsistencyResult(winner.sql if winner else None, winner.result if winner else None,
+                                     agreed, votes, candidates, latency=time.perf_counter() - started)
+
+    final_sql, _ = refine_sql_with_feedback(question, correct_sql, system_prompt,
+                                            retry_delay=retry_delay, client=client)
+    fallback = execute_candidates([final_sql])[0]
+    return SelfConsistencyResult(final_sql, fallback.result, False, votes, candidates, fell_back=True,
+                                 latency=time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    # Example Query Execution with Iterative Refinement
+    question = "Which product category has the highest rate of 5-star reviews? [string: category_name]"
+    correct_sql_map = {
+        question: """
+        SELECT p.product_category_name 
+        FROM products p
+        JOIN order_items oi ON p.product_id = oi.product_id
+        JOIN order_reviews r ON oi.order_id = r.order_id
+        GROUP BY p.product_category_name
+        HAVING COUNT(*) > 100
+        ORDER BY (COUNT(CASE WHEN r.review_score = 5 THEN 1 END) * 100.0 / COUNT(*)) DESC
+        LIMIT 1;
+        """
+    }
+
+    # Load dataset info
+    dataset_info = OlistDatasetInfo.get_dataset_info2()
+
+    # Generate and refine SQL iteratively
+    final_sql, conversation_history = refine_sql_with_feedback(
+        question, correct_sql_map[question], dataset_info
+    )
+
+    print("\n Final Optimized SQL:\n", final_sql)
+    print("\n Full Conversation History:\n", conversation_history)
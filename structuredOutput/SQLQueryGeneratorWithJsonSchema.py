@@ -1,30 +1,40 @@
-import os
 import json
-import dotenv
-from openai import AzureOpenAI
-from olist_dataset import OlistDatasetInfo  # Import the dataset info class
-
-# Load environment variables from .env file
-dotenv.load_dotenv()
+import os
+import time
+from structuredOutput.fewShotLearning import format_examples, get_example_store
+from structuredOutput.olist_dataset import OlistDatasetInfo  # Import the dataset info class
+from structuredOutput.queryExpansion import expand_question
+from src.utils.azure_client import config_for, get_async_client, get_client
+from src.utils.prompt_builder import get_prompt_builder, prompt_cache_stats
+from src.utils.sql_stream import JSONStringFieldDetector, aread_sql_stream, read_sql_stream
 
 
 class SQLQueryGeneratorWithJsonSchema:
     """A class to generate SQL queries based on user questions using OpenAI's structured output."""
 
-    def __init__(self):
-        """Initializes the OpenAI client using Azure credentials from environment variables."""
-        azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        azure_openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION")
+    def __init__(self, few_shot=None, few_shot_k=None, schema="info2", model="gpt-4o"):
+        """
+        Uses the shared Azure OpenAI client for the AZURE_OPENAI_* environment variables.
+
+        few_shot: "retrieved" (default, OLIST_FEW_SHOT) adds up to few_shot_k
+        (OLIST_FEW_SHOT_K, 3) validated examples most similar to each question,
+        skipping those scoring below OLIST_FEW_SHOT_MIN_SCORE (0.25); "static"
+        keeps the three fixed examples of the dataset info; "none" sends no examples.
 
-        if not all([azure_endpoint, openai_api_key, azure_openai_api_version]):
-            raise ValueError("Missing required Azure OpenAI environment variables")
+        schema: the dataset description sent, "info2" (get_dataset_info2),
+        "info" (get_dataset_info) or "compact" (get_compact_dataset_info).
 
-        self.client = AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=openai_api_key,
-            api_version=azure_openai_api_version
-        )
+        Category, city and state terms in the question are mapped to their
+        database literals first (OLIST_QUERY_EXPANSION=0 turns this off).
+        """
+        self.config = config_for("azure")  # raises ValueError when variables are missing
+        self.client = get_client(config=self.config)
+        self.few_shot = few_shot or os.getenv("OLIST_FEW_SHOT", "retrieved")
+        self.few_shot_k = few_shot_k if few_shot_k is not None else int(os.getenv("OLIST_FEW_SHOT_K", "3"))
+        self.few_shot_min_score = float(os.getenv("OLIST_FEW_SHOT_MIN_SCORE", "0.25"))
+        self.query_expansion = os.getenv("OLIST_QUERY_EXPANSION", "1") == "1"
+        self.schema = schema
+        self.model = model
 
         # Define the response format using JSON Schema
         self.response_format = {
@@ -51,37 +61,107 @@ class SQLQueryGeneratorWithJsonSchema:
             }
         }
 
-    def generate_sql_query(self, user_question):
+    @property
+    def async_client(self):
+        """Async client for concurrent batch generation (one per running event loop)."""
+        return get_async_client(config=self.config)
+
+    @property
+    def prompt(self):
+        """Prompt builder: instructions and dataset info form a cacheable prefix, the question comes last."""
+        # Retrieve dataset information; retrieved examples go after the cached prefix
+        if self.schema == "info":
+            dataset_info = OlistDatasetInfo.get_dataset_info()
+        elif self.schema == "compact":
+            dataset_info = OlistDatasetInfo.get_compact_dataset_info()
+        else:
+            dataset_info = OlistDatasetInfo.get_dataset_info2(include_examples=self.few_shot == "static")
+        schema = "" if self.schema == "info2" else f", {self.schema} schema"
+        return get_prompt_builder(
+            f"SQLQueryGeneratorWithJsonSchema ({self.few_shot} examples{schema})",
+            "You are an expert in Olist's DB. Provide 1-3 short reasoning steps, then a final SQL.",
+            dataset_info
+        )
+
+    def build_messages(self, user_question):
+        """Builds the chat messages for a user question."""
+        context = []
+        if self.few_shot == "retrieved":
+            examples = get_example_store().top_k(user_question, self.few_shot_k, min_score=self.few_shot_min_score)
+            context.append(format_examples(examples))
+        if self.query_expansion:
+            context.append(expand_question(user_question).hint())
+        return self.prompt.messages(user_question, context="\n\n".join(filter(None, context)))
+
+    def batch_body(self, user_question, model):
+        """Request body for one question in a Batch API input file."""
+        return {"model": model, "messages": self.build_messages(user_question),
+                "response_format": self.response_format}
+
+    @staticmethod
+    def parse_response(completion):
+        """Extracts (steps, sql_query) from a structured-output completion."""
+        # Extract response content (JSON string) and parse it
+        return SQLQueryGeneratorWithJsonSchema.parse_content(completion.choices[0].message.content)
+
+    @staticmethod
+    def parse_content(response_text):
+        """Extracts (steps, sql_query) from the JSON text of a completion (e.g. a batch output line)."""
+        response_data = json.loads(response_text)
+
+        # Extract steps and SQL query
+        steps = response_data.get("steps", ["No explanation provided."])
+        sql_query = response_data.get("sql_query", "No SQL query generated.")
+
+        return steps, sql_query
+
+    @staticmethod
+    def parse_streamed(detector):
+        """Extracts (steps, sql_query) from a stream stopped right after the sql_query field."""
+        steps = detector.parse_object().get("steps", ["No explanation provided."])
+        sql_query = detector.result() or "No SQL query generated."
+        return steps, sql_query
+
+    def generate_sql_query(self, user_question, stream=False):
         """
         Generates an SQL query and explanation based on the Olist dataset.
 
         Parameters:
         - user_question (str): The SQL-related question from the user.
+        - stream (bool): Stream the completion and stop once the sql_query field is closed.
 
         Returns:
         - steps (list): Explanation of the query in multiple steps.
         - sql_query (str): The generated SQL query.
         """
-        dataset_info = OlistDatasetInfo.get_dataset_info2()  # Retrieve dataset information
-
-        messages = [
-            {"role": "system",
-             "content": "You are an expert in Olist's DB. Provide 1-3 short reasoning steps, then a final SQL."},
-            {"role": "user", "content": f"Dataset info: {dataset_info}\n\nQuestion: {user_question}"}
-        ]
-
+        started = time.perf_counter()
         completion = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            response_format=self.response_format
+            model=self.model,
+            messages=self.build_messages(user_question),
+            response_format=self.response_format,
+            stream=stream
         )
+        if stream:
+            detector = JSONStringFieldDetector("sql_query")
+            read_sql_stream(completion, detector, started)
+            return self.parse_streamed(detector)
 
-        # Extract response content (JSON string) and parse it
-        response_text = completion.choices[0].message.content
-        response_data = json.loads(response_text)
+        prompt_cache_stats.record(self.prompt.prefix_hash, completion.usage, time.perf_counter() - started)
+        return self.parse_response(completion)
 
-        # Extract steps and SQL query
-        steps = response_data.get("steps", ["No explanation provided."])
-        sql_query = response_data.get("sql_query", "No SQL query generated.")
+    async def agenerate_sql_query(self, user_question, stream=False):
+        """Async variant of generate_sql_query for concurrent batches."""
+        started = time.perf_counter()
+        completion = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self.build_messages(user_question),
+            response_format=self.response_format,
+            stream=stream
+        )
+        if stream:
+            detector = JSONStringFieldDetector("sql_query")
+            await aread_sql_stream(completion, detector, started)
+            return self.parse_streamed(detector)
 
-        return steps, sql_query
\ No newline at end of file
+        prompt_cache_stats.record(self.prompt.prefix_hash, completion.usage, time.perf_counter() - started)
+        return self.parse_response(completion)
@@ -0,0 +1,183 @@
+"""
+Few-shot examples retrieved per question instead of a fixed list in the prompt.
+
+    store = get_example_store()
+    examples = store.top_k("Which state has the most customers?", k=3)
+    context = format_examples(examples)
+
+The examples are the validated question/SQL pairs in correct_queries.txt plus
+any JSONL files of {"question": ..., "sql": ...} lines passed in or listed
+in OLIST_FEW_SHOT_FILES (comma separated). They are embedded once into a
+row-normalised numpy matrix, so a search is one matrix-vector product and a
+top-k partition.
+
+The embedding function (texts -> 2-D array) is pluggable and picked with
+OLIST_EMBEDDING: "hashing" (default) is a local, deterministic bag of words
+and character trigrams that needs no network, "azure" calls the
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT deployment with vectors cached under
+.cache/few_shot.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from src.utils.reference_queries import load_reference_cases
+
+FEW_SHOT_CACHE_DIR = Path(".cache") / "few_shot"
+HASHING_DIM = 1024
+_WORD = re.compile(r"[a-z0-9_]+")
+_STOP_WORDS = {"a", "an", "and", "are", "by", "do", "does", "for", "has", "have", "in", "is", "of", "on", "the",
+               "to", "what", "what's", "which", "with"}
+
+
+@dataclass(frozen=True)
+class Example:
+    question: str
+    sql: str
+    source: str = "correct_queries.txt"
+
+
+def _normalize_question(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+# === Embeddings ===
+def hashing_embedding(texts, dim: int = HASHING_DIM) -> np.ndarray:
+    """Hashed counts of words (weight 1) and their character trigrams (weight 0.5)."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in _WORD.findall(text.lower()):
+            if word in _STOP_WORDS:
+                continue
+            vectors[row, zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                vectors[row, zlib.crc32(padded[i:i + 3].encode("utf-8")) % dim] += 0.5
+    return vectors
+
+
+hashing_embedding.cache_key = None      # cheap enough to recompute
+
+
+def azure_embedding(deployment: str = None, batch_size: int = 256):
+    """Embedding function backed by an Azure OpenAI embeddings deployment."""
+    deployment = deployment or os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+
+    def embed(texts) -> np.ndarray:
+        from src.utils.azure_client import get_client
+
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = get_client().embeddings.create(model=deployment, input=list(texts[start:start + batch_size]))
+            vectors += [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return np.asarray(vectors, dtype=np.float32)
+
+    embed.cache_key = f"azure-{deployment}"
+    return embed
+
+
+EMBEDDINGS = {"hashing": lambda: hashing_embedding, "azure": azure_embedding}
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+# === Index ===
+class ExampleIndex:
+    """Examples and their unit-length embeddings; cosine similarity is a dot product."""
+
+    def __init__(self, examples, embed=hashing_embedding):
+        self.examples = []
+        seen = set()
+        for example in examples:
+            key = _normalize_question(example.question)
+            if key not in seen:
+                seen.add(key)
+                self.examples.append(example)
+        self.embed = embed
+        self.vectors = _unit_rows(self._embed_examples([e.question for e in self.examples]))
+        logging.info(f"Few-shot index: {len(self.examples)} examples, {self.vectors.shape[1]} dimensions")
+
+    def _embed_examples(self, texts: list) -> np.ndarray:
+        cache_key = getattr(self.embed, "cache_key", None)
+        if not texts:
+            return np.zeros((0, 1), dtype=np.float32)
+        if not cache_key:
+            return self.embed(texts)
+        digest = hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest()[:16]
+        path = FEW_SHOT_CACHE_DIR / f"{cache_key}-{digest}.npy"
+        if path.exists():
+            return np.load(path)
+        vectors = self.embed(texts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, vectors)
+        return vectors
+
+    def search(self, question: str, k: int = 3, min_score: float = 0.0, skip_identical: bool = True) -> list:
+        """
+        Up to ``k`` (example, score) pairs, best first. ``skip_identical``
+        leaves out an example for the question itself, so evaluating on a
+        validated question never hands the model its answer.
+        """
+        if not self.examples or k <= 0:
+            return []
+        query = _unit_rows(self.embed([question]))[0]
+        scores = self.vectors @ query
+        if skip_identical:
+            key = _normalize_question(question)
+            scores = np.where([_normalize_question(e.question) == key for e in self.examples], -np.inf, scores)
+        top = min(k, len(scores))
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(self.examples[i], float(scores[i])) for i in ranked if scores[i] > min_score]
+
+    def top_k(self, question: str, k: int = 3, **kwargs) -> list:
+        return [example for example, _ in self.search(question, k, **kwargs)]
+
+
+# === Loading ===
+def load_examples(paths=()) -> list:
+    """Validated pairs from correct_queries.txt followed by those in the JSONL ``paths``."""
+    examples = [Example(case.question, case.sql) for case in load_reference_cases()]
+    for path in paths:
+        with Path(path).open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    examples.append(Example(row["question"], row["sql"], Path(path).name))
+    return examples
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_example_store(embedding: str = None, paths=None) -> ExampleIndex:
+    """Shared index for an embedding name (default OLIST_EMBEDDING) and example files."""
+    embedding = embedding or os.getenv("OLIST_EMBEDDING", "hashing")
+    if paths is None:
+        paths = [p for p in os.getenv("OLIST_FEW_SHOT_FILES", "").split(",") if p.strip()]
+    key = (embedding, tuple(paths))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ExampleIndex(load_examples(paths), EMBEDDINGS[embedding]())
+        return store
+
+
+def format_examples(examples) -> str:
+    """Examples in the layout of the static ones in OlistDatasetInfo.get_dataset_info2()."""
+    if not examples:
+        return ""
+    blocks = [f"Question: {example.question}\n```sql\n{example.sql.strip()}\n```" for example in examples]
+    return "## Example Questions and Answers\n\n" + "\n\n".join(blocks)
@@ -1,9 +1,17 @@
+from src.utils.schema_prompt import DEFAULT_TOKEN_BUDGET, get_compact_schema
+
+
 class OlistDatasetInfo:
     """
     This class provides a structured description of the Olist dataset,
     making it easier for AI models to understand and generate accurate SQL queries.
     """
 
+    @staticmethod
+    def get_compact_dataset_info(token_budget: int = DEFAULT_TOKEN_BUDGET, db_path: str = None):
+        """Introspected, token-budgeted schema (see src/utils/schema_prompt.py)."""
+        return get_compact_schema(db_path=db_path, token_budget=token_budget)
+
     @staticmethod
     def get_dataset_info():
         return """
@@ -236,8 +244,19 @@ class OlistDatasetInfo:
         """
 
     @staticmethod
-    def get_dataset_info2():
-        return """
+    def get_dataset_info2(include_examples: bool = True):
+        """
+        Schema, guidelines and three example question/SQL pairs. Without the
+        examples (include_examples=False) relevant ones can be retrieved per
+        question instead (see structuredOutput/fewShotLearning.py).
+        """
+        info = OlistDatasetInfo._DATASET_INFO2
+        if include_examples:
+            return info
+        schema, _, examples = info.partition("## Example Questions and Answers")
+        return schema + examples[examples.index("The expected answer format"):]
+
+    _DATASET_INFO2 = """
         # LLM SQL Query Generation Prompt
 
 You are an expert in converting natural language questions to SQL queries for an e-commerce database. Given a question about the Olist database, your task is to write a correct SQL query that will provide the answer.
@@ -0,0 +1,291 @@
+"""
+Query expansion: question terms -> exact database literals, before prompting.
+
+    expansion = expand_question("Average review score of health and beauty products sold in Rio de Janeiro?")
+    expansion.hint()
+    # Database values: "health and beauty" = category 'beleza_saude' (products.product_category_name);
+    # "Rio de Janeiro" = city 'rio de janeiro' (customer_city, seller_city), state 'RJ' (customer_state, seller_state)
+    expansion.rewritten     # the question with those literals inlined
+
+Once per DB fingerprint an in-memory index is built from
+product_category_name_translation (English and Portuguese category names),
+the customer/seller cities and states, and the Brazilian state names:
+
+- a trie over the normalised words of every phrase (lower case, accents
+  stripped, plural "s" dropped, "and"/"de"/... ignored), scanned greedily for
+  the longest match at each word of the question
+- a deletion table (edit distance 1) for the words of category and state
+  names, so "helth and beuty" still matches
+
+City and state names only match when capitalised in the question and state
+codes only in upper case ("SP"), so ordinary English words are left alone.
+An expansion takes microseconds and needs no LLM call; expansion_stats
+counts how often it finds something.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+
+from src.utils.db_pool import get_pool
+
+BRAZILIAN_STATES = {
+    "AC": "Acre", "AL": "Alagoas", "AP": "Amapa", "AM": "Amazonas", "BA": "Bahia", "CE": "Ceara",
+    "DF": "Distrito Federal", "ES": "Espirito Santo", "GO": "Goias", "MA": "Maranhao", "MT": "Mato Grosso",
+    "MS": "Mato Grosso do Sul", "MG": "Minas Gerais", "PA": "Para", "PB": "Paraiba", "PR": "Parana",
+    "PE": "Pernambuco", "PI": "Piaui", "RJ": "Rio de Janeiro", "RN": "Rio Grande do Norte",
+    "RS": "Rio Grande do Sul", "RO": "Rondonia", "RR": "Roraima", "SC": "Santa Catarina", "SP": "Sao Paulo",
+    "SE": "Sergipe", "TO": "Tocantins",
+}
+
+# Ignored on both sides, so "health and beauty" matches health_beauty and "rio de janeiro" matches "Rio Janeiro"
+_FILLER_WORDS = {"and", "e", "of", "the", "de", "do", "da", "dos", "das"}
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_FUZZY_MIN_LENGTH = 5
+_END = ""                           # trie key holding the literals of a complete phrase
+
+
+@dataclass(frozen=True)
+class Literal:
+    """A database value a phrase stands for."""
+    kind: str                       # category, city, state
+    value: str
+    columns: tuple
+
+    def describe(self) -> str:
+        return f"{self.kind} '{self.value}' ({', '.join(self.columns)})"
+
+
+@dataclass
+class Match:
+    text: str                       # the phrase as written in the question
+    start: int
+    end: int
+    literals: tuple
+    fuzzy: bool = False
+
+
+@dataclass
+class Expansion:
+    question: str
+    matches: list
+    elapsed: float = 0.0
+
+    @property
+    def fired(self) -> bool:
+        return bool(self.matches)
+
+    def hint(self) -> str:
+        """One line mapping question phrases to literals; "" when nothing matched."""
+        if not self.matches:
+            return ""
+        parts = [f"\"{m.text}\" = {', '.join(lit.describe() for lit in m.literals)}" for m in self.matches]
+        return "Database values: " + "; ".join(parts)
+
+    @property
+    def rewritten(self) -> str:
+        """The question with each matched phrase followed by its literals."""
+        text = self.question
+        for m in sorted(self.matches, key=lambda m: m.start, reverse=True):
+            literals = " or ".join(f"{lit.columns[0].split('.')[-1]} = '{lit.value}'" for lit in m.literals)
+            text = f"{text[:m.end]} [{literals}]{text[m.end:]}"
+        return text
+
+
+def _fold(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def _phrase_words(text: str) -> list:
+    words = (w.lower() for w in _WORD.findall(_fold(text).replace("_", " ")))
+    return [_stem(w) for w in words if w not in _FILLER_WORDS]
+
+
+def _deletes(word: str) -> set:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+# === Index ===
+class ExpansionIndex:
+    """Phrase trie plus an edit-distance-1 table for the fuzzy-matchable words."""
+
+    def __init__(self):
+        self.trie = {}
+        self.vocabulary = set()
+        self.fuzzy = {}             # word or one of its deletions -> vocabulary words
+        self.codes = {}             # upper-case state code -> Literal
+        self.phrases = 0
+
+    def add(self, phrase: str, literal: Literal, fuzzy: bool = False):
+        words = _phrase_words(phrase)
+        if not words:
+            return
+        node = self.trie
+        for word in words:
+            node = node.setdefault(word, {})
+            self.vocabulary.add(word)
+            if fuzzy and len(word) >= _FUZZY_MIN_LENGTH:
+                for key in _deletes(word) | {word}:
+                    self.fuzzy.setdefault(key, set()).add(word)
+        literals = node.setdefault(_END, [])
+        if literal not in literals:
+            literals.append(literal)
+            self.phrases += 1
+
+    def correct(self, word: str):
+        """The vocabulary word within edit distance 1 of ``word``; None when there is none or several."""
+        if word in self.vocabulary or len(word) < _FUZZY_MIN_LENGTH:
+            return None
+        candidates = set()
+        for key in _deletes(word) | {word}:
+            candidates |= self.fuzzy.get(key, set())
+        candidates = {c for c in candidates if _edit_distance_one(word, c)}
+        return candidates.pop() if len(candidates) == 1 else None
+
+    def expand(self, question: str) -> Expansion:
+        started = time.perf_counter()
+        # Folded one character at a time so offsets still point into ``question``
+        folded = "".join(_fold(char)[:1] or char for char in question)
+        # (normalised word, original word, start, end), filler words dropped
+        tokens = [(_stem(m.group().lower()), m.group(), m.start(), m.end()) for m in _WORD.finditer(folded)
+                  if m.group().lower() not in _FILLER_WORDS]
+        matches, i = [], 0
+        while i < len(tokens):
+            _, original, start, end = tokens[i]
+            code = self.codes.get(original) if len(original) == 2 and original.isupper() else None
+            found = (Match(original, start, end, (code,)), i + 1) if code else self._longest_match(tokens, i, question)
+            if found is None:
+                i += 1
+                continue
+            match, i = found
+            matches.append(match)
+        return Expansion(question, matches, time.perf_counter() - started)
+
+    def _longest_match(self, tokens: list, i: int, question: str):
+        node, best, fuzzy = self.trie, None, False
+        for j in range(i, len(tokens)):
+            word = tokens[j][0]
+            if word not in node:
+                corrected = self.correct(word)
+                if corrected is None or corrected not in node:
+                    break
+                word, fuzzy = corrected, True
+            node = node[word]
+            if _END in node:
+                best = (j, list(node[_END]), fuzzy)
+        if best is None:
+            return None
+        j, literals, fuzzy = best
+        start, end = tokens[i][2], tokens[j][3]
+        # Place names must be capitalised, so "natal" or "franca" in a sentence stay words
+        if not tokens[i][1][0].isupper():
+            literals = [lit for lit in literals if lit.kind == "category"]
+        # Literals the question already spells out exactly need no hint
+        literals = [lit for lit in literals if lit.value not in question]
+        if not literals:
+            return None
+        return Match(question[start:end], start, end, tuple(literals), fuzzy), j + 1
+
+
+def _edit_distance_one(a: str, b: str) -> bool:
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [k for k in range(len(a)) if a[k] != b[k]]
+        return len(diffs) == 1 or (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                                   and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    return any(longer[:k] + longer[k + 1:] == shorter for k in range(len(longer)))
+
+
+def _distinct(conn, sql: str) -> list:
+    try:
+        return conn.execute(sql).fetchall()
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Query expansion skipped a source ({e})")
+        return []
+
+
+def build_index(db_path: str = None) -> ExpansionIndex:
+    index = ExpansionIndex()
+    category = ("products.product_category_name",)
+    with get_pool(db_path).connection() as conn:
+        for portuguese, english in _distinct(conn, "SELECT product_category_name, product_category_name_english "
+                                                   "FROM product_category_name_translation"):
+            if portuguese:
+                literal = Literal("category", portuguese, category)
+                index.add(portuguese, literal, fuzzy=True)
+                if english:
+                    index.add(english, literal, fuzzy=True)
+        places = {}
+        for prefix in ("customer", "seller"):
+            for city, state in _distinct(conn, f"SELECT DISTINCT {prefix}_city, {prefix}_state FROM {prefix}s"):
+                if city:
+                    places.setdefault(("city", city), set()).add(f"{prefix}_city")
+                if state:
+                    places.setdefault(("state", state), set()).add(f"{prefix}_state")
+    for (kind, value), columns in sorted(places.items()):
+        literal = Literal(kind, value, tuple(sorted(columns)))
+        if kind == "city":
+            index.add(value, literal)
+        else:
+            index.codes[value.upper()] = literal
+            if value.upper() in BRAZILIAN_STATES:
+                index.add(BRAZILIAN_STATES[value.upper()], literal, fuzzy=True)
+    logging.info(f"Query expansion index: {index.phrases} phrases, {len(index.codes)} state codes")
+    return index
+
+
+# === Cached entry points ===
+@dataclass
+class ExpansionStats:
+    questions: int = 0
+    fired: int = 0
+    literals: int = 0
+    fuzzy: int = 0
+    seconds: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, expansion: Expansion):
+        with self.lock:
+            self.questions += 1
+            self.fired += expansion.fired
+            self.literals += sum(len(m.literals) for m in expansion.matches)
+            self.fuzzy += sum(m.fuzzy for m in expansion.matches)
+            self.seconds += expansion.elapsed
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {"questions": self.questions, "fired": self.fired,
+                    "fire_rate": round(self.fired / self.questions, 4) if self.questions else 0.0,
+                    "literals": self.literals, "fuzzy_matches": self.fuzzy,
+                    "mean_us": round(self.seconds / self.questions * 1e6, 1) if self.questions else 0.0}
+
+
+expansion_stats = ExpansionStats()
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_expansion_index(db_path: str = None) -> ExpansionIndex:
+    """ExpansionIndex for ``db_path``, rebuilt only when the DB fingerprint changes."""
+    fingerprint = get_pool(db_path).fingerprint()
+    with _lock:
+        if fingerprint in _indexes:
+            return _indexes[fingerprint]
+    index = build_index(db_path)
+    with _lock:
+        return _indexes.setdefault(fingerprint, index)
+
+
+def expand_question(question: str, db_path: str = None) -> Expansion:
+    expansion = get_expansion_index(db_path).expand(question)
+    expansion_stats.record(expansion)
+    return expansion
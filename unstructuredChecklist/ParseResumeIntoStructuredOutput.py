@@ -1,20 +1,12 @@
-import os
-
-from openai import AzureOpenAI
 from unstructuredChecklist.ResumeChecklist import ResumeChecklist
+from src.utils.azure_client import deployment_for, get_client
 import json
 
-endpoint = os.getenv("DH_ENDPOINT")
 model_name = "gpt-4o"
-deployment = "gpt-4o"
-api_version = "2024-12-01-preview"
-
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=os.getenv("DH_API_KEY")
-)
+deployment = deployment_for("dh")
+
+# Shared Azure OpenAI client (DH_ENDPOINT / DH_API_KEY)
+client = get_client("dh")
 
 resume_text = """
 Jane Doe is a seasoned software engineer with 5 years of experience in full-stack development.